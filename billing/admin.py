@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import SubscriptionPlan, UserSubscription, CreditUsage, BillingHistory
+from .models import (
+    SubscriptionPlan, UserSubscription, CreditUsage, CreditReservation, CreditRollover, BillingHistory,
+    ProcessedStripeEvent
+)
+from .ledger import refund_reservation
+from .webhooks import requeue_events
 
 
 @admin.register(SubscriptionPlan)
@@ -94,6 +99,40 @@ class CreditUsageAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(CreditReservation)
+class CreditReservationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'amount', 'status', 'description', 'created_at', 'settled_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__email', 'user__username', 'description')
+    ordering = ('-created_at',)
+    actions = ['refund_reservations']
+    
+    # Balances only change through the ledger, so reservations are read-only here
+    readonly_fields = ('id', 'user', 'subscription', 'amount', 'description', 'status',
+                       'billing_period_start', 'billing_period_end', 'created_at', 'settled_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def refund_reservations(self, request, queryset):
+        refunded = sum(refund_reservation(reservation) for reservation in queryset.filter(status='held'))
+        self.message_user(request, f"Refunded {refunded} held reservation(s).")
+    refund_reservations.short_description = "Refund selected held reservations"
+
+
+@admin.register(CreditRollover)
+class CreditRolloverAdmin(admin.ModelAdmin):
+    list_display = ('user', 'subscription_plan', 'credits_used', 'credits_allowance', 'period_start', 'period_end')
+    list_filter = ('subscription_plan__name', 'period_end')
+    search_fields = ('user__email', 'user__username')
+    ordering = ('-period_end',)
+    readonly_fields = ('id', 'user', 'subscription', 'subscription_plan', 'credits_used', 'credits_allowance',
+                       'period_start', 'period_end', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(BillingHistory)
 class BillingHistoryAdmin(admin.ModelAdmin):
     list_display = ('user', 'amount_paid', 'currency', 'status', 'billing_reason', 'created_at')
@@ -113,3 +152,22 @@ class BillingHistoryAdmin(admin.ModelAdmin):
             'fields': ('created_at',)
         }),
     )
+
+
+@admin.register(ProcessedStripeEvent)
+class ProcessedStripeEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'status', 'attempts', 'customer_id', 'stripe_created', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('id', 'customer_id')
+    ordering = ('-stripe_created',)
+    actions = ['requeue']
+    readonly_fields = ('id', 'event_type', 'customer_id', 'payload', 'status', 'attempts', 'last_error',
+                       'next_attempt_at', 'stripe_created', 'received_at', 'started_at', 'processed_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def requeue(self, request, queryset):
+        requeued = requeue_events(queryset)
+        self.message_user(request, f"Requeued {requeued} failed or dead event(s).")
+    requeue.short_description = "Retry selected failed or dead events"
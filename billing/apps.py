@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class BillingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "billing"
+
+    def ready(self):
+        from .balance import invalidate_deleted_subscription, write_through_subscription
+
+        # Cached balances follow every saved subscription (webhooks, resets, admin)
+        subscription_model = self.get_model('UserSubscription')
+        post_save.connect(write_through_subscription, sender=subscription_model,
+                          dispatch_uid='billing_write_through_subscription')
+        post_delete.connect(invalidate_deleted_subscription, sender=subscription_model,
+                            dispatch_uid='billing_invalidate_deleted_subscription')
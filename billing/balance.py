@@ -0,0 +1,163 @@
+"""
+Cached credit balances.
+
+Pages that show a user's remaining credits read them from the cache instead
+of loading the subscription and its plan. Each user has two entries: the
+plan details (limits, status, billing period) and a counter of credits used.
+Both are fetched in one cache round trip.
+
+The ledger adjusts the counter with an atomic ``incr`` once its transaction
+commits, so charges never re-read the row. Saving a subscription (Stripe
+webhooks, credit resets, the admin) rewrites the plan entry and drops the
+counter when credits_used may have changed. Entries also expire after
+CREDIT_BALANCE_CACHE_TTL, which bounds how stale a missed update can leave
+a balance.
+
+Charges and Stripe events are applied in Celery workers, so the cache must be
+shared between processes (CACHE_REDIS_URL). With the default per-process
+memory cache this module caches nothing and balances are read from the
+database on every request.
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .models import UserSubscription
+
+
+PLAN_KEY = 'credits:plan:{user_id}'
+USED_KEY = 'credits:used:{user_id}'
+
+
+@dataclass
+class CreditBalance:
+    """A user's plan limits and credit usage, as shown on pages"""
+    subscribed: bool = False
+    plan_name: str = ''
+    plan_display_name: str = ''
+    credits_per_month: int = 0
+    status: str = ''
+    current_period_end: datetime = None
+    credits_used: int = 0
+
+    @property
+    def credits_remaining(self):
+        if not self.plan_name:
+            return 0
+        return max(0, self.credits_per_month - self.credits_used)
+
+    @property
+    def usage_percentage(self):
+        if not self.credits_per_month:
+            return 0
+        return min(100, (self.credits_used / self.credits_per_month) * 100)
+
+    @property
+    def is_active(self):
+        return self.status == 'active'
+
+
+def _cache():
+    """The balance cache, or None when it is local to this process"""
+    cache = caches[settings.CREDIT_BALANCE_CACHE_ALIAS]
+    # Workers' updates would never reach a web process's own memory
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def _plan_details(subscription: UserSubscription) -> dict:
+    plan = subscription.subscription_plan
+    return {
+        'subscribed': True,
+        'plan_name': plan.name if plan else '',
+        'plan_display_name': plan.display_name if plan else '',
+        'credits_per_month': plan.credits_per_month if plan else 0,
+        'status': subscription.status,
+        'current_period_end': subscription.current_period_end,
+    }
+
+
+def get_balance(user) -> CreditBalance:
+    """The user's cached balance, loaded with one query when it is not cached"""
+    cache = _cache()
+    plan_key, used_key = PLAN_KEY.format(user_id=user.pk), USED_KEY.format(user_id=user.pk)
+    cached = cache.get_many([plan_key, used_key]) if cache is not None else {}
+    if plan_key in cached and used_key in cached:
+        # Refunds are clamped at zero in the database, but not in the counter
+        return CreditBalance(**cached[plan_key], credits_used=max(0, cached[used_key]))
+
+    subscription = UserSubscription.objects.filter(user=user).select_related('subscription_plan').first()
+    if subscription is None:
+        balance = CreditBalance()
+    else:
+        balance = CreditBalance(**_plan_details(subscription), credits_used=subscription.credits_used)
+    if cache is None:
+        return balance
+    details = asdict(balance)
+    cache.set_many({
+        plan_key: {field: value for field, value in details.items() if field != 'credits_used'},
+        used_key: balance.credits_used,
+    }, timeout=settings.CREDIT_BALANCE_CACHE_TTL)
+    return balance
+
+
+def adjust_used(user_id, delta: int):
+    """Add ``delta`` to the cached credits used once the current transaction commits"""
+    cache = _cache()
+    if cache is None:
+        return
+
+    def apply():
+        try:
+            cache.incr(USED_KEY.format(user_id=user_id), delta)
+        except ValueError:
+            # Not cached; the next read loads it from the database
+            pass
+
+    transaction.on_commit(apply)
+
+
+def invalidate_balance(user_id):
+    cache = _cache()
+    if cache is not None:
+        cache.delete_many([PLAN_KEY.format(user_id=user_id), USED_KEY.format(user_id=user_id)])
+
+
+def invalidate_balances(user_ids: list, batch_size: int = 1000):
+    """Drop many users' balances once the current transaction commits (after bulk updates)"""
+    cache = _cache()
+    if cache is None:
+        return
+
+    def apply():
+        for offset in range(0, len(user_ids), batch_size):
+            cache.delete_many([
+                key.format(user_id=user_id)
+                for user_id in user_ids[offset:offset + batch_size] for key in (PLAN_KEY, USED_KEY)
+            ])
+
+    transaction.on_commit(apply)
+
+
+def write_through_subscription(sender, instance, raw=False, update_fields=None, **kwargs):
+    """post_save receiver for UserSubscription: refresh the cached plan details"""
+    cache = _cache()
+    if raw or cache is None:
+        return
+
+    def apply():
+        if update_fields is None or 'credits_used' in update_fields:
+            # The saved value may predate a concurrent charge; reload it on the next read
+            cache.delete(USED_KEY.format(user_id=instance.user_id))
+        cache.set(PLAN_KEY.format(user_id=instance.user_id), _plan_details(instance),
+                  timeout=settings.CREDIT_BALANCE_CACHE_TTL)
+
+    transaction.on_commit(apply)
+
+
+def invalidate_deleted_subscription(sender, instance, **kwargs):
+    """post_delete receiver for UserSubscription"""
+    transaction.on_commit(lambda: invalidate_balance(instance.user_id))
@@ -0,0 +1,278 @@
+"""
+Credit ledger.
+
+Credits are taken with a single conditional UPDATE that only matches while
+the plan allowance still covers them, so concurrent requests from one user
+can never spend more than the allowance, however they interleave. No row is
+read and written back.
+
+Work that takes a while (LLM generations) reserves its credits first:
+
+    reservation = reserve_credits(user, 10, "Law generation")
+    ...
+    commit_reservation(reservation)     # or refund_reservation(reservation)
+
+Committing records the CreditUsage along with the settlement; a reservation
+can be committed for less than it holds, and the rest goes back to the user.
+``credit_hold`` wraps this in a context manager that refunds when the block
+raises. Reservations left held by a crashed worker are refunded by the
+``expire_credit_reservations`` command. Billing periods that have ended are
+rolled over in bulk by ``roll_over_periods``.
+
+Every change to credits_used is also applied to the cached balance (see
+``billing.balance``) once the transaction commits. CreditUsage rows are the
+audit trail, written behind the request by ``billing.usage_buffer``; the
+balance itself is never deferred.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .balance import adjust_used, invalidate_balance, invalidate_balances
+from .models import CreditReservation, CreditRollover, CreditUsage, SubscriptionPlan, UserSubscription
+from .usage_buffer import record_usage
+
+
+# Subscriptions whose billing periods are rolled over when they end
+ROLLOVER_STATUSES = ('active', 'trialing')
+MIN_PERIOD = timedelta(days=1)
+
+
+class InsufficientCredits(Exception):
+    """The user's plan does not cover the credits asked for"""
+
+    def __init__(self, amount):
+        self.amount = amount
+        super().__init__(f"Insufficient credits: {amount} required")
+
+
+def _take(user_id, subscription_id, amount: int) -> bool:
+    """Add ``amount`` to credits_used if the plan allowance covers it; one UPDATE"""
+    allowance = Subquery(
+        SubscriptionPlan.objects.filter(pk=OuterRef('subscription_plan_id')).values('credits_per_month')[:1]
+    )
+    taken = UserSubscription.objects.filter(
+        pk=subscription_id, credits_used__lte=allowance - amount
+    ).update(credits_used=F('credits_used') + amount) == 1
+    if taken:
+        adjust_used(user_id, amount)
+    return taken
+
+
+def _give_back(user_id, subscription_id, amount: int):
+    UserSubscription.objects.filter(pk=subscription_id).update(
+        credits_used=Greatest(F('credits_used') - amount, 0)
+    )
+    adjust_used(user_id, -amount)
+
+
+def _subscription(user):
+    """``(id, period_start, period_end)`` of the user's subscription, or None"""
+    return UserSubscription.objects.filter(user=user).values_list(
+        'id', 'current_period_start', 'current_period_end'
+    ).first()
+
+
+def _record_usage(user_id, subscription_id, amount: int, description: str, period_start, period_end):
+    """Queue the CreditUsage row; it is written once the transaction commits"""
+    now = timezone.now()
+    record_usage(CreditUsage(
+        user_id=user_id,
+        subscription_id=subscription_id,
+        amount=amount,
+        description=description[:255],
+        billing_period_start=period_start or now,
+        billing_period_end=period_end or now
+    ))
+
+
+def reserve_credits(user, amount: int, description: str) -> CreditReservation:
+    """Hold ``amount`` credits for the user, raising InsufficientCredits if they do not have them"""
+    subscription = _subscription(user)
+    if subscription is None:
+        raise InsufficientCredits(amount)
+    subscription_id, period_start, period_end = subscription
+
+    with transaction.atomic():
+        if not _take(user.pk, subscription_id, amount):
+            raise InsufficientCredits(amount)
+        return CreditReservation.objects.create(
+            user=user,
+            subscription_id=subscription_id,
+            amount=amount,
+            description=description[:255],
+            billing_period_start=period_start,
+            billing_period_end=period_end
+        )
+
+
+def _settle(reservation: CreditReservation, status: str) -> bool:
+    """Move a held reservation to ``status``; False if it was already settled"""
+    settled_at = timezone.now()
+    settled = CreditReservation.objects.filter(pk=reservation.pk, status='held').update(
+        status=status, settled_at=settled_at
+    ) == 1
+    if settled:
+        reservation.status = status
+        reservation.settled_at = settled_at
+    return settled
+
+
+def commit_reservation(reservation: CreditReservation, amount: int = None, description: str = None) -> bool:
+    """
+    Charge a held reservation, recording its CreditUsage. With ``amount`` less
+    than was reserved, only that much is charged and the rest is released.
+    Returns False if the reservation had already been settled.
+    """
+    amount = reservation.amount if amount is None else max(0, min(amount, reservation.amount))
+    with transaction.atomic():
+        if not _settle(reservation, 'committed'):
+            return False
+        if amount < reservation.amount:
+            _give_back(reservation.user_id, reservation.subscription_id, reservation.amount - amount)
+        if amount:
+            _record_usage(reservation.user_id, reservation.subscription_id, amount,
+                          description or reservation.description,
+                          reservation.billing_period_start, reservation.billing_period_end)
+    return True
+
+
+def refund_reservation(reservation: CreditReservation) -> bool:
+    """Release a held reservation's credits; False if it had already been settled"""
+    with transaction.atomic():
+        if not _settle(reservation, 'refunded'):
+            return False
+        _give_back(reservation.user_id, reservation.subscription_id, reservation.amount)
+    return True
+
+
+@contextmanager
+def credit_hold(user, amount: int, description: str):
+    """
+    Reserve credits for the duration of a block. The reservation is refunded if
+    the block raises and committed when it ends, unless the block settled it.
+    """
+    reservation = reserve_credits(user, amount, description)
+    try:
+        yield reservation
+    except BaseException:
+        refund_reservation(reservation)
+        raise
+    if reservation.status == 'held':
+        commit_reservation(reservation)
+
+
+def charge_credits(user, amount: int, description: str) -> bool:
+    """Take credits for work that is already done; False if the user does not have them"""
+    subscription = _subscription(user)
+    if subscription is None:
+        return False
+    subscription_id, period_start, period_end = subscription
+
+    # The usage row is written behind the request, so the UPDATE needs no transaction of its own
+    if not _take(user.pk, subscription_id, amount):
+        return False
+    _record_usage(user.pk, subscription_id, amount, description, period_start, period_end)
+    return True
+
+
+def refund_credits(user, amount: int, description: str) -> bool:
+    """Give back credits charged earlier, recorded as negative usage"""
+    subscription = _subscription(user)
+    if subscription is None or amount <= 0:
+        return False
+    subscription_id, period_start, period_end = subscription
+
+    _give_back(user.pk, subscription_id, amount)
+    _record_usage(user.pk, subscription_id, -amount, description, period_start, period_end)
+    return True
+
+
+def reset_for_period(subscription: UserSubscription, period_start) -> bool:
+    """
+    Zero credits_used for the billing period starting at ``period_start``,
+    unless it was already reset for that period (or a later one), and record
+    the closing figures as a CreditRollover. Replayed webhooks therefore never
+    reset a period twice.
+    """
+    due = UserSubscription.objects.filter(pk=subscription.pk).filter(
+        Q(credits_reset_date__isnull=True) | Q(credits_reset_date__lt=period_start)
+    )
+    with transaction.atomic():
+        closing = due.select_for_update(of=('self',)).values_list(
+            'credits_used', 'credits_reset_date', 'subscription_plan_id', 'subscription_plan__credits_per_month'
+        ).first()
+        if closing is None:
+            return False
+        credits_used, previous_reset, plan_id, allowance = closing
+        due.update(credits_used=0, credits_reset_date=period_start, updated_at=timezone.now())
+        CreditRollover.objects.bulk_create([CreditRollover(
+            user_id=subscription.user_id, subscription_id=subscription.pk, subscription_plan_id=plan_id,
+            credits_used=credits_used, credits_allowance=allowance or 0,
+            period_start=previous_reset, period_end=period_start
+        )], ignore_conflicts=True)
+
+    subscription.credits_used = 0
+    subscription.credits_reset_date = period_start
+    transaction.on_commit(lambda: invalidate_balance(subscription.user_id))
+    return True
+
+
+def roll_over_periods(now=None, dry_run: bool = False) -> Counter:
+    """
+    Start the next billing period of every active subscription whose period
+    has ended. One UPDATE resets them all and moves each period on by its own
+    length; the closing figures are written as CreditRollover rows with
+    bulk_create. Returns the number of subscriptions rolled over per plan.
+
+    The next period starts where the last one ended, which is also where
+    Stripe starts it, so the renewal webhook that follows finds the period
+    already reset and leaves it alone.
+    """
+    due = UserSubscription.objects.filter(
+        status__in=ROLLOVER_STATUSES, current_period_start__isnull=False, current_period_end__lte=now or timezone.now(),
+        # Anything shorter is not a real billing period and would roll over on every run
+        current_period_end__gte=F('current_period_start') + MIN_PERIOD
+    )
+    with transaction.atomic():
+        closing = list(due.select_for_update(of=('self',)).values_list(
+            'id', 'user_id', 'subscription_plan_id', 'subscription_plan__name',
+            'subscription_plan__credits_per_month', 'credits_used', 'current_period_start', 'current_period_end'
+        ))
+        counts = Counter(row[3] or 'no plan' for row in closing)
+        if dry_run or not closing:
+            return counts
+
+        # Every right-hand side sees the row as it was before the UPDATE
+        length = ExpressionWrapper(F('current_period_end') - F('current_period_start'), output_field=DurationField())
+        due.update(
+            credits_used=0,
+            credits_reset_date=F('current_period_end'),
+            current_period_start=F('current_period_end'),
+            current_period_end=ExpressionWrapper(F('current_period_end') + length, output_field=DateTimeField()),
+            updated_at=timezone.now()
+        )
+        CreditRollover.objects.bulk_create([
+            CreditRollover(
+                subscription_id=subscription_id, user_id=user_id, subscription_plan_id=plan_id,
+                credits_used=credits_used, credits_allowance=allowance or 0,
+                period_start=period_start, period_end=period_end
+            )
+            for subscription_id, user_id, plan_id, plan_name, allowance, credits_used, period_start, period_end in closing
+        ], batch_size=1000, ignore_conflicts=True)
+
+    invalidate_balances([row[1] for row in closing])
+    return counts
+
+
+def expire_reservations(older_than: timedelta = None) -> int:
+    """Refund reservations held longer than CREDIT_RESERVATION_TTL_SECONDS; returns how many"""
+    older_than = older_than or timedelta(seconds=settings.CREDIT_RESERVATION_TTL_SECONDS)
+    stale = CreditReservation.objects.filter(status='held', created_at__lt=timezone.now() - older_than)
+    return sum(refund_reservation(reservation) for reservation in stale.iterator())
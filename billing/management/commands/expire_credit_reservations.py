@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from billing.ledger import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Refund credit reservations left held by generations that never finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Age in seconds (default: CREDIT_RESERVATION_TTL_SECONDS)')
+
+    def handle(self, *args, **options):
+        older_than = options['older_than']
+        refunded = expire_reservations(timedelta(seconds=older_than) if older_than is not None else None)
+
+        self.stdout.write(self.style.SUCCESS(f'Refunded {refunded} expired reservation(s)'))
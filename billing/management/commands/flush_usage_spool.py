@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from billing.usage_buffer import replay_spool
+
+
+class Command(BaseCommand):
+    help = 'Write audit rows left in the usage spool by processes that stopped before flushing'
+
+    def handle(self, *args, **options):
+        written = replay_spool(settings.USAGE_SPOOL_DIR)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} spooled usage row(s)'))
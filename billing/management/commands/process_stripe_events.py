@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from billing.models import ProcessedStripeEvent
+from billing.webhooks import process_pending_events, requeue_events
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Stripe webhook events that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Send dead letter events back to the queue first')
+        parser.add_argument('--limit', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            requeued = requeue_events(ProcessedStripeEvent.objects.filter(status='dead'))
+            self.stdout.write(f'Requeued {requeued} dead event(s)')
+        attempted = process_pending_events(options['limit'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {attempted} event(s)'))
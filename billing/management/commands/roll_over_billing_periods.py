@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from billing.ledger import roll_over_periods
+
+
+class Command(BaseCommand):
+    help = 'Reset credits and start the next period for every subscription whose billing period has ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be rolled over without changing anything')
+
+    def handle(self, *args, **options):
+        counts = roll_over_periods(dry_run=options['dry_run'])
+
+        for plan, count in sorted(counts.items()):
+            self.stdout.write(f'  {plan}: {count}')
+        verb = 'Would roll over' if options['dry_run'] else 'Rolled over'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sum(counts.values())} subscription(s)'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:37
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditReservation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('amount', models.IntegerField()),
+                ('description', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('held', 'Held'), ('committed', 'Committed'), ('refunded', 'Refunded')], default='held', max_length=20)),
+                ('billing_period_start', models.DateTimeField(blank=True, null=True)),
+                ('billing_period_end', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='billing.usersubscription')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='billing_cre_status_a3ffd8_idx')],
+            },
+        ),
+    ]
@@ -85,23 +85,23 @@ class UserSubscription(models.Model):
         """Reset credits for new billing cycle"""
         self.credits_used = 0
         self.credits_reset_date = timezone.now()
-        self.save()
+        self.save(update_fields=['credits_used', 'credits_reset_date', 'updated_at'])
     
     def use_credits(self, amount, description="Credit usage"):
         """Use credits and track usage"""
-        if self.credits_remaining >= amount:
-            self.credits_used += amount
-            self.save()
-            
-            # Create usage record
-            CreditUsage.objects.create(
-                user=self.user,
-                subscription=self,
-                amount=amount,
-                description=description,
-                billing_period_start=self.current_period_start,
-                billing_period_end=self.current_period_end
-            )
+        from .ledger import charge_credits
+        
+        if charge_credits(self.user, amount, description):
+            self.refresh_from_db(fields=['credits_used'])
+            return True
+        return False
+    
+    def refund_credits(self, amount, description="Credit refund"):
+        """Return previously used credits and track the refund"""
+        from .ledger import refund_credits
+        
+        if refund_credits(self.user, amount, description):
+            self.refresh_from_db(fields=['credits_used'])
             return True
         return False
 
@@ -115,7 +115,8 @@ class CreditUsage(models.Model):
     description = models.CharField(max_length=255)
     billing_period_start = models.DateTimeField()
     billing_period_end = models.DateTimeField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered row is written
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
@@ -124,6 +125,69 @@ class CreditUsage(models.Model):
         return f"{self.user.email} - {self.amount} credits - {self.description}"
 
 
+class CreditReservation(models.Model):
+    """
+    Credits held for work that has not finished yet. They count as used from
+    the moment they are reserved, and become a CreditUsage record when the
+    reservation is committed or go back to the user when it is refunded.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('refunded', 'Refunded'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_reservations')
+    subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, related_name='reservations')
+    amount = models.IntegerField()
+    description = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    
+    # Billing period the credits were taken from
+    billing_period_start = models.DateTimeField(null=True, blank=True)
+    billing_period_end = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Sweeping reservations left behind by crashed workers
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.amount} credits {self.status} - {self.description}"
+
+
+class CreditRollover(models.Model):
+    """Closing figures of a billing period, recorded when its credits are reset"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_rollovers')
+    subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, related_name='rollovers')
+    subscription_plan = models.ForeignKey(SubscriptionPlan, on_delete=models.SET_NULL, null=True, blank=True)
+    credits_used = models.IntegerField(help_text="Credits used in the closed period")
+    credits_allowance = models.IntegerField()
+    
+    # The period that was closed
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # A period is closed once, however many jobs or webhooks try
+            models.UniqueConstraint(fields=['subscription', 'period_end'], name='unique_rollover_per_period'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.credits_used}/{self.credits_allowance} credits - period ending {self.period_end:%Y-%m-%d}"
+
+
 class BillingHistory(models.Model):
     """Tracks billing events and invoice history"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='billing_history')
@@ -140,3 +204,45 @@ class BillingHistory(models.Model):
     
     def __str__(self):
         return f"{self.user.email} - ${self.amount_paid} - {self.status}"
+
+
+class ProcessedStripeEvent(models.Model):
+    """
+    A Stripe webhook event, stored when it arrives and applied by a worker.
+    The Stripe event id is the primary key, so redelivered events are dropped.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed (will retry)'),
+        ('dead', 'Dead Letter'),
+    ]
+    
+    id = models.CharField(max_length=255, primary_key=True)
+    event_type = models.CharField(max_length=100)
+    customer_id = models.CharField(max_length=100, blank=True, help_text="Stripe customer the event concerns")
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Retries
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    # Timestamps
+    stripe_created = models.DateTimeField(help_text="When Stripe created the event; events are applied in this order")
+    received_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['stripe_created', 'received_at']
+        indexes = [
+            # The worker's queue scan
+            models.Index(fields=['status', 'stripe_created']),
+        ]
+    
+    def __str__(self):
+        return f"{self.id} - {self.event_type} ({self.status})"
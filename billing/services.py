@@ -5,7 +5,9 @@ import stripe
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
+from datetime import timezone as dt_timezone
 from .models import UserSubscription, SubscriptionPlan, BillingHistory
+from .ledger import reset_for_period
 import logfire
 
 # Configure Stripe
@@ -63,7 +65,7 @@ class StripeService:
             # Create new customer and update the subscription
             customer = StripeService.create_customer(user)
             subscription.stripe_customer_id = customer.id
-            subscription.save()
+            subscription.save(update_fields=['stripe_customer_id', 'updated_at'])
             
             logfire.info("Updated UserSubscription with new Stripe customer", 
                         user_email=user.email,
@@ -166,12 +168,16 @@ class StripeService:
             user_subscription.subscription_plan = subscription_plan
             user_subscription.status = subscription_data['status']
             user_subscription.current_period_start = timezone.datetime.fromtimestamp(
-                subscription_data['current_period_start'], tz=timezone.utc
+                subscription_data['current_period_start'], tz=dt_timezone.utc
             )
             user_subscription.current_period_end = timezone.datetime.fromtimestamp(
-                subscription_data['current_period_end'], tz=timezone.utc
+                subscription_data['current_period_end'], tz=dt_timezone.utc
             )
-            user_subscription.save()
+            # credits_used is only ever changed by the ledger's conditional updates
+            user_subscription.save(update_fields=[
+                'stripe_subscription_id', 'subscription_plan', 'status',
+                'current_period_start', 'current_period_end', 'updated_at'
+            ])
             
             logfire.info("Subscription created successfully", 
                         user_email=user_subscription.user.email,
@@ -200,21 +206,18 @@ class StripeService:
             old_status = user_subscription.status
             user_subscription.status = subscription_data['status']
             user_subscription.current_period_start = timezone.datetime.fromtimestamp(
-                subscription_data['current_period_start'], tz=timezone.utc
+                subscription_data['current_period_start'], tz=dt_timezone.utc
             )
             user_subscription.current_period_end = timezone.datetime.fromtimestamp(
-                subscription_data['current_period_end'], tz=timezone.utc
+                subscription_data['current_period_end'], tz=dt_timezone.utc
             )
             
-            # Reset credits if new billing period
-            if (user_subscription.credits_reset_date is None or 
-                user_subscription.current_period_start > user_subscription.credits_reset_date):
-                user_subscription.reset_credits()
-                
+            # Reset credits if new billing period (at most once per period)
+            if reset_for_period(user_subscription, user_subscription.current_period_start):
                 logfire.info("Credits reset for new billing period", 
                            user_email=user_subscription.user.email)
             
-            user_subscription.save()
+            user_subscription.save(update_fields=['status', 'current_period_start', 'current_period_end', 'updated_at'])
             
             logfire.info("Subscription updated successfully", 
                         user_email=user_subscription.user.email,
@@ -241,15 +244,17 @@ class StripeService:
                 stripe_customer_id=customer_id
             )
             
-            # Create billing history record
-            BillingHistory.objects.create(
-                user=user_subscription.user,
+            # Create billing history record (or refresh it if this invoice was seen before)
+            BillingHistory.objects.update_or_create(
                 stripe_invoice_id=invoice_data['id'],
-                amount_paid=invoice_data['amount_paid'] / 100,  # Convert from cents
-                currency=invoice_data['currency'],
-                status=invoice_data['status'],
-                billing_reason=invoice_data.get('billing_reason'),
-                invoice_url=invoice_data.get('hosted_invoice_url')
+                defaults={
+                    'user': user_subscription.user,
+                    'amount_paid': invoice_data['amount_paid'] / 100,  # Convert from cents
+                    'currency': invoice_data['currency'],
+                    'status': invoice_data['status'],
+                    'billing_reason': invoice_data.get('billing_reason'),
+                    'invoice_url': invoice_data.get('hosted_invoice_url')
+                }
             )
             
             logfire.info("Invoice payment recorded", 
@@ -0,0 +1,22 @@
+from celery import shared_task
+
+from .ledger import expire_reservations, roll_over_periods
+from .webhooks import process_pending_events
+
+
+@shared_task(ignore_result=True)
+def expire_credit_reservations():
+    """Periodic (beat) entry point that refunds credits held by abandoned generations"""
+    expire_reservations()
+
+
+@shared_task(ignore_result=True)
+def process_stripe_events():
+    """Apply stored Stripe webhook events; queued by the webhook and run by beat for retries"""
+    process_pending_events()
+
+
+@shared_task(ignore_result=True)
+def roll_over_billing_periods():
+    """Periodic (beat) entry point that resets credits of subscriptions whose period has ended"""
+    roll_over_periods()
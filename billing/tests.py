@@ -1,3 +1,335 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import webhooks
+from .ledger import (
+    InsufficientCredits, commit_reservation, expire_reservations, refund_reservation, reserve_credits,
+    reset_for_period, roll_over_periods
+)
+from .models import CreditReservation, CreditRollover, ProcessedStripeEvent, SubscriptionPlan, UserSubscription
+
+
+def create_subscriber(username, plan, credits_used=0, **fields):
+    """A user with a subscription to ``plan``"""
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+    UserSubscription.objects.create(
+        user=user, stripe_customer_id=f'cus_{username}', subscription_plan=plan,
+        status=fields.pop('status', 'active'), credits_used=credits_used, **fields
+    )
+    return user
+
+
+class BillingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(
+            name='starter', display_name='Starter', stripe_price_id='price_starter',
+            monthly_price='9.00', credits_per_month=100
+        )
+
+    def credits_used(self, user):
+        return UserSubscription.objects.get(user=user).credits_used
+
+
+class CreditReservationTests(BillingTestCase):
+    def test_reserve_exactly_the_allowance(self):
+        user = create_subscriber('alice', self.plan, credits_used=90)
+
+        reservation = reserve_credits(user, 10, 'Law generation')
+
+        self.assertEqual(reservation.status, 'held')
+        self.assertEqual(self.credits_used(user), 100)
+
+    def test_reserve_one_over_the_allowance(self):
+        user = create_subscriber('alice', self.plan, credits_used=90)
+
+        with self.assertRaises(InsufficientCredits):
+            reserve_credits(user, 11, 'Law generation')
+
+        self.assertEqual(self.credits_used(user), 90)
+        self.assertFalse(CreditReservation.objects.filter(user=user).exists())
+
+    def test_reserve_without_subscription(self):
+        user = User.objects.create_user(username='bob', password='password')
+
+        with self.assertRaises(InsufficientCredits):
+            reserve_credits(user, 1, 'Law generation')
+
+    def test_commit_for_less_than_reserved(self):
+        user = create_subscriber('alice', self.plan)
+        reservation = reserve_credits(user, 30, 'Batch generation')
+
+        self.assertTrue(commit_reservation(reservation, amount=10))
+
+        self.assertEqual(self.credits_used(user), 10)
+        self.assertEqual(CreditReservation.objects.get(pk=reservation.pk).status, 'committed')
+
+    def test_commit_for_more_than_reserved_charges_the_reservation(self):
+        user = create_subscriber('alice', self.plan)
+        reservation = reserve_credits(user, 10, 'Law generation')
+
+        commit_reservation(reservation, amount=50)
+
+        self.assertEqual(self.credits_used(user), 10)
+
+    def test_double_commit_is_a_noop(self):
+        user = create_subscriber('alice', self.plan)
+        reservation = reserve_credits(user, 30, 'Batch generation')
+        commit_reservation(reservation, amount=10)
+
+        self.assertFalse(commit_reservation(reservation))
+        self.assertFalse(refund_reservation(reservation))
+        self.assertEqual(self.credits_used(user), 10)
+
+    def test_double_refund_is_a_noop(self):
+        user = create_subscriber('alice', self.plan, credits_used=5)
+        reservation = reserve_credits(user, 10, 'Law generation')
+
+        self.assertTrue(refund_reservation(reservation))
+        self.assertFalse(refund_reservation(reservation))
+        self.assertFalse(commit_reservation(reservation))
+
+        self.assertEqual(self.credits_used(user), 5)
+        self.assertEqual(CreditReservation.objects.get(pk=reservation.pk).status, 'refunded')
+
+    def test_settling_a_stale_copy_is_a_noop(self):
+        user = create_subscriber('alice', self.plan)
+        reservation = reserve_credits(user, 10, 'Law generation')
+        stale_copy = CreditReservation.objects.get(pk=reservation.pk)
+        refund_reservation(reservation)
+
+        self.assertFalse(refund_reservation(stale_copy))
+        self.assertEqual(self.credits_used(user), 0)
+
+    def test_expire_stale_holds(self):
+        user = create_subscriber('alice', self.plan)
+        stale = reserve_credits(user, 10, 'Crashed worker')
+        fresh = reserve_credits(user, 20, 'Still running')
+        settled = reserve_credits(user, 5, 'Done')
+        commit_reservation(settled)
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        CreditReservation.objects.filter(pk__in=[stale.pk, settled.pk]).update(created_at=an_hour_ago)
+
+        self.assertEqual(expire_reservations(older_than=timedelta(minutes=10)), 1)
+
+        statuses = dict(CreditReservation.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[stale.pk], 'refunded')
+        self.assertEqual(statuses[fresh.pk], 'held')
+        self.assertEqual(statuses[settled.pk], 'committed')
+        self.assertEqual(self.credits_used(user), 25)
+        self.assertEqual(expire_reservations(older_than=timedelta(minutes=10)), 0)
+
+
+def stripe_payload(event_id, event_type='invoice.payment_succeeded', customer='cus_alice', created=1700000000):
+    return json.dumps({
+        'id': event_id,
+        'type': event_type,
+        'created': created,
+        'data': {'object': {'id': f'obj_{event_id}', 'customer': customer}},
+    }).encode()
+
+
+@override_settings(STRIPE_EVENT_RETRY_SECONDS=30, STRIPE_EVENT_MAX_ATTEMPTS=3)
+class StripeEventQueueTests(TestCase):
+    def setUp(self):
+        self.handler = mock.Mock()
+        patcher = mock.patch.dict(webhooks.HANDLERS, {'invoice.payment_succeeded': self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def event(self, event_id):
+        return ProcessedStripeEvent.objects.get(pk=event_id)
+
+    def make_due(self, event_id):
+        ProcessedStripeEvent.objects.filter(pk=event_id).update(next_attempt_at=timezone.now())
+
+    def test_redelivered_event_is_stored_once(self):
+        self.assertTrue(webhooks.store_event(stripe_payload('evt_1')))
+        self.assertTrue(webhooks.store_event(stripe_payload('evt_1')))
+
+        self.assertEqual(ProcessedStripeEvent.objects.count(), 1)
+
+    def test_unhandled_event_is_ignored(self):
+        self.assertFalse(webhooks.store_event(stripe_payload('evt_1', event_type='customer.created')))
+
+        self.assertEqual(self.event('evt_1').status, 'ignored')
+        self.assertEqual(webhooks.process_pending_events(), 0)
+
+    def test_event_is_applied_once(self):
+        webhooks.store_event(stripe_payload('evt_1'))
+
+        self.assertEqual(webhooks.process_pending_events(), 1)
+        self.assertEqual(webhooks.process_pending_events(), 0)
+
+        self.handler.assert_called_once_with({'id': 'obj_evt_1', 'customer': 'cus_alice'})
+        self.assertEqual(self.event('evt_1').status, 'processed')
+
+    def test_failed_event_is_retried_with_backoff(self):
+        self.handler.side_effect = ValueError('stripe is down')
+        webhooks.store_event(stripe_payload('evt_1'))
+
+        before = timezone.now()
+        webhooks.process_pending_events()
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts), ('failed', 1))
+        self.assertEqual(event.last_error, 'ValueError: stripe is down')
+        self.assertGreaterEqual(event.next_attempt_at, before + timedelta(seconds=30))
+
+        # Not due again until the backoff has passed
+        self.assertFalse(webhooks.process_event('evt_1'))
+
+        self.make_due('evt_1')
+        before = timezone.now()
+        webhooks.process_pending_events()
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts), ('failed', 2))
+        self.assertGreaterEqual(event.next_attempt_at, before + timedelta(seconds=60))
+
+        self.handler.side_effect = None
+        self.make_due('evt_1')
+        webhooks.process_pending_events()
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts, event.last_error), ('processed', 3, ''))
+
+    def test_event_goes_to_dead_letter_after_max_attempts(self):
+        self.handler.side_effect = ValueError('bad payload')
+        webhooks.store_event(stripe_payload('evt_1'))
+
+        for _ in range(3):
+            self.make_due('evt_1')
+            webhooks.process_pending_events()
+
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts), ('dead', 3))
+        self.assertIsNone(event.next_attempt_at)
+        self.assertFalse(webhooks.process_event('evt_1'))
+        self.assertEqual(self.handler.call_count, 3)
+
+    def test_requeued_dead_event_gets_fresh_attempts(self):
+        self.handler.side_effect = ValueError('bad payload')
+        webhooks.store_event(stripe_payload('evt_1'))
+        for _ in range(3):
+            self.make_due('evt_1')
+            webhooks.process_pending_events()
+
+        self.assertEqual(webhooks.requeue_events(ProcessedStripeEvent.objects.all()), 1)
+        self.handler.side_effect = None
+        webhooks.process_pending_events()
+
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts), ('processed', 1))
+
+    def test_later_events_wait_behind_a_failed_one(self):
+        self.handler.side_effect = [ValueError('stripe is down'), None, None, None]
+        webhooks.store_event(stripe_payload('evt_1', created=1700000000))
+        webhooks.store_event(stripe_payload('evt_2', created=1700000060))
+        webhooks.store_event(stripe_payload('evt_3', customer='cus_bob', created=1700000120))
+
+        webhooks.process_pending_events()
+
+        self.assertEqual(self.event('evt_1').status, 'failed')
+        self.assertEqual(self.event('evt_2').status, 'pending')
+        self.assertEqual(self.event('evt_3').status, 'processed')
+
+        self.make_due('evt_1')
+        webhooks.process_pending_events()
+
+        self.assertEqual(self.event('evt_1').status, 'processed')
+        self.assertEqual(self.event('evt_2').status, 'processed')
+        self.assertEqual([call.args[0]['id'] for call in self.handler.call_args_list],
+                         ['obj_evt_1', 'obj_evt_3', 'obj_evt_1', 'obj_evt_2'])
+
+    def test_stale_claim_is_taken_over(self):
+        webhooks.store_event(stripe_payload('evt_1'))
+        ProcessedStripeEvent.objects.filter(pk='evt_1').update(
+            status='processing', attempts=1, started_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertTrue(webhooks.process_event('evt_1'))
+
+        event = self.event('evt_1')
+        self.assertEqual((event.status, event.attempts), ('processed', 2))
+
+
+class RollOverPeriodsTests(BillingTestCase):
+    start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+    end = datetime(2026, 1, 31, tzinfo=dt_timezone.utc)
+
+    def subscribe(self, username, **fields):
+        fields.setdefault('current_period_start', self.start)
+        fields.setdefault('current_period_end', self.end)
+        user = create_subscriber(username, fields.pop('plan', self.plan), credits_used=fields.pop('credits_used', 40),
+                                 **fields)
+        return UserSubscription.objects.get(user=user)
+
+    def test_period_moves_on_by_its_own_length(self):
+        monthly = self.subscribe('alice')
+        weekly = self.subscribe('bob', current_period_start=self.end - timedelta(days=7))
+
+        counts = roll_over_periods(now=self.end + timedelta(hours=1))
+
+        self.assertEqual(counts, {'starter': 2})
+        monthly.refresh_from_db()
+        self.assertEqual((monthly.current_period_start, monthly.current_period_end),
+                         (self.end, self.end + timedelta(days=30)))
+        self.assertEqual((monthly.credits_used, monthly.credits_reset_date), (0, self.end))
+        weekly.refresh_from_db()
+        self.assertEqual((weekly.current_period_start, weekly.current_period_end),
+                         (self.end, self.end + timedelta(days=7)))
+
+    def test_closing_figures_are_recorded(self):
+        subscription = self.subscribe('alice', credits_used=75)
+
+        roll_over_periods(now=self.end)
+
+        rollover = CreditRollover.objects.get(subscription=subscription)
+        self.assertEqual((rollover.credits_used, rollover.credits_allowance), (75, 100))
+        self.assertEqual((rollover.period_start, rollover.period_end), (self.start, self.end))
+        self.assertEqual(rollover.subscription_plan, self.plan)
+
+    def test_open_inactive_and_too_short_periods_are_left_alone(self):
+        self.subscribe('open', current_period_end=self.end + timedelta(days=1))
+        self.subscribe('canceled', status='canceled')
+        self.subscribe('short', current_period_start=self.end - timedelta(hours=1))
+
+        self.assertEqual(roll_over_periods(now=self.end + timedelta(hours=1)), {})
+
+        self.assertFalse(UserSubscription.objects.filter(credits_used=0).exists())
+        self.assertFalse(CreditRollover.objects.exists())
+
+    def test_one_period_per_run(self):
+        subscription = self.subscribe('alice')
+        much_later = self.end + timedelta(days=45)
+
+        roll_over_periods(now=much_later)
+        roll_over_periods(now=much_later)
+        self.assertEqual(roll_over_periods(now=much_later), {})
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.current_period_start, self.end + timedelta(days=30))
+        self.assertEqual(subscription.current_period_end, self.end + timedelta(days=60))
+        self.assertEqual(CreditRollover.objects.filter(subscription=subscription).count(), 2)
+
+    def test_dry_run_changes_nothing(self):
+        self.subscribe('alice')
+        self.subscribe('bob', plan=None)
+
+        self.assertEqual(roll_over_periods(now=self.end, dry_run=True), {'starter': 1, 'no plan': 1})
+
+        self.assertFalse(UserSubscription.objects.filter(credits_used=0).exists())
+        self.assertFalse(CreditRollover.objects.exists())
+
+    def test_renewal_webhook_does_not_reset_again(self):
+        subscription = self.subscribe('alice')
+        roll_over_periods(now=self.end)
+        UserSubscription.objects.filter(pk=subscription.pk).update(credits_used=5)
+
+        self.assertFalse(reset_for_period(subscription, self.end))
+
+        self.assertEqual(self.credits_used(subscription.user), 5)
+        self.assertEqual(CreditRollover.objects.count(), 1)
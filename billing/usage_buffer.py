@@ -0,0 +1,223 @@
+"""
+Write-behind buffer for audit rows (CreditUsage, LawSearch).
+
+Balances are always changed synchronously by the ledger; only the rows that
+record what happened are deferred. ``record`` queues a row once the current
+transaction commits, and the buffer writes everything queued with one
+bulk_create per model when USAGE_BUFFER_MAX_EVENTS rows are waiting or the
+oldest has waited USAGE_BUFFER_MAX_SECONDS.
+
+Queued rows are also appended to a spool file in USAGE_SPOOL_DIR, one JSON
+line each, so a crashed process loses nothing: each process holds an
+exclusive lock on its spool segments, and segments whose lock is free belong
+to a dead process. Each process replays those when it first flushes and then
+at most once a minute; the ``flush_usage_spool`` command does it on demand.
+Rows carry their primary key from the start and are inserted with
+``ignore_conflicts``, so replaying a segment that was partly written already
+is harmless.
+
+Each row's timestamp (CreditUsage.timestamp, LawSearch.created_at) is set
+when the row is built, before it is queued, and written as is; a spool
+replayed hours after a crash keeps the times of the events. Normally rows
+land within USAGE_BUFFER_MAX_SECONDS of their timestamp, well inside the
+search rollups' SEARCH_ROLLUP_LAG_SECONDS; rows replayed later than that are
+kept in the log but miss rollup windows already folded.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between looks for segments left behind by dead processes
+REPLAY_INTERVAL = 60
+
+
+def _lock(handle, blocking: bool = True) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+
+def serialize(instance) -> dict:
+    """A model instance as a spool event (JSON-safe values by attname)"""
+    return {
+        'model': instance._meta.label,
+        'fields': {
+            field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+        },
+    }
+
+
+def deserialize(event: dict):
+    model = apps.get_model(event['model'])
+    return model(**{
+        name: model._meta.get_field(name).to_python(value)
+        for name, value in event['fields'].items()
+    })
+
+
+def write_events(events: list):
+    """Insert spool events, one bulk_create per model; already-written rows are skipped"""
+    by_model = {}
+    for event in events:
+        by_model.setdefault(event['model'], []).append(deserialize(event))
+    for label, instances in by_model.items():
+        apps.get_model(label).objects.bulk_create(instances, batch_size=500, ignore_conflicts=True)
+
+
+class UsageBuffer:
+    """Per-process queue of audit rows, spooled to disk until they are written"""
+
+    def __init__(self, spool_dir: str = '', max_events: int = 100, max_seconds: float = 5.0):
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.max_events = max(1, max_events)
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._events = []
+        self._oldest = None
+        self._segment = None
+        self._segment_path = None
+        self._unwritten = []
+        self._timer = None
+        self._replayed_at = None
+        atexit.register(self.flush)
+
+    def record(self, instance):
+        """Queue a row (its timestamp already set) once the current transaction commits"""
+        if instance.pk is None:
+            instance.pk = uuid.uuid4()
+        event = serialize(instance)
+        transaction.on_commit(lambda: self._add(event))
+
+    def _add(self, event: dict):
+        with self._lock:
+            self._spool(event)
+            self._events.append(event)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._start_timer()
+            due = len(self._events) >= self.max_events or time.monotonic() - self._oldest >= self.max_seconds
+        if due:
+            self.flush()
+
+    def _spool(self, event: dict):
+        if self.spool_dir is None:
+            return
+        if self._segment is None:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            name = f'usage-{os.getpid()}-{uuid.uuid4().hex}.jsonl'
+            # Locked before it gets a name replay_spool looks at
+            self._segment = open(self.spool_dir / f'.{name}.tmp', 'a', encoding='utf-8')
+            _lock(self._segment)
+            os.rename(self._segment.name, self.spool_dir / name)
+            self._segment_path = self.spool_dir / name
+        self._segment.write(json.dumps(event, cls=DjangoJSONEncoder) + '\n')
+        # Survives a crash of this process (not of the machine) without an fsync
+        self._segment.flush()
+
+    def _start_timer(self):
+        self._timer = threading.Timer(self.max_seconds, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def flush(self) -> int:
+        """Write everything queued (and any orphaned spool segments); returns rows written"""
+        with self._flush_lock:
+            with self._lock:
+                events = self._events
+                segment = (self._segment, self._segment_path) if self._segment is not None else None
+                self._events, self._segment, self._oldest = [], None, None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+            written = 0
+            now = time.monotonic()
+            if self.spool_dir and (self._replayed_at is None or now - self._replayed_at >= REPLAY_INTERVAL):
+                self._replayed_at = now
+                try:
+                    written += replay_spool(self.spool_dir)
+                except Exception:
+                    logger.exception("Could not replay the usage spool")
+
+            batches, self._unwritten = self._unwritten + ([(events, segment)] if events else []), []
+            for batch_events, batch_segment in batches:
+                try:
+                    write_events(batch_events)
+                except Exception:
+                    # Kept (and its segment still locked) for the next flush
+                    logger.exception("Could not write %s buffered usage row(s)", len(batch_events))
+                    self._unwritten.append((batch_events, batch_segment))
+                    continue
+                written += len(batch_events)
+                if batch_segment is not None:
+                    handle, path = batch_segment
+                    path.unlink(missing_ok=True)
+                    handle.close()
+            return written
+
+
+def replay_spool(spool_dir) -> int:
+    """Write the segments of processes that died before flushing; returns rows written"""
+    written = 0
+    for path in sorted(Path(spool_dir).glob('usage-*.jsonl')):
+        try:
+            handle = open(path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with handle:
+            # Held by a live process, or replayed and removed while we waited
+            if not _lock(handle, blocking=False) or not path.exists():
+                continue
+            events = []
+            for line in handle:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by the crash
+                    logger.warning("Skipping truncated line in usage spool %s", path.name)
+            write_events(events)
+            written += len(events)
+            path.unlink(missing_ok=True)
+    return written
+
+
+usage_buffer = UsageBuffer(
+    spool_dir=settings.USAGE_SPOOL_DIR,
+    max_events=settings.USAGE_BUFFER_MAX_EVENTS,
+    max_seconds=settings.USAGE_BUFFER_MAX_SECONDS,
+)
+
+
+def record_usage(instance):
+    """Queue an audit row (CreditUsage, LawSearch) to be written behind the request"""
+    usage_buffer.record(instance)
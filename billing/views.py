@@ -15,6 +15,8 @@ import logfire
 
 from .models import SubscriptionPlan, UserSubscription, CreditUsage, BillingHistory
 from .services import StripeService
+from .tasks import process_stripe_events
+from .webhooks import store_event
 
 
 class SubscriptionDashboardView(LoginRequiredMixin, TemplateView):
@@ -191,7 +193,10 @@ def cancel_subscription(request):
 
 @csrf_exempt
 def stripe_webhook(request):
-    """Handle Stripe webhooks"""
+    """
+    Handle Stripe webhooks: verify the signature, store the event (one insert;
+    redeliveries are dropped) and acknowledge. A worker applies it.
+    """
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     
@@ -200,22 +205,12 @@ def stripe_webhook(request):
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
         
-        logfire.info("Stripe webhook received", 
-                    event_type=event['type'],
-                    event_id=event['id'])
-        
-        # Handle different event types
-        if event['type'] == 'customer.subscription.created':
-            StripeService.handle_subscription_created(event['data']['object'])
-            
-        elif event['type'] == 'customer.subscription.updated':
-            StripeService.handle_subscription_updated(event['data']['object'])
-            
-        elif event['type'] == 'invoice.payment_succeeded':
-            StripeService.handle_invoice_payment_succeeded(event['data']['object'])
-            
-        else:
-            logfire.info("Unhandled webhook event type", event_type=event['type'])
+        if store_event(payload):
+            try:
+                process_stripe_events.delay()
+            except Exception as e:
+                # Stored already; the periodic sweep picks it up
+                logfire.warning("Could not queue Stripe event processing", error=str(e))
         
         return HttpResponse(status=200)
         
@@ -0,0 +1,126 @@
+"""
+Queued Stripe webhook processing.
+
+The webhook view verifies the signature, stores the event with a single
+``INSERT ... ON CONFLICT DO NOTHING`` keyed by the Stripe event id and
+answers 200 straight away; redelivered events hit the conflict and are
+dropped. A worker then applies stored events in the order Stripe created
+them. Applying an event and marking it processed commit together, so a crash
+in between leaves it to be applied again rather than half-applied.
+
+A failed event is retried with exponential backoff (STRIPE_EVENT_RETRY_SECONDS
+doubling each attempt) and moves to the dead letter state after
+STRIPE_EVENT_MAX_ATTEMPTS. Until then later events for the same customer
+wait behind it, so a subscription is never updated out of order.
+"""
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+import logfire
+
+from .models import ProcessedStripeEvent
+from .services import StripeService
+
+
+HANDLERS = {
+    'customer.subscription.created': StripeService.handle_subscription_created,
+    'customer.subscription.updated': StripeService.handle_subscription_updated,
+    'invoice.payment_succeeded': StripeService.handle_invoice_payment_succeeded,
+}
+
+# Longest wait between two attempts at an event
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+def store_event(payload: bytes) -> bool:
+    """
+    Store a verified webhook payload; one INSERT. Returns whether the event
+    needs the worker (it is of a type we handle).
+    """
+    event = json.loads(payload)
+    handled = event['type'] in HANDLERS
+    data = event.get('data', {}).get('object', {})
+    ProcessedStripeEvent.objects.bulk_create([ProcessedStripeEvent(
+        id=event['id'],
+        event_type=event['type'],
+        customer_id=data.get('customer') or '',
+        payload=event,
+        status='pending' if handled else 'ignored',
+        stripe_created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc)
+    )], ignore_conflicts=True)
+    return handled
+
+
+def _due(now):
+    stale = now - timedelta(seconds=settings.STRIPE_EVENT_PROCESSING_TIMEOUT)
+    return (
+        Q(status='pending')
+        | Q(status='failed', next_attempt_at__lte=now)
+        # Claimed by a worker that died mid-event
+        | Q(status='processing', started_at__lt=stale)
+    )
+
+
+def process_event(event_id) -> bool:
+    """Claim and apply one stored event; False if another worker has it or it is not due"""
+    now = timezone.now()
+    claimed = ProcessedStripeEvent.objects.filter(_due(now), pk=event_id).update(
+        status='processing', started_at=now, attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return False
+
+    event = ProcessedStripeEvent.objects.get(pk=event_id)
+    try:
+        with transaction.atomic():
+            HANDLERS[event.event_type](event.payload['data']['object'])
+            ProcessedStripeEvent.objects.filter(pk=event_id).update(
+                status='processed', processed_at=timezone.now(), last_error=''
+            )
+    except Exception as e:
+        dead = event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS
+        delay = min(timedelta(seconds=settings.STRIPE_EVENT_RETRY_SECONDS * 2 ** (event.attempts - 1)),
+                    MAX_RETRY_DELAY)
+        ProcessedStripeEvent.objects.filter(pk=event_id).update(
+            status='dead' if dead else 'failed',
+            last_error=f'{type(e).__name__}: {e}',
+            next_attempt_at=None if dead else timezone.now() + delay
+        )
+        logfire.error("Stripe event moved to dead letter" if dead else "Stripe event failed; will retry",
+                      event_id=event_id, event_type=event.event_type, attempts=event.attempts, error=str(e))
+    return True
+
+
+def process_pending_events(limit: int = 200) -> int:
+    """Apply due events in Stripe's order; returns how many were attempted"""
+    now = timezone.now()
+    # Customers with an earlier event still waiting for a retry
+    blocked = set(ProcessedStripeEvent.objects.filter(status='failed').exclude(customer_id='').values_list(
+        'customer_id', flat=True
+    ))
+    due = ProcessedStripeEvent.objects.filter(_due(now)).values_list('id', 'customer_id', 'status')[:limit]
+
+    attempted = 0
+    for event_id, customer_id, status in due:
+        if customer_id in blocked and status != 'failed':
+            continue
+        if not process_event(event_id):
+            continue
+        attempted += 1
+        if customer_id:
+            if ProcessedStripeEvent.objects.filter(customer_id=customer_id, status='failed').exists():
+                blocked.add(customer_id)
+            else:
+                blocked.discard(customer_id)
+    return attempted
+
+
+def requeue_events(queryset) -> int:
+    """Send failed or dead events back to the queue with a fresh set of attempts"""
+    return queryset.filter(status__in=['failed', 'dead']).update(
+        status='pending', attempts=0, next_attempt_at=None
+    )
@@ -0,0 +1,26 @@
+"""
+Celery application for background work (LLM generation jobs).
+
+Workers are started with ``celery -A core worker`` and periodic tasks
+(CELERY_BEAT_SCHEDULE) with ``celery -A core beat``. When no CELERY_BROKER_URL
+is configured the broker falls back to the local filesystem so jobs still run
+without redis.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+app = Celery("core")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+
+@app.on_after_configure.connect
+def create_filesystem_broker_folders(sender, **kwargs):
+    """Make sure the fallback filesystem broker has its queue folders"""
+    options = sender.conf.broker_transport_options or {}
+    for key in ("data_folder_in", "data_folder_out", "processed_folder", "control_folder"):
+        if options.get(key):
+            os.makedirs(options[key], exist_ok=True)
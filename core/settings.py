@@ -179,6 +179,26 @@ SESAME_ONE_TIME = True  # Links can only be used once
 STRIPE_PUBLISHABLE_KEY = config("STRIPE_PUBLISHABLE_KEY", default="")
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", default="")
 STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET", default="")
+# Stored webhook events: first retry delay (doubled per attempt), attempts before the
+# dead letter state, and how long a claimed event may run before another worker takes it
+STRIPE_EVENT_RETRY_SECONDS = config("STRIPE_EVENT_RETRY_SECONDS", default=30, cast=int)
+STRIPE_EVENT_MAX_ATTEMPTS = config("STRIPE_EVENT_MAX_ATTEMPTS", default=8, cast=int)
+STRIPE_EVENT_PROCESSING_TIMEOUT = config("STRIPE_EVENT_PROCESSING_TIMEOUT", default=300, cast=int)
+
+# Billing: whether repeating a cached law search (e.g. paging) charges its credit again
+SEARCH_CACHED_RESULTS_CHARGE_CREDIT = config("SEARCH_CACHED_RESULTS_CHARGE_CREDIT", default=False, cast=bool)
+# Credits held for a generation longer than this are assumed abandoned and refunded
+CREDIT_RESERVATION_TTL_SECONDS = config("CREDIT_RESERVATION_TTL_SECONDS", default=3600, cast=int)
+# Cached credit balances shown on pages; updated as credits are charged, expired as a safety net.
+# Needs a cache shared with the workers (CACHE_REDIS_URL): with the default per-process
+# cache balances are not cached at all and every page reads them from the database
+CREDIT_BALANCE_CACHE_ALIAS = config("CREDIT_BALANCE_CACHE_ALIAS", default="default")
+CREDIT_BALANCE_CACHE_TTL = config("CREDIT_BALANCE_CACHE_TTL", default=300, cast=int)
+# Audit rows (credit usage, search log) are buffered and bulk-written when this many
+# are waiting or the oldest is this old; the spool keeps them across crashes
+USAGE_BUFFER_MAX_EVENTS = config("USAGE_BUFFER_MAX_EVENTS", default=100, cast=int)
+USAGE_BUFFER_MAX_SECONDS = config("USAGE_BUFFER_MAX_SECONDS", default=5.0, cast=float)
+USAGE_SPOOL_DIR = config("USAGE_SPOOL_DIR", default="") or str(BASE_DIR / 'usage_spool')
 
 # Login/Logout URLs
 LOGIN_URL = '/accounts/login/'
@@ -208,4 +228,137 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # OpenAI Configuration
-OPENAI_API_KEY = config("OPENAI_API_KEY", default="")
\ No newline at end of file
+OPENAI_API_KEY = config("OPENAI_API_KEY", default="")
+OPENAI_CONNECT_TIMEOUT = config("OPENAI_CONNECT_TIMEOUT", default=5.0, cast=float)
+OPENAI_READ_TIMEOUT = config("OPENAI_READ_TIMEOUT", default=90.0, cast=float)
+OPENAI_MAX_CONNECTIONS = config("OPENAI_MAX_CONNECTIONS", default=100, cast=int)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = config("OPENAI_MAX_KEEPALIVE_CONNECTIONS", default=20, cast=int)
+# Retries on 429/5xx/connection errors: jittered exponential backoff, capped in total time
+OPENAI_MAX_RETRIES = config("OPENAI_MAX_RETRIES", default=3, cast=int)
+OPENAI_RETRY_BASE_DELAY = config("OPENAI_RETRY_BASE_DELAY", default=0.5, cast=float)
+OPENAI_RETRY_MAX_DELAY = config("OPENAI_RETRY_MAX_DELAY", default=8.0, cast=float)
+OPENAI_RETRY_MAX_ELAPSED = config("OPENAI_RETRY_MAX_ELAPSED", default=30.0, cast=float)
+
+# Token budgeting: system prompts are trimmed to a ceiling and max_tokens is sized
+# per request type, plus a share of the request's length, within the context
+# window left after the prompt. Requests that leave less than
+# LLM_MIN_COMPLETION_TOKENS fail before the call.
+LLM_CONTEXT_WINDOW = config("LLM_CONTEXT_WINDOW", default=128000, cast=int)
+LLM_CONTEXT_SAFETY_MARGIN = config("LLM_CONTEXT_SAFETY_MARGIN", default=256, cast=int)
+LLM_SYSTEM_PROMPT_TOKEN_CEILING = config("LLM_SYSTEM_PROMPT_TOKEN_CEILING", default=1500, cast=int)
+LLM_MIN_COMPLETION_TOKENS = config("LLM_MIN_COMPLETION_TOKENS", default=256, cast=int)
+LLM_MAX_TOKENS = {
+    "law": config("LLM_MAX_TOKENS_LAW", default=2000, cast=int),
+    "constitution": config("LLM_MAX_TOKENS_CONSTITUTION", default=3000, cast=int),
+    "constitution_section": config("LLM_MAX_TOKENS_CONSTITUTION_SECTION", default=1200, cast=int),
+}
+LLM_COMPLETION_TOKENS = {
+    "law": config("LLM_COMPLETION_TOKENS_LAW", default=1000, cast=int),
+    "constitution": config("LLM_COMPLETION_TOKENS_CONSTITUTION", default=2000, cast=int),
+    "constitution_section": config("LLM_COMPLETION_TOKENS_CONSTITUTION_SECTION", default=700, cast=int),
+}
+LLM_COMPLETION_TOKENS_PER_REQUEST_TOKEN = config("LLM_COMPLETION_TOKENS_PER_REQUEST_TOKEN", default=1.0, cast=float)
+
+# Cache for search results and credit balances; shared between processes when
+# redis is configured, otherwise local to each one
+CACHE_REDIS_URL = config("CACHE_REDIS_URL", default="")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# LLM response cache (identical generation requests are served from memory)
+LLM_CACHE_MAX_ENTRIES = config("LLM_CACHE_MAX_ENTRIES", default=512, cast=int)
+LLM_CACHE_TTL_SECONDS = config("LLM_CACHE_TTL_SECONDS", default=3600, cast=int)
+
+# Celery (background generation jobs)
+CELERY_BROKER_URL = config("CELERY_BROKER_URL", default="")
+if not CELERY_BROKER_URL:
+    # No redis configured: queue jobs through the local filesystem instead
+    CELERY_BROKER_URL = "filesystem://"
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        "data_folder_in": str(BASE_DIR / "celery_broker" / "queue"),
+        "data_folder_out": str(BASE_DIR / "celery_broker" / "queue"),
+        "processed_folder": str(BASE_DIR / "celery_broker" / "processed"),
+        "control_folder": str(BASE_DIR / "celery_broker" / "control"),
+        "store_processed": False,
+    }
+# Run jobs inline in the web process (useful for development without a worker)
+CELERY_TASK_ALWAYS_EAGER = config("CELERY_TASK_ALWAYS_EAGER", default=False, cast=bool)
+# Job state lives in GenerationJob, so no result backend is needed
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TIMEZONE = TIME_ZONE
+# Periodic tasks, run by `celery -A core beat`
+CELERY_BEAT_SCHEDULE = {
+    "rollup-search-analytics": {
+        "task": "political_god.tasks.rollup_search_analytics",
+        "schedule": config("SEARCH_ROLLUP_INTERVAL_SECONDS", default=300, cast=int),
+    },
+    "expire-credit-reservations": {
+        "task": "billing.tasks.expire_credit_reservations",
+        "schedule": config("CREDIT_RESERVATION_SWEEP_SECONDS", default=900, cast=int),
+    },
+    "process-stripe-events": {
+        "task": "billing.tasks.process_stripe_events",
+        "schedule": config("STRIPE_EVENT_SWEEP_SECONDS", default=60, cast=int),
+    },
+    "roll-over-billing-periods": {
+        "task": "billing.tasks.roll_over_billing_periods",
+        "schedule": config("BILLING_ROLLOVER_INTERVAL_SECONDS", default=3600, cast=int),
+    },
+}
+
+# Batch law generation
+LAW_BATCH_MAX_SIZE = config("LAW_BATCH_MAX_SIZE", default=25, cast=int)
+LAW_BATCH_MAX_CONCURRENCY = config("LAW_BATCH_MAX_CONCURRENCY", default=5, cast=int)
+
+# Law library search: most relevant matches returned by the full-text index
+LAW_SEARCH_MAX_RESULTS = config("LAW_SEARCH_MAX_RESULTS", default=500, cast=int)
+# Search analytics rollups: how far behind the clock the rollup stops (so in-flight
+# searches are not skipped) and how long hourly rollups are kept
+SEARCH_ROLLUP_LAG_SECONDS = config("SEARCH_ROLLUP_LAG_SECONDS", default=120, cast=int)
+SEARCH_ROLLUP_HOURLY_DAYS = config("SEARCH_ROLLUP_HOURLY_DAYS", default=14, cast=int)
+# Typeahead: per-user title/tag prefix indexes held in memory (least recently used evicted)
+LAW_SUGGEST_MAX_USERS = config("LAW_SUGGEST_MAX_USERS", default=256, cast=int)
+# Ordered result ids are cached per user until one of their laws changes
+LAW_SEARCH_CACHE_ALIAS = config("LAW_SEARCH_CACHE_ALIAS", default="default")
+LAW_SEARCH_CACHE_TTL = config("LAW_SEARCH_CACHE_TTL", default=600, cast=int)
+
+# Semantic law search: a local sentence-transformers model name or path, or empty
+# for the built-in hashing embedder. Vectors are computed when laws are saved.
+LAW_EMBEDDING_MODEL = config("LAW_EMBEDDING_MODEL", default="")
+LAW_EMBEDDING_DIMENSIONS = config("LAW_EMBEDDING_DIMENSIONS", default=512, cast=int)
+LAW_EMBEDDINGS_ON_SAVE = config("LAW_EMBEDDINGS_ON_SAVE", default=True, cast=bool)
+LAW_SEMANTIC_MIN_SCORE = config("LAW_SEMANTIC_MIN_SCORE", default=0.1, cast=float)
+
+# Near-duplicate detection: estimated similarity above which a prompt or law
+# counts as one the user already has
+LAW_DUPLICATE_THRESHOLD = config("LAW_DUPLICATE_THRESHOLD", default=0.8, cast=float)
+
+# Public law corpus: one full-text index file per category, searched in parallel
+PUBLIC_CORPUS_DIR = config("PUBLIC_CORPUS_DIR", default="") or str(BASE_DIR / 'public_corpus')
+PUBLIC_CORPUS_SEARCH_WORKERS = config("PUBLIC_CORPUS_SEARCH_WORKERS", default=8, cast=int)
+
+# Constitutions: write each section in its own concurrent completion by default
+CONSTITUTION_PARALLEL_SECTIONS = config("CONSTITUTION_PARALLEL_SECTIONS", default=True, cast=bool)
+
+# LLM provider: "openai", "fake" (offline stand-in for load tests) or a dotted path
+LLM_PROVIDER = config("LLM_PROVIDER", default="openai")
+LLM_MODEL = config("LLM_MODEL", default="gpt-4o")
+# Structured replies: "json_schema" (strict schema), "json_object" (any JSON) or "off"
+LLM_STRUCTURED_OUTPUT = config("LLM_STRUCTURED_OUTPUT", default="json_schema")
+LLM_FAKE_LATENCY_SECONDS = config("LLM_FAKE_LATENCY_SECONDS", default=2.0, cast=float)
+LLM_FAKE_LATENCY_JITTER = config("LLM_FAKE_LATENCY_JITTER", default=0.5, cast=float)
+LLM_FAKE_COMPLETION_TOKENS = config("LLM_FAKE_COMPLETION_TOKENS", default=800, cast=int)
+LLM_FAKE_ERROR_RATE = config("LLM_FAKE_ERROR_RATE", default=0.0, cast=float)
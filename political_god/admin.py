@@ -1,16 +1,17 @@
 from django.contrib import admin
 from .models import (
     UserValues, LawCategory, GeneratedLaw, LawGenerationRequest, 
-    LawSearch, StateConstitution
+    LawSearch, StateConstitution, GenerationJob, SystemPromptSnapshot, Tag, PublishedLaw,
+    SearchRollup, SearchQueryRollup, SearchRollupState
 )
 
 
 @admin.register(UserValues)
 class UserValuesAdmin(admin.ModelAdmin):
-    list_display = ('user', 'governance_style', 'economic_system', 'created_at')
+    list_display = ('user', 'governance_style', 'economic_system', 'version', 'created_at')
     list_filter = ('governance_style', 'economic_system', 'created_at')
     search_fields = ('user__username', 'user__email', 'political_philosophy', 'core_values')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('version', 'created_at', 'updated_at')
     
     fieldsets = (
         ('User', {
@@ -32,12 +33,19 @@ class UserValuesAdmin(admin.ModelAdmin):
             'classes': ('wide',)
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('version', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
 
 
+@admin.register(SystemPromptSnapshot)
+class SystemPromptSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'values_version', 'content_hash', 'created_at')
+    search_fields = ('user__username', 'content_hash')
+    readonly_fields = ('user', 'values_version', 'content_hash', 'content', 'created_at')
+
+
 @admin.register(LawCategory)
 class LawCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'icon', 'created_at')
@@ -46,6 +54,13 @@ class LawCategoryAdmin(admin.ModelAdmin):
     ordering = ('name',)
 
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('created_at',)
+
+
 @admin.register(GeneratedLaw)
 class GeneratedLawAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'category', 'is_favorite', 'is_implemented', 'created_at')
@@ -63,7 +78,7 @@ class GeneratedLawAdmin(admin.ModelAdmin):
             'classes': ('wide',)
         }),
         ('Generation Context', {
-            'fields': ('prompt_used', 'ai_model', 'system_prompt'),
+            'fields': ('prompt_used', 'ai_model', 'prompt_snapshot'),
             'classes': ('collapse', 'wide')
         }),
         ('Metadata', {
@@ -76,6 +91,14 @@ class GeneratedLawAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(PublishedLaw)
+class PublishedLawAdmin(admin.ModelAdmin):
+    list_display = ('title', 'author', 'category', 'is_active', 'fork_count', 'published_at')
+    list_filter = ('is_active', 'category', 'published_at')
+    search_fields = ('title', 'summary', 'tags', 'author__username')
+    readonly_fields = ('id', 'source_law', 'fork_count', 'published_at', 'updated_at')
+
+
 @admin.register(LawGenerationRequest)
 class LawGenerationRequestAdmin(admin.ModelAdmin):
     list_display = ('user', 'success', 'credits_used', 'response_time_seconds', 'created_at')
@@ -91,7 +114,8 @@ class LawGenerationRequestAdmin(admin.ModelAdmin):
             'fields': ('generated_law', 'success', 'error_message')
         }),
         ('Billing & Performance', {
-            'fields': ('credits_used', 'billing_processed', 'response_time_seconds', 'token_count')
+            'fields': ('credits_used', 'billing_processed', 'response_time_seconds', 'token_count',
+                       'estimated_prompt_tokens', 'max_tokens')
         }),
         ('Timestamp', {
             'fields': ('created_at',)
@@ -101,10 +125,38 @@ class LawGenerationRequestAdmin(admin.ModelAdmin):
 
 @admin.register(LawSearch)
 class LawSearchAdmin(admin.ModelAdmin):
-    list_display = ('user', 'query', 'results_count', 'credits_used', 'created_at')
+    list_display = ('user', 'query', 'results_count', 'latency_ms', 'credits_used', 'created_at')
     list_filter = ('billing_processed', 'created_at')
     search_fields = ('user__username', 'query')
     readonly_fields = ('id', 'created_at')
+    # The log grows without bound; totals and trends are on the rollup pages
+    show_full_result_count = False
+
+
+@admin.register(SearchRollup)
+class SearchRollupAdmin(admin.ModelAdmin):
+    list_display = ('period_start', 'period', 'user', 'searches', 'zero_result_searches',
+                    'average_latency_ms', 'max_latency_ms')
+    list_filter = ('period',)
+    search_fields = ('user__username',)
+    date_hierarchy = 'period_start'
+    readonly_fields = [field.name for field in SearchRollup._meta.fields]
+
+
+@admin.register(SearchQueryRollup)
+class SearchQueryRollupAdmin(admin.ModelAdmin):
+    list_display = ('query', 'period_start', 'period', 'user', 'searches', 'zero_result_searches')
+    list_filter = ('period',)
+    search_fields = ('query', 'user__username')
+    date_hierarchy = 'period_start'
+    ordering = ('-period_start', '-searches')
+    readonly_fields = [field.name for field in SearchQueryRollup._meta.fields]
+
+
+@admin.register(SearchRollupState)
+class SearchRollupStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'high_water_mark', 'updated_at')
+    readonly_fields = ('updated_at',)
 
 
 @admin.register(StateConstitution)
@@ -131,3 +183,26 @@ class StateConstitutionAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'job_type', 'status', 'created_at', 'finished_at')
+    list_filter = ('job_type', 'status', 'created_at')
+    search_fields = ('user__username', 'error_message')
+    readonly_fields = ('id', 'created_at', 'started_at', 'finished_at')
+    
+    fieldsets = (
+        ('Job Details', {
+            'fields': ('id', 'user', 'job_type', 'status')
+        }),
+        ('Input', {
+            'fields': ('params', 'category')
+        }),
+        ('Output', {
+            'fields': ('generated_law', 'result', 'error_message')
+        }),
+        ('Timestamps', {
+            'fields': ('created_at', 'started_at', 'finished_at')
+        }),
+    )
@@ -1,6 +1,44 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 
 
 class PoliticalGodConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "political_god"
+
+    def ready(self):
+        from .corpus import withdraw_deleted_law
+        from .dedup import fingerprint_saved_law
+        from .embeddings import embed_saved_law
+        from .search import ensure_law_index
+        from .search_cache import invalidate_law_searches
+        from .suggest import update_suggestions_on_delete, update_suggestions_on_save
+
+        def ensure_search_index(using, **kwargs):
+            ensure_law_index(using)
+
+        # Re-checked after every migrate: SQLite table rebuilds drop the FTS triggers
+        post_migrate.connect(ensure_search_index, sender=self, weak=False,
+                             dispatch_uid='political_god_ensure_law_index')
+
+        law_model = self.get_model('GeneratedLaw')
+        post_save.connect(embed_saved_law, sender=law_model,
+                          dispatch_uid='political_god_embed_saved_law')
+        post_save.connect(fingerprint_saved_law, sender=law_model,
+                          dispatch_uid='political_god_fingerprint_saved_law')
+
+        # Any write to a law invalidates its owner's cached searches
+        post_save.connect(invalidate_law_searches, sender=law_model,
+                          dispatch_uid='political_god_invalidate_law_searches_save')
+        post_delete.connect(invalidate_law_searches, sender=law_model,
+                            dispatch_uid='political_god_invalidate_law_searches_delete')
+
+        # Typeahead indexes are patched in place; must run after the generation bump
+        post_save.connect(update_suggestions_on_save, sender=law_model,
+                          dispatch_uid='political_god_update_suggestions_save')
+        post_delete.connect(update_suggestions_on_delete, sender=law_model,
+                            dispatch_uid='political_god_update_suggestions_delete')
+
+        # Deleting a law withdraws its public copy (before SET_NULL detaches it)
+        pre_delete.connect(withdraw_deleted_law, sender=law_model,
+                           dispatch_uid='political_god_withdraw_deleted_law')
@@ -0,0 +1,164 @@
+"""
+Token budgeting for LLM requests.
+
+Counts prompt tokens locally before a call, trims oversized user values so the
+system prompt stays under a configured ceiling, and sizes ``max_tokens`` from
+the kind and length of the request, within the context left over.
+"""
+import threading
+from dataclasses import dataclass
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+
+# Rough characters-per-token ratio for English text when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead of the chat format (role markers and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+TRUNCATION_MARKER = ' [...]'
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+class PromptTooLong(ValueError):
+    """The prompt leaves too little of the context window for a usable completion"""
+
+
+@dataclass
+class TokenBudget:
+    """Estimated prompt size and the completion allowance for one request"""
+    prompt_tokens: int
+    max_tokens: int
+
+
+def _get_encoding(model: str):
+    """Return the tokenizer for a model, or None when it cannot be loaded"""
+    if tiktoken is None:
+        return None
+
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                # The BPE file could not be fetched (e.g. no network access)
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Count the tokens in a piece of text"""
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model or settings.LLM_MODEL)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list, model: str = None) -> int:
+    """Count the prompt tokens of a chat message list"""
+    return sum(
+        count_tokens(message['content'], model) + MESSAGE_OVERHEAD_TOKENS for message in messages
+    ) + REPLY_PRIMING_TOKENS
+
+
+def trim_to_tokens(text: str, max_tokens: int, model: str = None) -> str:
+    """Cut text down to at most ``max_tokens``, ending on a word boundary"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    # Leave room for the marker appended below
+    max_tokens -= count_tokens(TRUNCATION_MARKER, model)
+    if max_tokens <= 0:
+        return ''
+
+    encoding = _get_encoding(model or settings.LLM_MODEL)
+    if encoding is None:
+        trimmed = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        trimmed = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    # Drop the partial word at the end
+    if ' ' in trimmed:
+        trimmed = trimmed.rsplit(' ', 1)[0]
+    return trimmed.rstrip() + TRUNCATION_MARKER
+
+
+def _share_budget(sizes: dict, available: int) -> dict:
+    """
+    Split a token budget between fields.
+
+    Every field gets an equal share; fields shorter than their share keep their
+    full length and the unused tokens go to the longer ones.
+    """
+    limits = {}
+    remaining = dict(sizes)
+    while remaining:
+        share = available // len(remaining)
+        fitting = {name: size for name, size in remaining.items() if size <= share}
+        if not fitting:
+            for name in remaining:
+                limits[name] = share
+            break
+        for name, size in fitting.items():
+            limits[name] = size
+            available -= size
+            del remaining[name]
+    return limits
+
+
+def fit_system_prompt(user_values, model: str = None) -> str:
+    """Render the user's system prompt, trimming free-text values to the token ceiling"""
+    ceiling = settings.LLM_SYSTEM_PROMPT_TOKEN_CEILING
+    prompt = user_values.system_prompt
+    if count_tokens(prompt, model) <= ceiling:
+        return prompt
+
+    values = {name: getattr(user_values, name) for name in user_values.PROMPT_TEXT_FIELDS}
+    # Tokens taken by the instructions and field labels, with one token per value
+    sizes = {name: count_tokens(value, model) for name, value in values.items() if value}
+    placeholders = {name: 'x' if value else '' for name, value in values.items()}
+    fixed_tokens = count_tokens(user_values.render_system_prompt(placeholders), model) - len(sizes)
+    limits = _share_budget(sizes, max(0, ceiling - fixed_tokens))
+
+    trimmed = {name: trim_to_tokens(values[name], limit, model) for name, limit in limits.items()}
+    return user_values.render_system_prompt(trimmed)
+
+
+def plan_completion(messages: list, request_type: str, model: str = None) -> TokenBudget:
+    """
+    Estimate the prompt size and pick ``max_tokens`` for a request.
+
+    The allowance is what this kind of request usually needs, grown with the
+    length of the request itself (the last message), and capped by the
+    per-type maximum and the context left after the prompt. Raises
+    PromptTooLong when less than LLM_MIN_COMPLETION_TOKENS would be left.
+    """
+    prompt_tokens = count_message_tokens(messages, model)
+
+    context_left = settings.LLM_CONTEXT_WINDOW - prompt_tokens - settings.LLM_CONTEXT_SAFETY_MARGIN
+    if context_left < settings.LLM_MIN_COMPLETION_TOKENS:
+        raise PromptTooLong(
+            f"The prompt is too long: it leaves {max(context_left, 0)} tokens for the response, "
+            f"at least {settings.LLM_MIN_COMPLETION_TOKENS} are needed."
+        )
+
+    request_tokens = count_tokens(messages[-1]['content'], model)
+    needed = (settings.LLM_COMPLETION_TOKENS[request_type]
+              + int(request_tokens * settings.LLM_COMPLETION_TOKENS_PER_REQUEST_TOKEN))
+    max_tokens = max(settings.LLM_MIN_COMPLETION_TOKENS,
+                     min(needed, settings.LLM_MAX_TOKENS[request_type], context_left))
+
+    return TokenBudget(prompt_tokens=prompt_tokens, max_tokens=max_tokens)
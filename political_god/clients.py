@@ -0,0 +1,132 @@
+"""
+Process-wide OpenAI clients.
+
+Every PoliticalGodAI instance shares the same clients, so connections (and
+their TLS sessions) are reused across generations instead of being set up per
+request. The SDK's own retries are disabled in favour of ``call_with_retry`` /
+``acall_with_retry``, which add jitter and cap the total time spent retrying.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import openai
+from django.conf import settings
+
+
+# Errors worth retrying: rate limits, upstream 5xx and transport failures
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # Includes APITimeoutError
+)
+
+_lock = threading.Lock()
+_sync_client = None
+# Async clients are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+        read=settings.OPENAI_READ_TIMEOUT,
+        write=settings.OPENAI_CONNECT_TIMEOUT,
+        pool=settings.OPENAI_CONNECT_TIMEOUT,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+def get_openai_client() -> openai.OpenAI:
+    """Return the shared synchronous client, creating it on first use"""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = openai.OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=_timeout(),
+                    max_retries=0,
+                    http_client=httpx.Client(timeout=_timeout(), limits=_limits()),
+                )
+    return _sync_client
+
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """Return the shared async client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                timeout=_timeout(),
+                max_retries=0,
+                http_client=httpx.AsyncClient(timeout=_timeout(), limits=_limits()),
+            )
+            _async_clients[loop] = client
+    return client
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when given"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.OPENAI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+
+    ceiling = min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _next_delay(attempt: int, error: Exception, started: float):
+    """Delay before the next attempt, or None when the retry budget is spent"""
+    if attempt >= settings.OPENAI_MAX_RETRIES:
+        return None
+
+    delay = _retry_delay(attempt, error)
+    if time.monotonic() - started + delay > settings.OPENAI_RETRY_MAX_ELAPSED:
+        return None
+    return delay
+
+
+def call_with_retry(func, *args, **kwargs):
+    """Call an OpenAI client method, retrying transient failures"""
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            delay = _next_delay(attempt, e, started)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retry(func, *args, **kwargs):
+    """Async counterpart of ``call_with_retry``"""
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            delay = _next_delay(attempt, e, started)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
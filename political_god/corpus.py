@@ -0,0 +1,358 @@
+"""
+The public law corpus.
+
+Users can publish a copy of a law for everyone to search and fork. Published
+laws are indexed outside the main database, in one read-only-in-practice
+SQLite FTS5 file per LawCategory under PUBLIC_CORPUS_DIR, so a cross-user
+search never touches the (write-heavy) law table and each partition stays
+small. A search runs against every partition at once on a thread pool and the
+best BM25 matches of each are merged into one top-k list. BM25 statistics are
+per partition, so scores from different categories are close to, but not
+exactly, comparable.
+
+Publishing and withdrawing patch the partition in place. ``rebuild_partition``
+writes a fresh file next to the live one and swaps it in with an atomic
+rename, so searches keep reading the old file until the new one is complete,
+then replays anything published meanwhile.
+"""
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import GeneratedLaw, PublishedLaw
+from .search import BM25_WEIGHTS, INDEXED_COLUMNS, SNIPPET_END, SNIPPET_START, SNIPPET_TOKENS, build_match_query
+
+logger = logging.getLogger(__name__)
+
+
+# Laws without a category share partition 0
+UNCATEGORIZED = 0
+PARTITION_PATTERN = 'category-*.sqlite3'
+
+_columns = ', '.join(INDEXED_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in INDEXED_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in INDEXED_COLUMNS)
+
+# Documents are stored once and indexed as external content, like the law index
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS documents (
+        rowid INTEGER PRIMARY KEY,
+        published_id TEXT NOT NULL UNIQUE,
+        {', '.join(f'{column} TEXT' for column in INDEXED_COLUMNS)}
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        {_columns}, content='documents', tokenize='porter unicode61', prefix='2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, {_columns}) VALUES (new.rowid, {_new_values});
+    END;
+    CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, {_columns}) VALUES ('delete', old.rowid, {_old_values});
+    END;
+"""
+
+UPSERT_SQL = f"""
+    INSERT INTO documents (published_id, {_columns}) VALUES (?, {', '.join('?' * len(INDEXED_COLUMNS))})
+"""
+
+_weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+SEARCH_SQL = f"""
+    SELECT bm25(documents_fts, {_weights}), documents.published_id
+    FROM documents_fts JOIN documents ON documents.rowid = documents_fts.rowid
+    WHERE documents_fts MATCH ?
+    ORDER BY 1
+    LIMIT ?
+"""
+
+# Snippets cost far more than ranking, so they are made only for the merged top-k
+SNIPPET_SQL = """
+    SELECT documents.published_id, snippet(documents_fts, -1, ?, ?, ?, ?)
+    FROM documents_fts JOIN documents ON documents.rowid = documents_fts.rowid
+    WHERE documents_fts MATCH ?
+      AND documents_fts.rowid IN (SELECT rowid FROM documents WHERE published_id IN ({placeholders}))
+"""
+
+# One writer at a time per partition in this process; SQLite's file lock covers the rest
+_partition_locks = {}
+_partition_locks_guard = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def corpus_dir() -> Path:
+    return Path(settings.PUBLIC_CORPUS_DIR)
+
+
+def partition_id(category_id) -> int:
+    return category_id or UNCATEGORIZED
+
+
+def partition_path(category_id) -> Path:
+    return corpus_dir() / f'category-{partition_id(category_id)}.sqlite3'
+
+
+def _partition_lock(category_id) -> threading.Lock:
+    with _partition_locks_guard:
+        return _partition_locks.setdefault(partition_id(category_id), threading.Lock())
+
+
+def _open_for_writing(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    # Rollback journal rather than WAL: a WAL file would not follow the rename on rebuild
+    connection.execute('PRAGMA journal_mode=DELETE')
+    connection.executescript(SCHEMA_SQL)
+    return connection
+
+
+def _write_documents(connection: sqlite3.Connection, published_laws):
+    """Replace the documents of the given laws, dropping those no longer active"""
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for published in published_laws:
+            connection.execute('DELETE FROM documents WHERE published_id = ?', [published.pk.hex])
+            if published.is_active:
+                values = [getattr(published, column) for column in INDEXED_COLUMNS]
+                connection.execute(UPSERT_SQL, [published.pk.hex, *values])
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def index_published_laws(category_id, published_laws):
+    """Bring one partition up to date with the given published laws"""
+    with _partition_lock(category_id):
+        with closing(_open_for_writing(partition_path(category_id))) as connection:
+            _write_documents(connection, published_laws)
+
+
+def remove_from_partition(category_id, published_ids):
+    with _partition_lock(category_id):
+        path = partition_path(category_id)
+        if not path.exists():
+            return
+        with closing(_open_for_writing(path)) as connection:
+            connection.executemany('DELETE FROM documents WHERE published_id = ?',
+                                   [[published_id.hex] for published_id in published_ids])
+
+
+def rebuild_partition(category_id) -> int:
+    """
+    Rebuild one partition from the database without blocking its readers.
+    Returns the number of laws indexed.
+    """
+    path = partition_path(category_id)
+    building = path.with_name(f'{path.name}.building-{os.getpid()}')
+    building.unlink(missing_ok=True)
+    published = PublishedLaw.objects.filter(is_active=True, category_id=category_id or None)
+
+    started = timezone.now()
+    count = 0
+    with closing(_open_for_writing(building)) as connection:
+        batch = []
+        for law in published.only('id', 'is_active', *INDEXED_COLUMNS).iterator(chunk_size=500):
+            batch.append(law)
+            if len(batch) == 500:
+                _write_documents(connection, batch)
+                count += len(batch)
+                batch = []
+        _write_documents(connection, batch)
+        count += len(batch)
+        connection.execute("INSERT INTO documents_fts(documents_fts) VALUES ('optimize')")
+
+    with _partition_lock(category_id):
+        if path.exists():
+            # Wait out writers in other processes, so no half-written journal
+            # is left next to the new file
+            with closing(sqlite3.connect(path, timeout=30, isolation_level=None)) as live:
+                live.execute('BEGIN EXCLUSIVE')
+                os.replace(building, path)
+                live.execute('ROLLBACK')
+        else:
+            os.replace(building, path)
+
+    # Publications and withdrawals that landed in the old file while this one was built
+    changed = PublishedLaw.objects.filter(updated_at__gte=started)
+    index_published_laws(category_id, changed.filter(category_id=category_id or None))
+    remove_from_partition(category_id, changed.exclude(category_id=category_id or None).values_list('pk', flat=True))
+    return count
+
+
+def _query_partition(path: Path, sql: str, params: list) -> list:
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=5)
+    except sqlite3.OperationalError:
+        # Removed since the partitions were listed
+        return []
+    with closing(connection):
+        try:
+            return connection.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            logger.exception("Could not search public corpus partition %s", path.name)
+            return []
+
+
+def _search_partition(path: Path, match_query: str, limit: int) -> list:
+    """``(bm25, published_id, path)`` rows of the partition's best matches, best first"""
+    return [(score, published_id, path)
+            for score, published_id in _query_partition(path, SEARCH_SQL, [match_query, limit])]
+
+
+def _partition_snippets(path: Path, match_query: str, published_ids: list) -> list:
+    sql = SNIPPET_SQL.format(placeholders=', '.join('?' * len(published_ids)))
+    params = [SNIPPET_START, SNIPPET_END, '…', SNIPPET_TOKENS, match_query, *published_ids]
+    return _query_partition(path, sql, params)
+
+
+def _fan_out(func, items: list) -> list:
+    """``func`` applied to every item, on the thread pool when there is more than one"""
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    return list(_get_executor().map(func, items))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PUBLIC_CORPUS_SEARCH_WORKERS,
+                                               thread_name_prefix='public-corpus')
+    return _executor
+
+
+def search_corpus(query: str, category=None, limit: int = 20) -> list:
+    """
+    Published laws matching ``query``, best first, each with ``score`` and
+    ``snippet`` attributes. Searches one category, or all of them in parallel.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    if category is not None:
+        paths = [partition_path(category.pk)]
+    else:
+        paths = sorted(corpus_dir().glob(PARTITION_PATTERN))
+    paths = [path for path in paths if path.exists()]
+    if not paths:
+        return []
+
+    partitions = _fan_out(lambda path: _search_partition(path, match_query, limit), paths)
+    # Each partition comes back sorted, lower BM25 first, so merging them is enough
+    best = list(islice(heapq.merge(*partitions, key=lambda row: row[0]), limit))
+
+    winners = {}
+    for score, published_id, path in best:
+        winners.setdefault(path, []).append(published_id)
+    snippets = {}
+    for rows in _fan_out(lambda item: _partition_snippets(item[0], match_query, item[1]), list(winners.items())):
+        snippets.update(rows)
+
+    laws = PublishedLaw.objects.filter(is_active=True).select_related('author', 'category').defer('content')
+    laws = laws.in_bulk([uuid.UUID(published_id) for score, published_id, path in best])
+    results = []
+    for score, published_id, path in best:
+        law = laws.get(uuid.UUID(published_id))
+        if law is None:
+            continue
+        law.score = -score
+        snippet = escape(snippets.get(published_id, ''))
+        law.snippet = mark_safe(snippet.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+        results.append(law)
+    return results
+
+
+def publish_law(law: GeneratedLaw) -> PublishedLaw:
+    """Publish a copy of the law, or refresh the copy already published"""
+    with transaction.atomic():
+        published = PublishedLaw.objects.select_for_update().filter(source_law=law).first()
+        previous_category_id = published.category_id if published else None
+        if published is None:
+            published = PublishedLaw(source_law=law, author_id=law.user_id)
+        published.category_id = law.category_id
+        published.title = law.title
+        published.summary = law.summary
+        published.tags = law.tags
+        published.content = law.content
+        published.is_active = True
+        published.save()
+
+        if not law.is_published:
+            law.is_published = True
+            law.save(update_fields=['is_published', 'updated_at'])
+
+        def reindex():
+            if previous_category_id != published.category_id:
+                remove_from_partition(previous_category_id, [published.pk])
+            index_published_laws(published.category_id, [published])
+        transaction.on_commit(_logged(reindex, published))
+    return published
+
+
+def unpublish_law(law: GeneratedLaw):
+    """Withdraw the law from the corpus; forks already made are kept"""
+    with transaction.atomic():
+        _withdraw(law)
+        if law.is_published:
+            law.is_published = False
+            law.save(update_fields=['is_published', 'updated_at'])
+
+
+def _withdraw(law: GeneratedLaw):
+    published = PublishedLaw.objects.filter(source_law=law, is_active=True).first()
+    if published is not None:
+        published.is_active = False
+        published.save(update_fields=['is_active', 'updated_at'])
+        transaction.on_commit(_logged(lambda: remove_from_partition(published.category_id, [published.pk]),
+                                      published))
+
+
+def fork_law(user, published: PublishedLaw) -> GeneratedLaw:
+    """Copy a published law into the user's own library"""
+    with transaction.atomic():
+        law = GeneratedLaw.objects.create(
+            user=user,
+            title=published.title,
+            content=published.content,
+            summary=published.summary,
+            tags=published.tags,
+            category_id=published.category_id,
+            prompt_used=f'Forked from "{published.title}"',
+            ai_model='fork',
+            forked_from=published,
+        )
+        PublishedLaw.objects.filter(pk=published.pk).update(fork_count=F('fork_count') + 1)
+    return law
+
+
+def _logged(func, published):
+    def run():
+        try:
+            func()
+        except Exception:
+            # rebuild_public_corpus catches up on anything missed here
+            logger.exception("Could not update the public corpus index for %s", published.pk)
+    return run
+
+
+def withdraw_deleted_law(sender, instance, **kwargs):
+    """pre_delete receiver: deleting a law withdraws its published copy"""
+    if instance.is_published:
+        _withdraw(instance)
@@ -0,0 +1,173 @@
+"""
+Near-duplicate law detection.
+
+Each law's prompt and text get a MinHash signature (the minimum of NUM_PERM
+hash permutations over its character shingles), so the share of equal
+positions between two signatures estimates their Jaccard similarity. The
+signature is split into LSH_BANDS bands and every band is stored as one
+bucket row: two texts above roughly 0.7 similarity almost always share a
+bucket, and looking them up is a single indexed query whatever the size of
+the library.
+
+Fingerprints are written when a law is saved; ``cluster_laws`` backfills and
+groups an existing library.
+"""
+import hashlib
+import logging
+import re
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import GeneratedLaw, LawFingerprint, LawFingerprintBucket
+
+logger = logging.getLogger(__name__)
+
+
+NUM_PERM = 128
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+
+SHINGLE_SIZE = 5
+MAX_FINGERPRINTED_CHARS = 20000
+
+# Universal hashing (a * x + b) mod p with a Mersenne prime, in uint64 without overflow
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240917)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+_WORDS = re.compile(r'\w+')
+
+FINGERPRINTED_FIELDS = {'prompt_used', 'title', 'content'}
+
+
+def fingerprint_text(law: GeneratedLaw, kind: str) -> str:
+    if kind == 'prompt':
+        return law.prompt_used
+    return f'{law.title}\n{law.content}'
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(_WORDS.findall(text.lower()))[:MAX_FINGERPRINTED_CHARS]
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a text's character shingles"""
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) % _PRIME for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # One row per permutation; the minimum over the shingles is that permutation's value
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+def band_buckets(sig: np.ndarray, kind: str) -> list:
+    """The LSH bucket of each band, as signed 64-bit integers"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(f'{kind}:{band}:'.encode('ascii') + rows.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+@transaction.atomic
+def fingerprint_law(law: GeneratedLaw, kinds=('prompt', 'content')):
+    """
+    Store or refresh the law's fingerprints for text that changed since the last
+    run. Atomic, so a fingerprint is never left without its LSH buckets.
+    """
+    existing = {fp.kind: fp for fp in LawFingerprint.objects.filter(law=law).only('id', 'kind', 'content_hash')}
+    for kind in kinds:
+        text = fingerprint_text(law, kind)
+        fingerprint = existing.get(kind)
+        if not text:
+            if fingerprint:
+                fingerprint.delete()
+            continue
+
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if fingerprint and fingerprint.content_hash == content_hash:
+            continue
+
+        sig = signature(text)
+        if fingerprint:
+            fingerprint.content_hash = content_hash
+            fingerprint.signature = sig.tobytes()
+            fingerprint.save(update_fields=['content_hash', 'signature'])
+            fingerprint.buckets.all().delete()
+        else:
+            fingerprint = LawFingerprint.objects.create(
+                law=law, user_id=law.user_id, kind=kind,
+                content_hash=content_hash, signature=sig.tobytes()
+            )
+        LawFingerprintBucket.objects.bulk_create([
+            LawFingerprintBucket(fingerprint=fingerprint, user_id=law.user_id, bucket=bucket)
+            for bucket in band_buckets(sig, kind)
+        ])
+
+
+def find_duplicates(user: User, text: str, kind: str = 'prompt', exclude_law_id=None,
+                    threshold: float = None, limit: int = 5) -> list:
+    """
+    ``(law_id, similarity)`` pairs for the user's laws whose ``kind`` text is a
+    likely near-duplicate of ``text``, most similar first.
+    """
+    if not text or not text.strip():
+        return []
+    threshold = settings.LAW_DUPLICATE_THRESHOLD if threshold is None else threshold
+
+    sig = signature(text)
+    bucket_rows = LawFingerprintBucket.objects.filter(user=user, bucket__in=band_buckets(sig, kind))
+    candidates = LawFingerprint.objects.filter(pk__in=bucket_rows.values('fingerprint_id'))
+    if exclude_law_id:
+        candidates = candidates.exclude(law_id=exclude_law_id)
+
+    matches = []
+    for law_id, candidate in candidates.values_list('law_id', 'signature'):
+        score = similarity(sig, np.frombuffer(bytes(candidate), dtype=np.uint32))
+        if score >= threshold:
+            matches.append((law_id, score))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:limit]
+
+
+def duplicate_laws(user: User, text: str, kind: str = 'prompt', exclude_law_id=None) -> list:
+    """Laws returned by ``find_duplicates``, each with a ``similarity`` attribute"""
+    matches = find_duplicates(user, text, kind, exclude_law_id=exclude_law_id)
+    laws = GeneratedLaw.objects.filter(user=user).in_bulk([law_id for law_id, score in matches])
+    results = []
+    for law_id, score in matches:
+        if law_id in laws:
+            laws[law_id].similarity = score
+            results.append(laws[law_id])
+    return results
+
+
+def fingerprint_saved_law(sender, instance, raw=False, **kwargs):
+    """post_save receiver that keeps a law's fingerprints in step with its text"""
+    if raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & FINGERPRINTED_FIELDS:
+        return
+    try:
+        # A savepoint, so a failed write here does not break the caller's transaction
+        with transaction.atomic():
+            fingerprint_law(instance)
+    except Exception:
+        # cluster_laws catches up on anything missed here
+        logger.exception("Could not fingerprint law %s", instance.pk)
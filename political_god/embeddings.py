@@ -0,0 +1,294 @@
+"""
+Semantic law search with local embeddings.
+
+Each law's text is embedded once, when it is saved, and stored as a float32
+blob in LawEmbedding. Searching loads a user's vectors into one NumPy matrix,
+kept in process until their embeddings change, and ranks every law with a
+single matrix-vector product, so no network call is made at query time.
+
+The embedder is a sentence-transformers model when LAW_EMBEDDING_MODEL names
+one that is available locally, and otherwise a feature-hashing embedder
+(word, word-pair and character trigram features) that needs no model files.
+"""
+import hashlib
+import logging
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import GeneratedLaw, LawEmbedding
+from .search import filter_in_order
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: fall back to the hashing embedder
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+
+# Long bodies are cut before embedding; the opening sections carry the topic
+MAX_EMBEDDED_CHARS = 4000
+
+EMBEDDED_FIELDS = {'title', 'summary', 'tags', 'content'}
+
+# Relative weights of the hashed feature families
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.25
+
+_WORDS = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing its features into a fixed number of buckets.
+
+    Character trigrams let related word forms ("authenticate",
+    "authentication") share most of their weight. Deterministic across
+    processes, so stored vectors stay comparable after a restart.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        self.name = f'hashing-{dimensions}'
+
+    def _features(self, text: str) -> tuple:
+        """Distinct features of the text with their occurrence counts and family weights"""
+        tokens = _WORDS.findall(text.lower())
+        words = Counter(tokens)
+        trigrams = Counter()
+        for word, count in words.items():
+            padded = f'<{word}>'
+            for start in range(len(padded) - 2):
+                trigrams['#' + padded[start:start + 3]] += count
+        bigrams = Counter(f'{first} {second}' for first, second in zip(tokens, tokens[1:]))
+
+        features, counts, family_weights = [], [], []
+        for family, weight in ((words, WORD_WEIGHT), (trigrams, TRIGRAM_WEIGHT), (bigrams, BIGRAM_WEIGHT)):
+            features.extend(family)
+            counts.extend(family.values())
+            family_weights.extend([weight] * len(family))
+        return features, counts, family_weights
+
+    def encode(self, texts: list) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features, counts, family_weights = self._features(text)
+            if not features:
+                continue
+            digests = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                                  dtype=np.uint32, count=len(features))
+            # Sublinear term frequency, so repeated boilerplate does not dominate
+            weights = np.asarray(family_weights) * (1.0 + np.log(np.asarray(counts, dtype=np.float64)))
+            # The top bit picks a sign so collisions tend to cancel out
+            weights[(digests & 0x80000000) == 0] *= -1
+            vectors[row] = np.bincount(digests % self.dimensions, weights=weights, minlength=self.dimensions)
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """Embeds text with a sentence-transformers model loaded from local files"""
+
+    def __init__(self, model_name: str):
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, local_files_only=True)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list) -> np.ndarray:
+        vectors = self._model.encode(texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so a dot product is the cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Return the configured embedder, falling back to hashing when the model is unavailable"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                embedder = None
+                model_name = settings.LAW_EMBEDDING_MODEL
+                if model_name and SentenceTransformer is not None:
+                    try:
+                        embedder = SentenceTransformerEmbedder(model_name)
+                    except Exception:
+                        logger.exception("Could not load embedding model %s; using hashing", model_name)
+                elif model_name:
+                    logger.warning("sentence-transformers is not installed; using hashing embeddings")
+                _embedder = embedder or HashingEmbedder(settings.LAW_EMBEDDING_DIMENSIONS)
+    return _embedder
+
+
+def law_text(law: GeneratedLaw) -> str:
+    """The text a law is embedded from; the title is repeated to weigh it up"""
+    return '\n'.join([law.title, law.title, law.summary, law.tags, law.content[:MAX_EMBEDDED_CHARS]])
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def embed_laws(laws: list, force: bool = False) -> int:
+    """
+    Store embeddings for laws whose text changed since they were last embedded.
+    Returns the number of laws embedded.
+    """
+    embedder = get_embedder()
+    texts = {law.pk: law_text(law) for law in laws}
+    hashes = {pk: _content_hash(text) for pk, text in texts.items()}
+
+    existing = set()
+    current = LawEmbedding.objects.filter(law_id__in=list(texts))
+    for law_id, model, content_hash in current.values_list('law_id', 'model', 'content_hash'):
+        existing.add(law_id)
+        if not force and model == embedder.name and hashes[law_id] == content_hash:
+            del texts[law_id]
+    if not texts:
+        return 0
+
+    laws_by_id = {law.pk: law for law in laws}
+    vectors = embedder.encode(list(texts.values()))
+    # bulk_update skips auto_now, so the timestamp is set by hand
+    now = timezone.now()
+    embeddings = [
+        LawEmbedding(
+            law_id=law_id,
+            user_id=laws_by_id[law_id].user_id,
+            model=embedder.name,
+            content_hash=hashes[law_id],
+            vector=vector.tobytes(),
+            updated_at=now,
+        )
+        for law_id, vector in zip(texts, vectors)
+    ]
+    LawEmbedding.objects.bulk_create([e for e in embeddings if e.law_id not in existing])
+    LawEmbedding.objects.bulk_update(
+        [e for e in embeddings if e.law_id in existing],
+        ['user', 'model', 'content_hash', 'vector', 'updated_at']
+    )
+    return len(embeddings)
+
+
+class UserVectors:
+    """One user's law ids and their embeddings as a single (laws x dimensions) matrix"""
+
+    def __init__(self, law_ids: list, matrix: np.ndarray, stamp):
+        self.law_ids = law_ids
+        self.matrix = matrix
+        self.stamp = stamp
+
+    def top_k(self, query_vector: np.ndarray, k: int, min_score: float = 0.0) -> list:
+        """``(law_id, score)`` pairs for the k most similar laws, best first"""
+        if not self.law_ids or k <= 0:
+            return []
+        scores = self.matrix @ query_vector
+        if k < len(scores):
+            # Partial selection is linear; only the k winners get sorted
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[scores[candidates] >= min_score]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        law_ids = self.law_ids
+        return [(law_ids[i], score) for i, score in zip(ranked.tolist(), scores[ranked].tolist())]
+
+
+class VectorIndexCache:
+    """
+    Thread-safe LRU of per-user vector matrices.
+
+    Each lookup compares the newest embedding update for the user against the
+    cached matrix (a single index seek), so laws embedded or re-embedded by
+    other processes are picked up on the next search. Deleted laws can linger
+    in a cached matrix until then; search results are joined back to the law
+    table, which drops them.
+    """
+
+    def __init__(self, max_users: int = 64):
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user: User, model_name: str) -> UserVectors:
+        embeddings = LawEmbedding.objects.filter(user=user, model=model_name)
+        stamp = embeddings.aggregate(latest=Max('updated_at'))['latest']
+        key = (user.pk, model_name)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.stamp == stamp:
+                self._entries.move_to_end(key)
+                return cached
+
+        rows = list(embeddings.values_list('law_id', 'vector'))
+        law_ids = [law_id.hex for law_id, vector in rows]
+        if rows:
+            matrix = np.frombuffer(b''.join(bytes(vector) for law_id, vector in rows), dtype=np.float32)
+            matrix = matrix.reshape(len(rows), -1)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        vectors = UserVectors(law_ids, matrix, stamp)
+
+        with self._lock:
+            self._entries[key] = vectors
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return vectors
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+vector_cache = VectorIndexCache()
+
+
+def similar_law_ids(user: User, query: str, limit: int = None) -> list:
+    """``(law_id, score)`` pairs for the user's laws closest in meaning to ``query``"""
+    embedder = get_embedder()
+    vectors = vector_cache.get(user, embedder.name)
+    query_vector = embedder.encode([query])[0]
+    return vectors.top_k(query_vector, limit or settings.LAW_SEARCH_MAX_RESULTS,
+                         settings.LAW_SEMANTIC_MIN_SCORE)
+
+
+def semantic_queryset(queryset, user: User, query: str):
+    """Restrict a queryset of the user's laws to those similar to ``query``, most similar first"""
+    law_ids = [law_id for law_id, score in similar_law_ids(user, query)]
+    return filter_in_order(queryset, law_ids)
+
+
+def embed_saved_law(sender, instance, raw=False, **kwargs):
+    """post_save receiver that keeps a law's embedding in step with its text"""
+    if raw or not settings.LAW_EMBEDDINGS_ON_SAVE:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & EMBEDDED_FIELDS:
+        return
+    try:
+        # A savepoint, so a failed write here does not break the caller's transaction
+        with transaction.atomic():
+            embed_laws([instance])
+    except Exception:
+        # The embed_laws command catches up on anything missed here
+        logger.exception("Could not embed law %s", instance.pk)
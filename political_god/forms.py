@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column, Field, HTML, Div
 from crispy_forms.bootstrap import FormActions
@@ -105,6 +106,18 @@ class LawGenerationForm(forms.Form):
         help_text='Leave blank to let AI suggest the best category'
     )
     
+    bypass_cache = forms.BooleanField(
+        required=False,
+        label='Generate a fresh draft',
+        help_text='Ignore previously generated answers to this exact prompt'
+    )
+    
+    # Set once the user has seen their near-duplicate laws and wants a new one anyway
+    allow_duplicate = forms.BooleanField(
+        required=False,
+        widget=forms.HiddenInput()
+    )
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.helper = FormHelper()
@@ -116,6 +129,8 @@ class LawGenerationForm(forms.Form):
             
             Field('prompt', css_class='mb-3'),
             Field('category', css_class='mb-3'),
+            Field('bypass_cache', css_class='mb-3'),
+            'allow_duplicate',
             
             FormActions(
                 Submit('generate', 'Generate Law (10 Credits)', css_class='btn btn-primary btn-lg'),
@@ -125,6 +140,81 @@ class LawGenerationForm(forms.Form):
         )
 
 
+class BatchLawGenerationForm(forms.Form):
+    """Form for generating several laws in one request"""
+    
+    prompts = forms.CharField(
+        widget=forms.Textarea(attrs={
+            'placeholder': 'One law per line. Optionally prefix a line with a category, e.g.\n'
+                           'Economic: Create a flat tax on land value...\n'
+                           'Technology: Regulate autonomous vehicles...',
+            'rows': 10,
+            'class': 'form-control'
+        }),
+        label='Law Descriptions',
+        help_text='Write one law description per line. Prefix a line with "Category:" to file it under that category.'
+    )
+    
+    category = forms.ModelChoiceField(
+        queryset=LawCategory.objects.all(),
+        required=False,
+        empty_label='Auto-detect category',
+        help_text='Default category for lines without a category prefix'
+    )
+    
+    bypass_cache = forms.BooleanField(
+        required=False,
+        label='Generate fresh drafts',
+        help_text='Ignore previously generated answers to these exact prompts'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.layout = Layout(
+            HTML('<div class="law-generation-form">'),
+            HTML('<h4 class="mb-3"><i class="fas fa-layer-group text-primary me-2"></i>Generate a Legal Code</h4>'),
+            HTML('<div class="alert alert-info"><i class="fas fa-info-circle me-2"></i>Each law costs <strong>10 credits</strong>. Credits for laws that fail are refunded.</div>'),
+            
+            Field('prompts', css_class='mb-3'),
+            Field('category', css_class='mb-3'),
+            Field('bypass_cache', css_class='mb-3'),
+            
+            FormActions(
+                Submit('generate', 'Generate Laws', css_class='btn btn-primary btn-lg'),
+                css_class='d-grid'
+            ),
+            HTML('</div>')
+        )
+    
+    def clean_prompts(self):
+        """Split the textarea into ``(category_name, prompt)`` pairs"""
+        max_batch_size = getattr(settings, 'LAW_BATCH_MAX_SIZE', 25)
+        categories = {category.name.lower(): category for category in LawCategory.objects.all()}
+        
+        items = []
+        for line in self.cleaned_data['prompts'].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            
+            category = None
+            prefix, separator, rest = line.partition(':')
+            if separator and prefix.strip().lower() in categories:
+                category = categories[prefix.strip().lower()]
+                line = rest.strip()
+            
+            if line:
+                items.append({'prompt': line, 'category': category})
+        
+        if not items:
+            raise forms.ValidationError('Enter at least one law description.')
+        if len(items) > max_batch_size:
+            raise forms.ValidationError(f'A batch can contain at most {max_batch_size} laws.')
+        return items
+
+
 class LawSearchForm(forms.Form):
     """Form for searching through generated laws"""
     
@@ -143,6 +233,16 @@ class LawSearchForm(forms.Form):
         empty_label='All categories'
     )
     
+    mode = forms.ChoiceField(
+        choices=[
+            ('keyword', 'Keywords'),
+            ('semantic', 'Meaning (semantic)'),
+        ],
+        required=False,
+        initial='keyword',
+        label='Match by'
+    )
+    
     is_favorite = forms.BooleanField(
         required=False,
         label='Favorites only'
@@ -153,6 +253,12 @@ class LawSearchForm(forms.Form):
         label='Implemented only'
     )
     
+    # Keeps the selected tag facet across searches
+    tag = forms.CharField(
+        required=False,
+        widget=forms.HiddenInput()
+    )
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.helper = FormHelper()
@@ -174,15 +280,54 @@ class LawSearchForm(forms.Form):
             ),
             
             Row(
-                Column('is_favorite', css_class='col-md-6'),
-                Column('is_implemented', css_class='col-md-6'),
+                Column('mode', css_class='col-md-4'),
+                Column('is_favorite', css_class='col-md-4'),
+                Column('is_implemented', css_class='col-md-4'),
                 css_class='form-row mt-2'
             ),
+            'tag',
             
             HTML('</div>')
         )
 
 
+class PublicLawSearchForm(forms.Form):
+    """Form for searching laws other users have published"""
+    
+    q = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={
+            'placeholder': 'Search published laws...',
+            'class': 'form-control'
+        }),
+        label='Search Query'
+    )
+    
+    category = forms.ModelChoiceField(
+        queryset=LawCategory.objects.all(),
+        required=False,
+        empty_label='All categories'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'get'
+        self.helper.layout = Layout(
+            Row(
+                Column('q', css_class='col-md-6'),
+                Column('category', css_class='col-md-3'),
+                Column(
+                    FormActions(
+                        Submit('search', 'Search', css_class='btn btn-primary')
+                    ),
+                    css_class='col-md-3 d-flex align-items-end'
+                ),
+                css_class='form-row'
+            )
+        )
+
+
 class LawEditForm(forms.ModelForm):
     """Form for editing generated laws"""
     
@@ -316,6 +461,19 @@ class AIConstitutionForm(forms.Form):
         label='Special Focus Areas'
     )
     
+    parallel_sections = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Write sections in parallel',
+        help_text='Generate the preamble, rights, structure and amendment process at the same time from a shared outline'
+    )
+    
+    bypass_cache = forms.BooleanField(
+        required=False,
+        label='Generate a fresh draft',
+        help_text='Ignore previously generated answers to these exact requirements'
+    )
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.helper = FormHelper()
@@ -333,6 +491,8 @@ class AIConstitutionForm(forms.Form):
             ),
             
             Field('focus_areas', css_class='mb-3'),
+            Field('parallel_sections', css_class='mb-3'),
+            Field('bypass_cache', css_class='mb-3'),
             
             FormActions(
                 Submit('generate', 'Generate Constitution (50 Credits)', css_class='btn btn-success btn-lg'),
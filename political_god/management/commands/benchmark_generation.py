@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from political_god.budget import plan_completion
+from political_god.metrics import generation_metrics
+from political_god.providers import get_provider
+from political_god.services import PoliticalGodAI
+from political_god.structured import LAW_SCHEMA
+
+
+class Command(BaseCommand):
+    help = 'Measure law generation latency and throughput against an LLM provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Number of generations to run')
+        parser.add_argument('--concurrency', type=int, default=10, help='Generations in flight at once')
+        parser.add_argument('--provider', default='fake', help='Provider to benchmark (default: fake)')
+        parser.add_argument(
+            '--user',
+            help='Username to run full generate_law for (writes laws and uses credits). '
+                 'Without it only the provider call is measured.'
+        )
+
+    def handle(self, *args, **options):
+        ai_service = PoliticalGodAI(provider=get_provider(options['provider']))
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        def run(index):
+            prompt = f"Benchmark law number {index} on digital residency and data rights."
+            start = time.perf_counter()
+            try:
+                if user:
+                    result = ai_service.generate_law(user, prompt, use_cache=False)
+                    ok = result['success']
+                else:
+                    system_prompt = 'You are the Political God LLM.'
+                    messages = ai_service._build_law_messages(prompt, system_prompt)
+                    budget = plan_completion(messages, 'law', ai_service.model)
+                    ai_response, _ = ai_service._chat_completion(
+                        messages, temperature=0.7, max_tokens=budget.max_tokens, use_cache=False,
+                        json_schema=LAW_SCHEMA
+                    )
+                    ai_service._parse_law_response(ai_response)
+                    ok = True
+            except Exception:
+                ok = False
+            return ok, time.perf_counter() - start
+
+        self.stdout.write(
+            f"Running {options['requests']} generations with concurrency {options['concurrency']} "
+            f"against '{options['provider']}'..."
+        )
+
+        generation_metrics.reset()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(run, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results)
+        errors = sum(1 for ok, latency in results if not ok)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] if latencies else 0
+
+        self.stdout.write(f"  Completed:  {len(results) - errors}")
+        self.stdout.write(f"  Errors:     {errors}")
+        self.stdout.write(f"  Wall time:  {elapsed:.2f}s")
+        self.stdout.write(f"  Throughput: {len(results) / elapsed:.2f} generations/s")
+        self.stdout.write(f"  p50:        {percentile(50) * 1000:.0f} ms")
+        self.stdout.write(f"  p95:        {percentile(95) * 1000:.0f} ms")
+        self.stdout.write(f"  p99:        {percentile(99) * 1000:.0f} ms")
+
+        parse_metrics = generation_metrics.snapshot()
+        self.stdout.write(f"  Parse fallback rate: {parse_metrics['fallback_rate']:.1%}")
+        for bucket, timing in parse_metrics['parse_time_by_reply_tokens'].items():
+            if timing['count']:
+                self.stdout.write(
+                    f"  Parse time ({bucket} tokens): p50 {timing['p50_ms']:.2f} ms, "
+                    f"p95 {timing['p95_ms']:.2f} ms over {timing['count']} replies"
+                )
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,92 @@
+from collections import defaultdict
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from political_god.dedup import fingerprint_law, similarity
+from political_god.models import GeneratedLaw, LawFingerprint, LawFingerprintBucket
+
+
+class Command(BaseCommand):
+    help = 'Fingerprint laws that are missing one and report clusters of near-duplicate laws'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only cluster this user\'s library')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimum estimated similarity (default: LAW_DUPLICATE_THRESHOLD)')
+        parser.add_argument('--skip-backfill', action='store_true', help='Only cluster existing fingerprints')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold'] or settings.LAW_DUPLICATE_THRESHOLD
+        users = User.objects.filter(generated_laws__isnull=False).distinct()
+        if options['user']:
+            users = User.objects.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        for user in users:
+            if not options['skip_backfill']:
+                fingerprinted = LawFingerprint.objects.filter(user=user, kind='content').values('law_id')
+                missing = GeneratedLaw.objects.filter(user=user).exclude(pk__in=fingerprinted)
+                count = 0
+                for law in missing.iterator(chunk_size=500):
+                    fingerprint_law(law)
+                    count += 1
+                if count:
+                    self.stdout.write(f"{user.username}: fingerprinted {count} law(s)")
+
+            clusters = self.cluster(user, threshold)
+            if not clusters:
+                continue
+
+            titles = dict(GeneratedLaw.objects.filter(
+                pk__in=[law_id for cluster in clusters for law_id in cluster]
+            ).values_list('id', 'title'))
+            self.stdout.write(self.style.WARNING(
+                f"{user.username}: {len(clusters)} cluster(s) of near-duplicate laws"
+            ))
+            for cluster in clusters:
+                self.stdout.write(f"  {len(cluster)} laws:")
+                for law_id in cluster:
+                    self.stdout.write(f"    {law_id}  {titles.get(law_id, '')}")
+
+        self.stdout.write(self.style.SUCCESS('Clustering complete'))
+
+    def cluster(self, user, threshold: float) -> list:
+        """Groups of laws linked by a shared LSH bucket and a similarity above the threshold"""
+        fingerprints = LawFingerprint.objects.filter(user=user, kind='content')
+        signatures = {
+            fingerprint_id: (law_id, np.frombuffer(bytes(sig), dtype=np.uint32))
+            for fingerprint_id, law_id, sig in fingerprints.values_list('id', 'law_id', 'signature')
+        }
+
+        buckets = defaultdict(list)
+        rows = LawFingerprintBucket.objects.filter(user=user, fingerprint__kind='content')
+        for bucket, fingerprint_id in rows.values_list('bucket', 'fingerprint_id'):
+            buckets[bucket].append(fingerprint_id)
+
+        parent = {fingerprint_id: fingerprint_id for fingerprint_id in signatures}
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        checked = set()
+        for members in buckets.values():
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    pair = (min(first, second), max(first, second))
+                    if pair in checked or first not in signatures or second not in signatures:
+                        continue
+                    checked.add(pair)
+                    if similarity(signatures[first][1], signatures[second][1]) >= threshold:
+                        parent[find(first)] = find(second)
+
+        groups = defaultdict(list)
+        for fingerprint_id in signatures:
+            groups[find(fingerprint_id)].append(signatures[fingerprint_id][0])
+        return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from political_god.embeddings import embed_laws, get_embedder
+from political_god.models import GeneratedLaw
+
+
+class Command(BaseCommand):
+    help = 'Compute semantic search embeddings for laws that are missing or out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only embed this user\'s laws')
+        parser.add_argument('--batch-size', type=int, default=256, help='Laws embedded per batch')
+        parser.add_argument('--force', action='store_true', help='Re-embed laws even when unchanged')
+
+    def handle(self, *args, **options):
+        laws = GeneratedLaw.objects.only('id', 'user_id', 'title', 'summary', 'tags', 'content').order_by('pk')
+        if options['user']:
+            try:
+                laws = laws.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        self.stdout.write(f"Embedding laws with '{get_embedder().name}'...")
+        embedded = 0
+        batch = []
+        for law in laws.iterator(chunk_size=options['batch_size']):
+            batch.append(law)
+            if len(batch) >= options['batch_size']:
+                embedded += embed_laws(batch, force=options['force'])
+                batch = []
+        if batch:
+            embedded += embed_laws(batch, force=options['force'])
+
+        self.stdout.write(self.style.SUCCESS(f'Embedded {embedded} law(s)'))
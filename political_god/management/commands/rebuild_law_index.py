@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from political_god.search import ensure_law_index, supports_fts
+
+
+class Command(BaseCommand):
+    help = 'Create (if needed) and rebuild the full-text search index for generated laws'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not supports_fts(using):
+            self.stdout.write(self.style.WARNING(
+                'Full-text search needs SQLite; this database uses substring search instead'
+            ))
+            return
+
+        if ensure_law_index(using, rebuild=True):
+            self.stdout.write(self.style.SUCCESS('Law search index rebuilt'))
+        else:
+            self.stdout.write(self.style.ERROR('Could not create the index (is FTS5 available?)'))
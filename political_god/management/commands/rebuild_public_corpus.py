@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from political_god.corpus import UNCATEGORIZED, rebuild_partition
+from political_god.models import LawCategory
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the public law corpus index, one category partition at a time, without blocking searches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help='Only rebuild this category\'s partition (name, or "none")')
+
+    def handle(self, *args, **options):
+        name = options['category']
+        if name is None:
+            category_ids = [UNCATEGORIZED, *LawCategory.objects.values_list('pk', flat=True)]
+        elif name.lower() == 'none':
+            category_ids = [UNCATEGORIZED]
+        else:
+            try:
+                category_ids = [LawCategory.objects.get(name=name).pk]
+            except LawCategory.DoesNotExist:
+                raise CommandError(f"Category '{name}' does not exist")
+
+        total = 0
+        for category_id in category_ids:
+            count = rebuild_partition(category_id)
+            total += count
+            self.stdout.write(f'Partition {category_id}: {count} law(s)')
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} published law(s) in {len(category_ids)} partition(s)'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from political_god.rollups import prune_hourly_rollups, rebuild_rollups, rollup_searches
+
+
+class Command(BaseCommand):
+    help = 'Fold new law searches into the hourly and daily analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the rollups and fold the whole search log again')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            folded = rebuild_rollups()
+        else:
+            folded = rollup_searches()
+        pruned = prune_hourly_rollups()
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {folded} search(es); pruned {pruned} old hourly row(s)'))
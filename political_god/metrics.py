@@ -0,0 +1,72 @@
+"""
+In-process generation metrics.
+
+Counters live in the worker process that did the work, like the response
+cache stats, and are reset on restart. They are exposed to staff through the
+``api_metrics`` view and printed by the ``benchmark_generation`` command.
+"""
+import threading
+from collections import deque
+
+
+# Reply sizes (in tokens) that parse timings are grouped by
+PARSE_SIZE_BUCKETS = (500, 2000)
+
+
+def _percentile(values: list, p: int) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class GenerationMetrics:
+    """Thread-safe counters for law reply parsing"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max_samples)
+        self.parsed = 0
+        self.fallbacks = 0
+
+    def record_parse(self, seconds: float, reply_tokens: int, fallback: bool):
+        """Record one parsed reply and whether it fell back to the raw text"""
+        with self._lock:
+            self.parsed += 1
+            if fallback:
+                self.fallbacks += 1
+            self._samples.append((reply_tokens, seconds))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.parsed = 0
+            self.fallbacks = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = list(self._samples)
+            parsed, fallbacks = self.parsed, self.fallbacks
+
+        buckets = {}
+        lower = 0
+        for upper in PARSE_SIZE_BUCKETS + (None,):
+            label = f'{lower}+' if upper is None else f'{lower}-{upper - 1}'
+            timings = [seconds for tokens, seconds in samples
+                       if tokens >= lower and (upper is None or tokens < upper)]
+            buckets[label] = {
+                'count': len(timings),
+                'p50_ms': round(_percentile(timings, 50) * 1000, 3),
+                'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+            }
+            lower = upper
+
+        return {
+            'parsed': parsed,
+            'fallbacks': fallbacks,
+            'fallback_rate': fallbacks / parsed if parsed else 0.0,
+            'parse_time_by_reply_tokens': buckets,
+        }
+
+
+generation_metrics = GenerationMetrics()
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0002_generationjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generationjob',
+            name='job_type',
+            field=models.CharField(choices=[('law', 'Law Generation'), ('law_batch', 'Batch Law Generation'), ('constitution', 'Constitution Generation')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0003_alter_generationjob_job_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lawgenerationrequest',
+            name='estimated_prompt_tokens',
+            field=models.IntegerField(blank=True, help_text='Prompt tokens counted before the call', null=True),
+        ),
+        migrations.AddField(
+            model_name='lawgenerationrequest',
+            name='max_tokens',
+            field=models.IntegerField(blank=True, help_text='Completion allowance sent with the request', null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0004_lawgenerationrequest_token_estimates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uservalues',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SystemPromptSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the content', max_length=64)),
+                ('content', models.TextField()),
+                ('values_version', models.PositiveIntegerField(default=0, help_text='UserValues version the prompt was rendered from (0 if unknown)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prompt_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='generatedlaw',
+            name='prompt_snapshot',
+            field=models.ForeignKey(blank=True, help_text='The system prompt (user values) used', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='laws', to='political_god.systempromptsnapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='systempromptsnapshot',
+            index=models.Index(fields=['user', 'values_version'], name='political_g_user_id_9e96b5_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='systempromptsnapshot',
+            constraint=models.UniqueConstraint(fields=('user', 'content_hash'), name='unique_prompt_snapshot_per_user'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+import hashlib
+
+from django.db import migrations
+
+
+def move_prompts_to_snapshots(apps, schema_editor):
+    """Store each distinct law system prompt once and point the laws at it"""
+    GeneratedLaw = apps.get_model('political_god', 'GeneratedLaw')
+    SystemPromptSnapshot = apps.get_model('political_god', 'SystemPromptSnapshot')
+
+    snapshot_ids = {}
+    batch = []
+    laws = GeneratedLaw.objects.exclude(system_prompt='').only('id', 'user_id', 'system_prompt')
+    for law in laws.iterator(chunk_size=500):
+        content_hash = hashlib.sha256(law.system_prompt.encode('utf-8')).hexdigest()
+        key = (law.user_id, content_hash)
+        if key not in snapshot_ids:
+            snapshot, created = SystemPromptSnapshot.objects.get_or_create(
+                user_id=law.user_id, content_hash=content_hash,
+                defaults={'content': law.system_prompt, 'values_version': 0}
+            )
+            snapshot_ids[key] = snapshot.id
+
+        law.prompt_snapshot_id = snapshot_ids[key]
+        batch.append(law)
+        if len(batch) >= 500:
+            GeneratedLaw.objects.bulk_update(batch, ['prompt_snapshot'])
+            batch = []
+
+    if batch:
+        GeneratedLaw.objects.bulk_update(batch, ['prompt_snapshot'])
+
+
+def restore_prompts_from_snapshots(apps, schema_editor):
+    GeneratedLaw = apps.get_model('political_god', 'GeneratedLaw')
+
+    batch = []
+    laws = GeneratedLaw.objects.filter(prompt_snapshot__isnull=False).select_related('prompt_snapshot')
+    for law in laws.iterator(chunk_size=500):
+        law.system_prompt = law.prompt_snapshot.content
+        batch.append(law)
+        if len(batch) >= 500:
+            GeneratedLaw.objects.bulk_update(batch, ['system_prompt'])
+            batch = []
+
+    if batch:
+        GeneratedLaw.objects.bulk_update(batch, ['system_prompt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0005_system_prompt_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_prompts_to_snapshots, restore_prompts_from_snapshots),
+    ]
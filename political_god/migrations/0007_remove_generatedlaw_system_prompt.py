@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0006_move_law_system_prompts_to_snapshots'),
+    ]
+
+    operations = [
+        # A default first, so reversing can add the column back before the text is restored
+        migrations.AlterField(
+            model_name='generatedlaw',
+            name='system_prompt',
+            field=models.TextField(blank=True, default='', help_text='The system prompt (user values) used'),
+        ),
+        migrations.RemoveField(
+            model_name='generatedlaw',
+            name='system_prompt',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0007_remove_generatedlaw_system_prompt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LawTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('law', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='law_tags', to='political_god.generatedlaw')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='law_tags', to=settings.AUTH_USER_MODEL)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='law_tags', to='political_god.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='generatedlaw',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='laws', through='political_god.LawTag', to='political_god.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='lawtag',
+            index=models.Index(fields=['user', 'tag'], name='political_g_user_id_df2159_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lawtag',
+            constraint=models.UniqueConstraint(fields=('law', 'tag'), name='unique_law_tag'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def normalize(name):
+    return ' '.join(name.split()).lower()[:50]
+
+
+def populate_tags(apps, schema_editor):
+    """Create Tag and LawTag rows from the comma-separated tag strings"""
+    GeneratedLaw = apps.get_model('political_god', 'GeneratedLaw')
+    Tag = apps.get_model('political_god', 'Tag')
+    LawTag = apps.get_model('political_god', 'LawTag')
+
+    law_tags = []
+    names = set()
+    for law in GeneratedLaw.objects.exclude(tags='').only('id', 'user_id', 'tags').iterator(chunk_size=1000):
+        law_names = {normalize(part) for part in law.tags.split(',')} - {''}
+        names |= law_names
+        law_tags.extend((law.id, law.user_id, name) for name in law_names)
+
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.values_list('name', 'id'))
+
+    LawTag.objects.bulk_create(
+        [LawTag(law_id=law_id, user_id=user_id, tag_id=tag_ids[name]) for law_id, user_id, name in law_tags],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0008_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0009_populate_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LawEmbedding',
+            fields=[
+                ('law', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='political_god.generatedlaw')),
+                ('model', models.CharField(help_text='Embedder that produced the vector', max_length=100)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the embedded text', max_length=64)),
+                ('vector', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='law_embeddings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'model', 'updated_at'], name='political_g_user_id_c0ee0b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('political_god', '0010_law_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchGeneration',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_generation', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0011_search_generation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedlaw',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='political_g_user_id_ae128c_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0012_law_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LawFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('prompt', 'Prompt'), ('content', 'Law text')], max_length=10)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the fingerprinted text', max_length=64)),
+                ('signature', models.BinaryField()),
+                ('law', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='political_god.generatedlaw')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='law_fingerprints', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LawFingerprintBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='political_god.lawfingerprint')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='lawfingerprint',
+            constraint=models.UniqueConstraint(fields=('law', 'kind'), name='unique_law_fingerprint'),
+        ),
+        migrations.AddIndex(
+            model_name='lawfingerprintbucket',
+            index=models.Index(fields=['user', 'bucket'], name='political_g_user_id_1f0548_idx'),
+        ),
+    ]
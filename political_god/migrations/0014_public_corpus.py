@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:22
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0013_law_fingerprints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedlaw',
+            name='is_published',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PublishedLaw',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('summary', models.TextField(blank=True)),
+                ('tags', models.CharField(blank=True, max_length=500)),
+                ('content', models.TextField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('fork_count', models.PositiveIntegerField(default=0)),
+                ('published_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='published_laws', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='political_god.lawcategory')),
+                ('source_law', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='publication', to='political_god.generatedlaw')),
+            ],
+            options={
+                'ordering': ['-published_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='generatedlaw',
+            name='forked_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='forks', to='political_god.publishedlaw'),
+        ),
+        migrations.AddIndex(
+            model_name='publishedlaw',
+            index=models.Index(fields=['category', 'is_active'], name='political_g_categor_24039e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publishedlaw',
+            index=models.Index(fields=['updated_at'], name='political_g_updated_56c8ed_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0014_public_corpus'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('query', models.CharField(max_length=500)),
+                ('searches', models.PositiveIntegerField(default=0)),
+                ('zero_result_searches', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-period_start', '-searches'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('searches', models.PositiveIntegerField(default=0)),
+                ('zero_result_searches', models.PositiveIntegerField(default=0)),
+                ('total_results', models.PositiveBigIntegerField(default=0)),
+                ('result_histogram', models.JSONField(default=list, help_text='Searches per RESULT_BUCKETS bucket')),
+                ('timed_searches', models.PositiveIntegerField(default=0)),
+                ('total_latency_ms', models.PositiveBigIntegerField(default=0)),
+                ('max_latency_ms', models.PositiveIntegerField(default=0)),
+                ('latency_histogram', models.JSONField(default=list, help_text='Searches per LATENCY_BUCKETS_MS bucket')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water_mark', models.DateTimeField(help_text='Searches logged before this are in the rollups')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='lawsearch',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Time taken to run the search', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lawsearch',
+            index=models.Index(fields=['created_at'], name='political_g_created_f270ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lawsearch',
+            index=models.Index(fields=['user', 'created_at'], name='political_g_user_id_6ccfb3_idx'),
+        ),
+        migrations.AddField(
+            model_name='searchqueryrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_query_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='searchrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='searchqueryrollup',
+            index=models.Index(fields=['period', 'period_start'], name='political_g_period_0dd8fe_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchqueryrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'period_start', 'query'), name='unique_search_query_rollup'),
+        ),
+        migrations.AddIndex(
+            model_name='searchrollup',
+            index=models.Index(fields=['period', 'period_start'], name='political_g_period_239f8c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'period_start'), name='unique_search_rollup'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('political_god', '0015_search_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lawsearch',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+import hashlib
 import uuid
 
 
@@ -73,15 +75,46 @@ class UserValues(models.Model):
         blank=True
     )
     
+    # Bumped whenever a field that feeds the system prompt changes
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_prompt_inputs = self._prompt_inputs()
+    
     def __str__(self):
         return f"{self.user.username}'s Values & Principles"
     
+    def save(self, *args, **kwargs):
+        if self.pk and self._prompt_inputs() != self._loaded_prompt_inputs:
+            self.version += 1
+        super().save(*args, **kwargs)
+        self._loaded_prompt_inputs = self._prompt_inputs()
+    
+    def _prompt_inputs(self):
+        # Read from __dict__ so deferred fields are not loaded just to compare them
+        return tuple(self.__dict__.get(name) for name in self.PROMPT_TEXT_FIELDS + self.PROMPT_CHOICE_FIELDS)
+    
+    # Free-text fields included in the system prompt (and trimmed when too long)
+    PROMPT_TEXT_FIELDS = [
+        'political_philosophy', 'core_values', 'priority_areas', 'individual_rights',
+        'collective_responsibilities', 'cultural_considerations',
+    ]
+    PROMPT_CHOICE_FIELDS = ['governance_style', 'economic_system']
+    
     @property
     def system_prompt(self):
         """Generate a comprehensive system prompt for the AI based on user values"""
+        return self.render_system_prompt()
+    
+    def render_system_prompt(self, overrides=None):
+        """Build the system prompt, optionally replacing some free-text fields"""
+        values = {name: getattr(self, name) for name in self.PROMPT_TEXT_FIELDS}
+        values.update(overrides or {})
+        
         prompt_parts = [
             "You are the Political God LLM, an advanced AI system designed to generate laws for a futuristic network state.",
             "Generate laws that are:",
@@ -94,31 +127,58 @@ class UserValues(models.Model):
             "USER'S VALUES AND PRINCIPLES:",
         ]
         
-        if self.political_philosophy:
-            prompt_parts.append(f"Political Philosophy: {self.political_philosophy}")
+        if values['political_philosophy']:
+            prompt_parts.append(f"Political Philosophy: {values['political_philosophy']}")
         
-        if self.core_values:
-            prompt_parts.append(f"Core Values: {self.core_values}")
+        if values['core_values']:
+            prompt_parts.append(f"Core Values: {values['core_values']}")
         
         prompt_parts.append(f"Governance Style: {self.get_governance_style_display()}")
         
-        if self.priority_areas:
-            prompt_parts.append(f"Priority Areas: {self.priority_areas}")
+        if values['priority_areas']:
+            prompt_parts.append(f"Priority Areas: {values['priority_areas']}")
         
-        if self.individual_rights:
-            prompt_parts.append(f"Individual Rights: {self.individual_rights}")
+        if values['individual_rights']:
+            prompt_parts.append(f"Individual Rights: {values['individual_rights']}")
         
-        if self.collective_responsibilities:
-            prompt_parts.append(f"Collective Responsibilities: {self.collective_responsibilities}")
+        if values['collective_responsibilities']:
+            prompt_parts.append(f"Collective Responsibilities: {values['collective_responsibilities']}")
         
         prompt_parts.append(f"Economic System: {self.get_economic_system_display()}")
         
-        if self.cultural_considerations:
-            prompt_parts.append(f"Cultural Considerations: {self.cultural_considerations}")
+        if values['cultural_considerations']:
+            prompt_parts.append(f"Cultural Considerations: {values['cultural_considerations']}")
         
         return "\n".join(prompt_parts)
 
 
+class SystemPromptSnapshot(models.Model):
+    """A rendered system prompt, stored once and shared by every generation that used it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prompt_snapshots')
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the content")
+    content = models.TextField()
+    values_version = models.PositiveIntegerField(
+        default=0, help_text="UserValues version the prompt was rendered from (0 if unknown)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='unique_prompt_snapshot_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'values_version']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} v{self.values_version} ({self.content_hash[:8]})"
+    
+    @staticmethod
+    def hash_content(content: str) -> str:
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
 class LawCategory(models.Model):
     """Categories for organizing laws"""
     name = models.CharField(max_length=100, unique=True)
@@ -134,8 +194,45 @@ class LawCategory(models.Model):
         return self.name
 
 
+class Tag(models.Model):
+    """A normalized tag shared by all laws (lowercase, single-spaced)"""
+    name = models.CharField(max_length=50, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @staticmethod
+    def normalize(name: str) -> str:
+        return ' '.join(name.split()).lower()[:50]
+    
+    @classmethod
+    def parse(cls, text: str) -> list:
+        """Split a comma-separated string into unique normalized tag names, in order"""
+        names = []
+        for part in (text or '').split(','):
+            name = cls.normalize(part)
+            if name and name not in names:
+                names.append(name)
+        return names
+    
+    @classmethod
+    def get_or_create_many(cls, names: list) -> dict:
+        """Return ``{name: Tag}`` for the given normalized names, creating missing ones"""
+        if not names:
+            return {}
+        cls.objects.bulk_create([cls(name=name) for name in names], ignore_conflicts=True)
+        return {tag.name: tag for tag in cls.objects.filter(name__in=names)}
+
+
 class GeneratedLaw(models.Model):
     """Stores AI-generated laws"""
+    # Large text columns that list views and cards never show
+    LIST_DEFERRED_FIELDS = ('content', 'prompt_used', 'implementation_notes')
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generated_laws')
     
@@ -148,15 +245,25 @@ class GeneratedLaw(models.Model):
     # Generation Context
     prompt_used = models.TextField(help_text="The prompt that generated this law")
     ai_model = models.CharField(max_length=50, default='gpt-4')
-    system_prompt = models.TextField(help_text="The system prompt (user values) used")
+    prompt_snapshot = models.ForeignKey(
+        SystemPromptSnapshot, on_delete=models.PROTECT, null=True, blank=True,
+        related_name='laws', help_text="The system prompt (user values) used"
+    )
     
     # Metadata
     is_favorite = models.BooleanField(default=False)
     is_implemented = models.BooleanField(default=False)
     implementation_notes = models.TextField(blank=True)
     
-    # Tags for better organization
+    # Public corpus: whether a copy is published, and the public law this one was forked from
+    is_published = models.BooleanField(default=False)
+    forked_from = models.ForeignKey(
+        'PublishedLaw', on_delete=models.SET_NULL, null=True, blank=True, related_name='forks'
+    )
+    
+    # Tags for better organization: the editable string, mirrored into tag_set on save
     tags = models.CharField(max_length=500, blank=True, help_text="Comma-separated tags")
+    tag_set = models.ManyToManyField(Tag, through='LawTag', related_name='laws', blank=True)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -164,6 +271,154 @@ class GeneratedLaw(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's library on (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_tags = self.__dict__.get('tags')
+    
+    def __str__(self):
+        return self.title
+    
+    def save(self, *args, **kwargs):
+        tags_changed = self._state.adding or self.__dict__.get('tags') != self._loaded_tags
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if tags_changed:
+                self.sync_tags()
+        self._loaded_tags = self.tags
+    
+    def sync_tags(self):
+        """Bring the normalized tag rows in line with the ``tags`` string"""
+        names = Tag.parse(self.tags)
+        tags = Tag.get_or_create_many(names)
+        
+        LawTag.objects.filter(law=self).exclude(tag__name__in=names).delete()
+        LawTag.objects.bulk_create(
+            [LawTag(law=self, tag=tags[name], user_id=self.user_id) for name in names],
+            ignore_conflicts=True
+        )
+    
+    @property
+    def tag_list(self):
+        """Return tags as a list"""
+        return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
+    
+    @property
+    def system_prompt(self):
+        """The system prompt text this law was generated with"""
+        return self.prompt_snapshot.content if self.prompt_snapshot_id else ''
+
+
+class LawTag(models.Model):
+    """Through table between laws and tags; the owner is copied in so facets need no join"""
+    # law and user need no indexes of their own: the unique (law, tag) and the
+    # (user, tag) indexes cover lookups by either
+    law = models.ForeignKey(GeneratedLaw, on_delete=models.CASCADE, related_name='law_tags', db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='law_tags')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='law_tags', db_index=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['law', 'tag'], name='unique_law_tag'),
+        ]
+        indexes = [
+            # Covers per-user facet counts and tag filters
+            models.Index(fields=['user', 'tag']),
+        ]
+    
+    def __str__(self):
+        return f"{self.law_id}: {self.tag_id}"
+
+
+class LawEmbedding(models.Model):
+    """A law's semantic search vector, stored as raw float32 bytes"""
+    law = models.OneToOneField(GeneratedLaw, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    # Copied from the law so a user's vectors load without a join
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='law_embeddings', db_index=False)
+    model = models.CharField(max_length=100, help_text="Embedder that produced the vector")
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the embedded text")
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Covers loading a user's vectors and the freshness check on the cached matrix
+            models.Index(fields=['user', 'model', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.law_id} ({self.model})"
+
+
+class LawFingerprint(models.Model):
+    """MinHash signature of a law's prompt or text, for near-duplicate lookups"""
+    KIND_CHOICES = [
+        ('prompt', 'Prompt'),
+        ('content', 'Law text'),
+    ]
+    
+    law = models.ForeignKey(GeneratedLaw, on_delete=models.CASCADE, related_name='fingerprints', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='law_fingerprints', db_index=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the fingerprinted text")
+    signature = models.BinaryField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['law', 'kind'], name='unique_law_fingerprint'),
+        ]
+    
+    def __str__(self):
+        return f"{self.law_id} ({self.kind})"
+
+
+class LawFingerprintBucket(models.Model):
+    """One LSH band of a fingerprint; fingerprints sharing a bucket are duplicate candidates"""
+    fingerprint = models.ForeignKey(LawFingerprint, on_delete=models.CASCADE, related_name='buckets')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    bucket = models.BigIntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'bucket']),
+        ]
+
+
+class PublishedLaw(models.Model):
+    """
+    A law a user has shared with everyone. The text is a copy taken when it was
+    (re)published, so later edits stay private until published again.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    source_law = models.OneToOneField(
+        GeneratedLaw, on_delete=models.SET_NULL, null=True, blank=True, related_name='publication'
+    )
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='published_laws')
+    category = models.ForeignKey(LawCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    title = models.CharField(max_length=200)
+    summary = models.TextField(blank=True)
+    tags = models.CharField(max_length=500, blank=True)
+    content = models.TextField()
+    
+    # Withdrawn laws keep their row so forks still point somewhere
+    is_active = models.BooleanField(default=True)
+    fork_count = models.PositiveIntegerField(default=0)
+    
+    published_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-published_at']
+        indexes = [
+            # Partition rebuilds read one category; catch-up reads recent changes
+            models.Index(fields=['category', 'is_active']),
+            models.Index(fields=['updated_at']),
+        ]
     
     def __str__(self):
         return self.title
@@ -195,6 +450,8 @@ class LawGenerationRequest(models.Model):
     # Performance Metrics
     response_time_seconds = models.FloatField(null=True, blank=True)
     token_count = models.IntegerField(null=True, blank=True)
+    estimated_prompt_tokens = models.IntegerField(null=True, blank=True, help_text="Prompt tokens counted before the call")
+    max_tokens = models.IntegerField(null=True, blank=True, help_text="Completion allowance sent with the request")
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -215,21 +472,118 @@ class LawSearch(models.Model):
     query = models.CharField(max_length=500)
     filters = models.JSONField(default=dict, blank=True)
     results_count = models.IntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Time taken to run the search")
     
     # Billing
     credits_used = models.IntegerField(default=1)
     billing_processed = models.BooleanField(default=False)
     
-    # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Timestamps (set when the search runs, not when the buffered row is written)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Rollups read the log in created_at windows; analytics shows a user's latest
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Search: '{self.query}' by {self.user.username}"
 
 
+class SearchRollup(models.Model):
+    """One user's searches over an hour or a day, summarised from LawSearch"""
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    
+    # Inclusive upper bounds of the histogram buckets; the last bucket is open-ended
+    RESULT_BUCKETS = (0, 5, 20, 100)
+    LATENCY_BUCKETS_MS = (50, 200, 1000)
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_rollups')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    
+    searches = models.PositiveIntegerField(default=0)
+    zero_result_searches = models.PositiveIntegerField(default=0)
+    total_results = models.PositiveBigIntegerField(default=0)
+    result_histogram = models.JSONField(default=list, help_text="Searches per RESULT_BUCKETS bucket")
+    
+    # Searches logged before latency was recorded are left out of the latency figures
+    timed_searches = models.PositiveIntegerField(default=0)
+    total_latency_ms = models.PositiveBigIntegerField(default=0)
+    max_latency_ms = models.PositiveIntegerField(default=0)
+    latency_histogram = models.JSONField(default=list, help_text="Searches per LATENCY_BUCKETS_MS bucket")
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='unique_search_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.searches} searches ({self.period} of {self.period_start:%Y-%m-%d %H:%M})"
+    
+    @property
+    def average_latency_ms(self):
+        return self.total_latency_ms / self.timed_searches if self.timed_searches else None
+
+
+class SearchQueryRollup(models.Model):
+    """How often one user ran a (normalized) query over an hour or a day"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_query_rollups')
+    period = models.CharField(max_length=10, choices=SearchRollup.PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    query = models.CharField(max_length=500)
+    
+    searches = models.PositiveIntegerField(default=0)
+    zero_result_searches = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-period_start', '-searches']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start', 'query'],
+                                    name='unique_search_query_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start']),
+        ]
+    
+    def __str__(self):
+        return f"'{self.query}' x{self.searches} ({self.period} of {self.period_start:%Y-%m-%d %H:%M})"
+
+
+class SearchRollupState(models.Model):
+    """How far the LawSearch log has been rolled up"""
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(help_text="Searches logged before this are in the rollups")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.high_water_mark}"
+
+
+class SearchGeneration(models.Model):
+    """Bumped on every write to a user's laws; keys their cached searches in every process"""
+    # No database constraint: deleting a user deletes their laws, whose receivers
+    # bump this counter again after the cascade has removed it
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                db_constraint=False, related_name='search_generation')
+    generation = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: generation {self.generation}"
+
+
 class StateConstitution(models.Model):
     """User's constitutional framework for their network state"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='constitution')
@@ -252,3 +606,48 @@ class StateConstitution(models.Model):
     
     def __str__(self):
         return f"Constitution of {self.name}"
+
+
+class GenerationJob(models.Model):
+    """Background generation job queued from a web request"""
+    JOB_TYPE_CHOICES = [
+        ('law', 'Law Generation'),
+        ('law_batch', 'Batch Law Generation'),
+        ('constitution', 'Constitution Generation'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    job_type = models.CharField(max_length=20, choices=JOB_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    # Job Input
+    params = models.JSONField(default=dict, blank=True)
+    category = models.ForeignKey(LawCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    # Job Output
+    generated_law = models.ForeignKey(GeneratedLaw, on_delete=models.SET_NULL, null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error_message = models.TextField(blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_job_type_display()} job by {self.user.username} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
@@ -0,0 +1,126 @@
+"""
+Cursor pagination for law lists.
+
+Pages are fetched by keyset on ``(created_at, id)``, newest first: each page
+starts just past the last row of the one before, so page 100 costs the same
+index seek as page one and no COUNT or OFFSET is needed. Cursors are opaque,
+URL-safe strings; totals come from a cached count.
+
+Search results, which are already an ordered list of cached ids, page through
+that list with offset cursors behind the same interface.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position: dict) -> str:
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor from a request, raising InvalidCursor if it was tampered with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(position, dict):
+        raise InvalidCursor(cursor)
+    return position
+
+
+class CursorPage:
+    """One page of results with cursors to its neighbours"""
+
+    def __init__(self, object_list: list, next_cursor: str = None, previous_cursor: str = None,
+                 total: int = None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _law_cursor(law, direction: str) -> str:
+    return encode_cursor({'d': direction, 't': law.created_at.isoformat(), 'id': law.pk.hex})
+
+
+def paginate_laws(queryset, cursor: str = None, per_page: int = 12, total: int = None) -> CursorPage:
+    """
+    Page through a law queryset newest first by keyset on ``(created_at, id)``.
+    Invalid cursors start again from the first page.
+    """
+    try:
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None:
+            direction = position['d']
+            created_at = datetime.fromisoformat(position['t'])
+            law_id = position['id']
+    except (InvalidCursor, KeyError, TypeError, ValueError):
+        position = None
+
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_more_before, has_more_after = False, len(rows) > per_page
+        rows = rows[:per_page]
+    elif direction == 'next':
+        # The leading created_at range is what lets the index seek straight to the page;
+        # Django 5.1 has no row-value comparison for (created_at, id) < (t, id)
+        older = Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=law_id))
+        rows = list(queryset.filter(older).order_by('-created_at', '-id')[:per_page + 1])
+        has_more_before, has_more_after = True, len(rows) > per_page
+        rows = rows[:per_page]
+    else:
+        newer = Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=law_id))
+        rows = list(queryset.filter(newer).order_by('created_at', 'id')[:per_page + 1])
+        has_more_before, has_more_after = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+
+    return CursorPage(
+        rows,
+        next_cursor=_law_cursor(rows[-1], 'next') if rows and has_more_after else None,
+        previous_cursor=_law_cursor(rows[0], 'previous') if rows and has_more_before else None,
+        total=total
+    )
+
+
+def paginate_ids(law_ids: list, cursor: str = None, per_page: int = 12) -> CursorPage:
+    """Page through an ordered list of ids; ``object_list`` holds the ids of the page"""
+    try:
+        offset = max(0, int(decode_cursor(cursor)['o'])) if cursor else 0
+    except (InvalidCursor, KeyError, TypeError, ValueError):
+        offset = 0
+
+    end = offset + per_page
+    return CursorPage(
+        law_ids[offset:end],
+        next_cursor=encode_cursor({'o': end}) if end < len(law_ids) else None,
+        previous_cursor=encode_cursor({'o': max(0, offset - per_page)}) if offset else None,
+        total=len(law_ids)
+    )
@@ -0,0 +1,76 @@
+"""
+System prompt snapshots.
+
+Each distinct system prompt a user generates with is stored once as a
+SystemPromptSnapshot (deduplicated by content hash) and generations point at
+it. The snapshot for a given UserValues version is memoized in process, so
+repeat generations skip rendering, token counting and the snapshot lookup.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .budget import fit_system_prompt
+from .models import UserValues, SystemPromptSnapshot
+
+
+class SnapshotMemo:
+    """Small thread-safe LRU of snapshots keyed by user, values version and model"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+            return snapshot
+
+    def set(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+snapshot_memo = SnapshotMemo()
+
+
+def get_prompt_snapshot(user: User, model: str = None) -> SystemPromptSnapshot:
+    """Return the snapshot of the user's current system prompt, creating it if needed"""
+    model = model or settings.LLM_MODEL
+
+    # A single-column lookup is all a memo hit costs
+    version = UserValues.objects.filter(user=user).values_list('version', flat=True).first()
+    user_values = None
+    if version is None:
+        user_values, created = UserValues.objects.get_or_create(user=user)
+        version = user_values.version
+
+    # The ceiling changes how values are trimmed, so it is part of the key
+    key = (user.pk, version, model, settings.LLM_SYSTEM_PROMPT_TOKEN_CEILING)
+    snapshot = snapshot_memo.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    if user_values is None:
+        user_values = UserValues.objects.get(user=user)
+    content = fit_system_prompt(user_values, model)
+
+    snapshot, created = SystemPromptSnapshot.objects.get_or_create(
+        user=user,
+        content_hash=SystemPromptSnapshot.hash_content(content),
+        defaults={'content': content, 'values_version': user_values.version}
+    )
+    snapshot_memo.set(key, snapshot)
+    return snapshot
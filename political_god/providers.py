@@ -0,0 +1,219 @@
+"""
+LLM providers behind PoliticalGodAI.
+
+The provider is chosen with the LLM_PROVIDER setting: ``openai`` talks to the
+OpenAI API, ``fake`` is a local stand-in that returns schema-valid replies with
+configurable latency, token counts and error rate so the whole generation path
+can be load-tested offline. A dotted path to an LLMProvider subclass also works.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .clients import get_openai_client, get_async_openai_client, call_with_retry, acall_with_retry
+
+
+class LLMProviderError(Exception):
+    """Raised by providers for failed completions"""
+
+
+@dataclass
+class LLMCompletion:
+    """Provider-neutral result of a chat completion"""
+    content: str
+    model: str
+    prompt_tokens: int = None
+    completion_tokens: int = None
+    total_tokens: int = None
+
+
+class LLMProvider:
+    """Interface every provider implements"""
+    name = None
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def complete(self, messages: list, temperature: float, max_tokens: int,
+                 json_schema: dict = None) -> LLMCompletion:
+        """
+        Run a chat completion. ``json_schema`` (``{'name': ..., 'schema': ...}``)
+        asks for a reply that is a single JSON object matching the schema.
+        """
+        raise NotImplementedError
+
+    async def astream(self, messages: list, temperature: float, max_tokens: int,
+                      json_schema: dict = None):
+        """Yield the completion as text deltas"""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+
+class OpenAIProvider(LLMProvider):
+    """Chat completions through the shared OpenAI clients"""
+    name = 'openai'
+
+    def complete(self, messages, temperature, max_tokens, json_schema=None):
+        response = call_with_retry(
+            get_openai_client().chat.completions.create,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **self._response_format(json_schema)
+        )
+
+        usage = getattr(response, 'usage', None)
+        return LLMCompletion(
+            content=response.choices[0].message.content,
+            model=self.model,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+            total_tokens=usage.total_tokens if usage else None
+        )
+
+    async def astream(self, messages, temperature, max_tokens, json_schema=None):
+        client = get_async_openai_client()
+        stream = await acall_with_retry(
+            client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._response_format(json_schema)
+        )
+
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def _response_format(self, json_schema) -> dict:
+        """Request arguments for the configured structured output mode"""
+        mode = settings.LLM_STRUCTURED_OUTPUT
+        if json_schema is None or mode == 'off':
+            return {}
+        if mode == 'json_object':
+            return {'response_format': {'type': 'json_object'}}
+        return {'response_format': {
+            'type': 'json_schema',
+            'json_schema': {'name': json_schema['name'], 'schema': json_schema['schema'], 'strict': True}
+        }}
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline provider for benchmarks and development.
+
+    Replies are seeded from the request, so the same messages always produce
+    the same text. Latency, reply length and error rate come from settings.
+    """
+    name = 'fake'
+
+    SECTION_TITLES = ['Preamble', 'Article I - Bill of Rights', 'Article II - Government Structure',
+                      'Article III - Amendment Process']
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.latency = settings.LLM_FAKE_LATENCY_SECONDS
+        self.latency_jitter = settings.LLM_FAKE_LATENCY_JITTER
+        self.completion_tokens = settings.LLM_FAKE_COMPLETION_TOKENS
+        self.error_rate = settings.LLM_FAKE_ERROR_RATE
+
+    def complete(self, messages, temperature, max_tokens, json_schema=None):
+        rng = self._rng(messages, temperature, max_tokens)
+        self._maybe_fail(rng)
+        time.sleep(self._latency(rng))
+        return self._completion(messages, max_tokens, rng, json_schema)
+
+    async def astream(self, messages, temperature, max_tokens, json_schema=None):
+        rng = self._rng(messages, temperature, max_tokens)
+        self._maybe_fail(rng)
+        latency = self._latency(rng)
+        completion = self._completion(messages, max_tokens, rng, json_schema)
+
+        # Spread the latency over the reply so time-to-first-token is realistic
+        words = completion.content.split(' ')
+        chunk_size = 8
+        chunks = [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+        delay = latency / max(len(chunks), 1)
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(delay)
+            yield chunk if index == len(chunks) - 1 else chunk + ' '
+
+    def _rng(self, messages, temperature, max_tokens) -> random.Random:
+        payload = json.dumps([messages, temperature, max_tokens], sort_keys=True)
+        return random.Random(hashlib.sha256(payload.encode('utf-8')).hexdigest())
+
+    def _latency(self, rng) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+    def _maybe_fail(self, rng):
+        if self.error_rate and rng.random() < self.error_rate:
+            raise LLMProviderError('Simulated provider error')
+
+    def _completion(self, messages, max_tokens, rng, json_schema=None) -> LLMCompletion:
+        request_text = messages[-1]['content']
+        completion_tokens = min(self.completion_tokens, max_tokens)
+        # Roughly four characters per token, both ways
+        body = self._filler(rng, completion_tokens * 4)
+
+        if json_schema is not None or '"title"' in request_text:
+            topic = request_text.strip().splitlines()[0][:60].strip() or 'Network State'
+            tags = rng.sample(['governance', 'rights', 'economy', 'technology', 'privacy',
+                               'environment', 'security', 'enforcement'], 3)
+            content = json.dumps({
+                'title': f"{topic.rstrip('.').title()} Act",
+                'summary': f"This law addresses: {topic}. It sets obligations, enforcement and review.",
+                'tags': tags,
+                'category_suggestion': rng.choice(['Economic', 'Technology', 'Social', 'Governance']),
+                'content': body
+            })
+        else:
+            section_length = len(body) // len(self.SECTION_TITLES)
+            content = '\n\n'.join(
+                f"{title}\n{body[i * section_length:(i + 1) * section_length]}"
+                for i, title in enumerate(self.SECTION_TITLES)
+            )
+
+        prompt_tokens = sum(len(message['content']) for message in messages) // 4
+        return LLMCompletion(
+            content=content,
+            model=self.model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+
+    def _filler(self, rng, length: int) -> str:
+        words = ['citizens', 'shall', 'the', 'state', 'council', 'rights', 'protocol', 'enforce',
+                 'network', 'data', 'public', 'review', 'article', 'section', 'within', 'register']
+        text = []
+        size = 0
+        while size < length:
+            word = rng.choice(words)
+            text.append(word)
+            size += len(word) + 1
+        return ' '.join(text)
+
+
+PROVIDERS = {
+    OpenAIProvider.name: OpenAIProvider,
+    FakeProvider.name: FakeProvider,
+}
+
+
+def get_provider(name: str = None, model: str = None) -> LLMProvider:
+    """Instantiate the configured provider"""
+    name = name or settings.LLM_PROVIDER
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class(model or settings.LLM_MODEL)
@@ -0,0 +1,281 @@
+"""
+Search analytics rollups.
+
+Every search writes a LawSearch row. ``rollup_searches`` folds new rows into
+per-user hourly and daily SearchRollup rows (counts, result-count and latency
+histograms) and SearchQueryRollup rows (how often each normalized query ran),
+then advances a high-water mark, all in one transaction per window, so a
+crashed run just repeats its window. Analytics and admin pages read the
+rollups, whose size depends on how many days are shown rather than on the
+length of the log.
+
+The high-water mark trails the clock by SEARCH_ROLLUP_LAG_SECONDS, so rows
+from transactions still in flight are not skipped; figures are that much
+behind the log.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from .models import LawSearch, SearchQueryRollup, SearchRollup, SearchRollupState
+
+
+STATE_NAME = 'law-search'
+
+# Longest stretch of log folded in one transaction, so a backfill commits as it goes
+MAX_WINDOW = timedelta(hours=6)
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.lower().split())[:500]
+
+
+def period_start(created_at, period: str):
+    """Start of the hour or (local) day containing ``created_at``"""
+    local = timezone.localtime(created_at)
+    if period == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_labels(bounds: tuple, unit: str = '') -> list:
+    """Display labels for histogram buckets with the given inclusive upper bounds"""
+    labels, low = [], 0
+    for bound in bounds:
+        labels.append(f'{low}{unit}' if bound == low else f'{low}-{bound}{unit}')
+        low = bound + 1
+    labels.append(f'{low}{unit}+')
+    return labels
+
+
+class _Totals:
+    """Running figures for one rollup row"""
+
+    def __init__(self):
+        self.searches = 0
+        self.zero_result_searches = 0
+        self.total_results = 0
+        self.result_histogram = [0] * (len(SearchRollup.RESULT_BUCKETS) + 1)
+        self.timed_searches = 0
+        self.total_latency_ms = 0
+        self.max_latency_ms = 0
+        self.latency_histogram = [0] * (len(SearchRollup.LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, results_count: int, latency_ms):
+        self.searches += 1
+        self.zero_result_searches += results_count == 0
+        self.total_results += results_count
+        self.result_histogram[bisect_left(SearchRollup.RESULT_BUCKETS, results_count)] += 1
+        if latency_ms is not None:
+            self.timed_searches += 1
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            self.latency_histogram[bisect_left(SearchRollup.LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def merge_into(self, rollup: SearchRollup):
+        rollup.searches += self.searches
+        rollup.zero_result_searches += self.zero_result_searches
+        rollup.total_results += self.total_results
+        rollup.result_histogram = _add_lists(rollup.result_histogram, self.result_histogram)
+        rollup.timed_searches += self.timed_searches
+        rollup.total_latency_ms += self.total_latency_ms
+        rollup.max_latency_ms = max(rollup.max_latency_ms, self.max_latency_ms)
+        rollup.latency_histogram = _add_lists(rollup.latency_histogram, self.latency_histogram)
+
+
+def _add_lists(first: list, second: list) -> list:
+    length = max(len(first), len(second))
+    first = list(first) + [0] * (length - len(first))
+    return [a + b for a, b in zip(first, list(second) + [0] * (length - len(second)))]
+
+
+def _fold_window(start, end) -> int:
+    """Add the searches logged in [start, end) to the rollups; returns how many there were"""
+    totals = defaultdict(_Totals)
+    queries = defaultdict(lambda: [0, 0])
+    logged = LawSearch.objects.filter(created_at__gte=start, created_at__lt=end)
+    # Every UTC offset is a whole number of quarter hours, so all searches in the
+    # same UTC quarter hour share their local hour; convert each quarter once
+    hours = {}
+    count = 0
+    for user_id, created_at, query, results_count, latency_ms in logged.values_list(
+            'user_id', 'created_at', 'query', 'results_count', 'latency_ms').iterator(chunk_size=2000):
+        count += 1
+        query = normalize_query(query)
+        quarter = created_at.replace(minute=created_at.minute - created_at.minute % 15, second=0, microsecond=0)
+        hour = hours.get(quarter)
+        if hour is None:
+            hour = hours[quarter] = period_start(quarter, 'hour')
+        for period, start in (('hour', hour), ('day', hour.replace(hour=0))):
+            key = (user_id, period, start)
+            totals[key].add(results_count, latency_ms)
+            counts = queries[key + (query,)]
+            counts[0] += 1
+            counts[1] += results_count == 0
+    if not count:
+        return 0
+
+    # The window spans at most a day or two of period starts, so one range query finds existing rows
+    starts = [key[2] for key in totals]
+    in_range = {'period_start__gte': min(starts), 'period_start__lte': max(starts),
+                'user_id__in': {key[0] for key in totals}}
+
+    existing = {
+        (rollup.user_id, rollup.period, rollup.period_start): rollup
+        for rollup in SearchRollup.objects.filter(**in_range)
+    }
+    created, updated = [], []
+    now = timezone.now()
+    for key, figures in totals.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = SearchRollup(user_id=key[0], period=key[1], period_start=key[2])
+            created.append(rollup)
+        else:
+            updated.append(rollup)
+        figures.merge_into(rollup)
+        # bulk_update skips auto_now
+        rollup.updated_at = now
+    SearchRollup.objects.bulk_create(created, batch_size=500)
+    SearchRollup.objects.bulk_update(updated, [
+        'searches', 'zero_result_searches', 'total_results', 'result_histogram', 'timed_searches',
+        'total_latency_ms', 'max_latency_ms', 'latency_histogram', 'updated_at'
+    ], batch_size=500)
+
+    existing = {}
+    distinct_queries = sorted({key[3] for key in queries})
+    for offset in range(0, len(distinct_queries), 500):
+        batch = SearchQueryRollup.objects.filter(query__in=distinct_queries[offset:offset + 500], **in_range)
+        existing.update({(row.user_id, row.period, row.period_start, row.query): row for row in batch})
+    created, updated = [], []
+    for key, (searches, zero_result_searches) in queries.items():
+        row = existing.get(key)
+        if row is None:
+            row = SearchQueryRollup(user_id=key[0], period=key[1], period_start=key[2], query=key[3])
+            created.append(row)
+        else:
+            updated.append(row)
+        row.searches += searches
+        row.zero_result_searches += zero_result_searches
+    SearchQueryRollup.objects.bulk_create(created, batch_size=500)
+    SearchQueryRollup.objects.bulk_update(updated, ['searches', 'zero_result_searches'], batch_size=500)
+    return count
+
+
+def rollup_searches(now=None) -> int:
+    """
+    Fold every search logged since the high-water mark (up to the lag) into the
+    rollups. Returns the number of searches folded. Overlapping runs wait on a
+    lock on the high-water mark where the database supports SELECT FOR UPDATE.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.SEARCH_ROLLUP_LAG_SECONDS)
+    folded = 0
+    while True:
+        with transaction.atomic():
+            state = SearchRollupState.objects.select_for_update().filter(name=STATE_NAME).first()
+            if state is None:
+                first = LawSearch.objects.aggregate(first=Min('created_at'))['first']
+                state, _ = SearchRollupState.objects.get_or_create(
+                    name=STATE_NAME, defaults={'high_water_mark': min(first or cutoff, cutoff)}
+                )
+                state = SearchRollupState.objects.select_for_update().get(pk=state.pk)
+            if state.high_water_mark >= cutoff:
+                return folded
+
+            end = min(cutoff, state.high_water_mark + MAX_WINDOW)
+            folded += _fold_window(state.high_water_mark, end)
+            state.high_water_mark = end
+            state.save(update_fields=['high_water_mark', 'updated_at'])
+
+
+def prune_hourly_rollups(now=None) -> int:
+    """Drop hourly rollups older than SEARCH_ROLLUP_HOURLY_DAYS; daily ones are kept"""
+    before = (now or timezone.now()) - timedelta(days=settings.SEARCH_ROLLUP_HOURLY_DAYS)
+    deleted, _ = SearchRollup.objects.filter(period='hour', period_start__lt=before).delete()
+    queries, _ = SearchQueryRollup.objects.filter(period='hour', period_start__lt=before).delete()
+    return deleted + queries
+
+
+def rebuild_rollups() -> int:
+    """Discard every rollup and fold the whole log again"""
+    with transaction.atomic():
+        SearchRollup.objects.all().delete()
+        SearchQueryRollup.objects.all().delete()
+        SearchRollupState.objects.filter(name=STATE_NAME).delete()
+    return rollup_searches()
+
+
+def _rollups(period: str, since, user=None):
+    rollups = SearchRollup.objects.filter(period=period, period_start__gte=since)
+    return rollups.filter(user=user) if user is not None else rollups
+
+
+def search_summary(user=None, days: int = 30) -> dict:
+    """Search figures over the last ``days`` days, for one user or everyone"""
+    since = period_start(timezone.now() - timedelta(days=days - 1), 'day')
+    rows = _rollups('day', since, user).values_list(
+        'searches', 'zero_result_searches', 'total_results', 'result_histogram',
+        'timed_searches', 'total_latency_ms', 'max_latency_ms', 'latency_histogram'
+    )
+    figures = _Totals()
+    for searches, zero, results, result_histogram, timed, latency, max_latency, latency_histogram in rows:
+        figures.searches += searches
+        figures.zero_result_searches += zero
+        figures.total_results += results
+        figures.result_histogram = _add_lists(figures.result_histogram, result_histogram)
+        figures.timed_searches += timed
+        figures.total_latency_ms += latency
+        figures.max_latency_ms = max(figures.max_latency_ms, max_latency)
+        figures.latency_histogram = _add_lists(figures.latency_histogram, latency_histogram)
+
+    searches = figures.searches
+    return {
+        'days': days,
+        'searches': searches,
+        'zero_result_searches': figures.zero_result_searches,
+        'zero_result_rate': figures.zero_result_searches / searches * 100 if searches else 0,
+        'average_results': figures.total_results / searches if searches else 0,
+        'average_latency_ms': figures.total_latency_ms / figures.timed_searches if figures.timed_searches else None,
+        'max_latency_ms': figures.max_latency_ms,
+        'result_distribution': list(zip(bucket_labels(SearchRollup.RESULT_BUCKETS), figures.result_histogram)),
+        'latency_distribution': list(zip(bucket_labels(SearchRollup.LATENCY_BUCKETS_MS, ' ms'),
+                                         figures.latency_histogram)),
+    }
+
+
+def search_activity(user=None, hours: int = 24) -> list:
+    """``(hour, searches)`` pairs for the last ``hours`` hours that had any"""
+    since = period_start(timezone.now() - timedelta(hours=hours - 1), 'hour')
+    rows = _rollups('hour', since, user).values('period_start').annotate(total=Sum('searches'))
+    return [(row['period_start'], row['total']) for row in rows.order_by('period_start')]
+
+
+def top_queries(user=None, days: int = 30, limit: int = 10, zero_results: bool = False) -> list:
+    """
+    The most frequent queries over the last ``days`` days, as dicts with
+    ``query``, ``searches`` and ``zero_result_searches``. With ``zero_results``
+    only queries that found nothing are counted.
+    """
+    since = period_start(timezone.now() - timedelta(days=days - 1), 'day')
+    rows = SearchQueryRollup.objects.filter(period='day', period_start__gte=since)
+    if user is not None:
+        rows = rows.filter(user=user)
+    if zero_results:
+        rows = rows.filter(zero_result_searches__gt=0)
+    rows = rows.values('query').annotate(
+        total=Sum('searches'), zero_total=Sum('zero_result_searches')
+    ).order_by('-zero_total' if zero_results else '-total', 'query')[:limit]
+    return [
+        {'query': row['query'], 'searches': row['total'], 'zero_result_searches': row['zero_total']}
+        for row in rows
+    ]
+
+
+def total_searches(user) -> int:
+    """Searches the user has run, as of the last rollup"""
+    return SearchRollup.objects.filter(user=user, period='day').aggregate(total=Sum('searches'))['total'] or 0
@@ -0,0 +1,268 @@
+"""
+Full-text search over GeneratedLaw.
+
+On SQLite, laws are indexed in an FTS5 table that uses the law table itself as
+external content, so the text is not stored twice. Triggers keep the index in
+sync on insert, update and delete (including queryset ``update()`` and bulk
+deletes, which model signals would miss). Django's SQLite schema editor drops
+triggers whenever it rebuilds a table, so ``ensure_law_index`` runs after every
+``migrate`` and recreates and rebuilds the index when anything is missing.
+
+Search hits get a short highlighted snippet from the index (FTS5
+``snippet()``), computed only for the laws on the page being shown.
+
+Other database backends fall back to ``icontains`` matching.
+"""
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+LAW_TABLE = 'political_god_generatedlaw'
+FTS_TABLE = 'political_god_law_fts'
+INDEXED_COLUMNS = ('title', 'summary', 'tags', 'content')
+
+# bm25() weights, in INDEXED_COLUMNS order: a hit in the title counts most
+BM25_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+_columns = ', '.join(INDEXED_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in INDEXED_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in INDEXED_COLUMNS)
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content='{LAW_TABLE}',
+        tokenize='porter unicode61',
+        prefix='2 3'
+    )
+"""
+
+TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {LAW_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.rowid, {_new_values});
+        END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {LAW_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.rowid, {_old_values});
+        END
+    """,
+    # Only text changes touch the index, so saves that name their update_fields
+    # (toggling a favourite, say) leave it alone
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {_columns} ON {LAW_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.rowid, {_old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.rowid, {_new_values});
+        END
+    """,
+}
+
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+# Control characters mark matches inside snippets, so the text can be escaped
+# before they are turned into <mark> tags
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+SNIPPET_TOKENS = 24
+
+# Quoted phrases, or runs of anything else
+_QUERY_TOKENS = re.compile(r'"([^"]*)"|(\S+)')
+_WORDS = re.compile(r'\w+')
+
+# Connection aliases with a usable index
+_available = {}
+
+
+def supports_fts(using: str = DEFAULT_DB_ALIAS) -> bool:
+    return connections[using].vendor == 'sqlite'
+
+
+def ensure_law_index(using: str = DEFAULT_DB_ALIAS, rebuild: bool = False) -> bool:
+    """
+    Create the index and its triggers if any are missing, rebuilding the index
+    from the law table when they were. Returns whether full-text search is
+    available on this connection.
+    """
+    _available.pop(using, None)
+    if not supports_fts(using):
+        return False
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        names = [LAW_TABLE, FTS_TABLE, *TRIGGERS]
+        placeholders = ', '.join(['%s'] * len(names))
+        cursor.execute(f"SELECT name FROM sqlite_master WHERE name IN ({placeholders})", names)
+        existing = {row[0] for row in cursor.fetchall()}
+        if LAW_TABLE not in existing:
+            return False
+
+        missing = {FTS_TABLE, *TRIGGERS} - existing
+        try:
+            cursor.execute(CREATE_TABLE_SQL)
+        except OperationalError:
+            # SQLite built without FTS5
+            return False
+        for name in missing & set(TRIGGERS):
+            cursor.execute(TRIGGERS[name])
+
+        if missing or rebuild:
+            cursor.execute(REBUILD_SQL)
+
+    _available[using] = True
+    return True
+
+
+def law_index_available(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """Whether the FTS index exists, checked once per connection alias"""
+    if using not in _available:
+        available = False
+        if supports_fts(using):
+            with connections[using].cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+                available = cursor.fetchone() is not None
+        _available[using] = available
+    return _available[using]
+
+
+def build_match_query(query: str) -> str:
+    """
+    Translate a search box query into an FTS5 MATCH expression.
+
+    Terms are ANDed. ``"quoted text"`` is a phrase, a trailing ``*`` makes a
+    prefix query and ``OR`` between terms matches either. Everything else is
+    quoted, so user input can never be read as FTS5 syntax.
+    """
+    terms = []
+    for match in _QUERY_TOKENS.finditer(query):
+        phrase, word = match.groups()
+        if phrase is not None:
+            words = _WORDS.findall(phrase)
+            if words:
+                terms.append('"%s"' % ' '.join(words))
+        elif word == 'OR':
+            if terms and terms[-1] != 'OR':
+                terms.append('OR')
+        else:
+            words = _WORDS.findall(word)
+            if words:
+                prefix = '*' if word.endswith('*') else ''
+                terms.append('"%s"%s' % (' '.join(words), prefix))
+
+    if terms and terms[-1] == 'OR':
+        terms.pop()
+    return ' '.join(terms)
+
+
+def ranked_law_ids(user, query: str, limit: int = None, using: str = DEFAULT_DB_ALIAS,
+                   queryset=None) -> list:
+    """
+    Ids (as stored, hex strings) of the user's laws matching ``query``, best
+    BM25 match first. ``queryset`` narrows the candidates (category, tags, ...)
+    inside the query itself, so the LIMIT is taken over the filtered set.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    candidates = ''
+    params = [match_query, user.pk]
+    if queryset is not None:
+        subquery, subquery_params = queryset.order_by().values('pk').query.sql_with_params()
+        candidates = f'AND law.id IN ({subquery})'
+        params.extend(subquery_params)
+    # The unary + keeps SQLite from starting at the user_id index and running
+    # the MATCH once per law the user owns; the index lookup has to drive
+    sql = f"""
+        SELECT law.id FROM {FTS_TABLE}
+        JOIN {LAW_TABLE} AS law ON law.rowid = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND +law.user_id = %s {candidates}
+        ORDER BY bm25({FTS_TABLE}, {weights})
+        LIMIT %s
+    """
+    params.append(limit or settings.LAW_SEARCH_MAX_RESULTS)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_queryset(queryset, user, query: str):
+    """
+    Restrict a queryset of the user's laws to those matching ``query``.
+
+    With the FTS index, results are ordered by relevance and capped at
+    LAW_SEARCH_MAX_RESULTS, counted after the queryset's own filters;
+    otherwise they are substring matches, newest first.
+    """
+    using = queryset.db
+    if not law_index_available(using):
+        return _fallback_search(queryset, query)
+
+    return filter_in_order(queryset, ranked_law_ids(user, query, using=using, queryset=queryset))
+
+
+def filter_in_order(queryset, law_ids: list):
+    """Restrict a law queryset to ``law_ids`` (hex strings, as stored), keeping their order"""
+    if not law_ids:
+        return queryset.none()
+
+    if supports_fts(queryset.db):
+        # Ids all have the same length, so their offset in the ranked list orders
+        # the rows; one parameter instead of a CASE branch per result
+        rank = RawSQL(f'instr(%s, {LAW_TABLE}.id)', (','.join(law_ids),), output_field=IntegerField())
+    else:
+        rank = Case(*[When(pk=law_id, then=position) for position, law_id in enumerate(law_ids)],
+                    output_field=IntegerField())
+    return queryset.filter(pk__in=law_ids).annotate(search_rank=rank).order_by('search_rank')
+
+
+def law_snippets(law_ids: list, query: str, using: str = DEFAULT_DB_ALIAS) -> dict:
+    """
+    Highlighted HTML snippets around the matches of ``query``, keyed by law id
+    (hex). Laws without a match, or databases without the index, get none.
+    """
+    match_query = build_match_query(query)
+    if not law_ids or not match_query or not law_index_available(using):
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(law_ids))
+    # Column -1 lets FTS5 pick whichever column matched best
+    sql = f"""
+        SELECT law.id, snippet({FTS_TABLE}, -1, %s, %s, %s, %s) FROM {FTS_TABLE}
+        JOIN {LAW_TABLE} AS law ON law.rowid = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+          AND {FTS_TABLE}.rowid IN (SELECT rowid FROM {LAW_TABLE} WHERE id IN ({placeholders}))
+    """
+    params = [SNIPPET_START, SNIPPET_END, '…', SNIPPET_TOKENS, match_query, *law_ids]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return {
+            law_id: mark_safe(escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+            for law_id, snippet in cursor.fetchall()
+        }
+
+
+def attach_snippets(laws: list, query: str):
+    """Set ``snippet`` on each law of a result page (None where there is none)"""
+    if not laws:
+        return
+    snippets = law_snippets([law.pk.hex for law in laws], query, using=laws[0]._state.db)
+    for law in laws:
+        law.snippet = snippets.get(law.pk.hex)
+
+
+def _fallback_search(queryset, query: str):
+    """Substring search for backends without an FTS index"""
+    return queryset.filter(
+        Q(title__icontains=query) |
+        Q(content__icontains=query) |
+        Q(summary__icontains=query) |
+        Q(tags__icontains=query)
+    ).order_by('-created_at')
@@ -0,0 +1,97 @@
+"""
+Cached law search results.
+
+A search stores the ordered ids of its matches under a key built from the
+user's current search generation and the normalized query, filters and mode.
+Any write to one of the user's laws bumps the generation, so later lookups
+miss and stale entries simply expire. Paging through a cached result is an
+id slice and a primary-key fetch. Library totals are cached the same way.
+
+The generation counters are kept in the database (SearchGeneration), since
+laws are also saved by Celery workers and every process must see their bumps.
+Entries live in Django's cache; set CACHE_REDIS_URL to share them between
+processes, otherwise each process fills its own.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import SearchGeneration
+
+
+RESULT_KEY = 'law-search:results:{user_id}:{generation}:{digest}'
+COUNT_KEY = 'law-search:count:{user_id}:{generation}:{digest}'
+
+
+def _cache():
+    return caches[settings.LAW_SEARCH_CACHE_ALIAS]
+
+
+def normalize_search(query: str, filters: dict = None, mode: str = 'keyword') -> str:
+    """Canonical form of a search, so equivalent requests share an entry"""
+    filters = dict(filters or {})
+    if filters.get('tags'):
+        filters['tags'] = sorted({' '.join(tag.split()).lower() for tag in filters['tags']})
+    return json.dumps({
+        'query': ' '.join((query or '').split()).lower(),
+        'filters': {key: value for key, value in filters.items() if value},
+        'mode': mode,
+    }, sort_keys=True)
+
+
+def get_generation(user_id) -> int:
+    generation = SearchGeneration.objects.filter(user_id=user_id).values_list('generation', flat=True).first()
+    return generation or 0
+
+
+def bump_generation(user_id):
+    """Invalidate every cached search of a user; commits with the write that caused it"""
+    counters = SearchGeneration.objects.filter(user_id=user_id)
+    if not counters.update(generation=F('generation') + 1):
+        # First write for this user; a concurrent first write may create the row too
+        SearchGeneration.objects.bulk_create([SearchGeneration(user_id=user_id)], ignore_conflicts=True)
+        counters.update(generation=F('generation') + 1)
+
+
+def result_key(user_id, search: str) -> str:
+    """
+    Cache key for a normalized search at the user's current generation. Take it
+    before running the search, so a write that lands meanwhile invalidates it.
+    """
+    digest = hashlib.sha256(search.encode('utf-8')).hexdigest()
+    return RESULT_KEY.format(user_id=user_id, generation=get_generation(user_id), digest=digest)
+
+
+def get_cached_ids(key: str):
+    """The cached ordered law ids (hex strings) for a result key, or None"""
+    return _cache().get(key)
+
+
+def cache_ids(key: str, law_ids: list):
+    _cache().set(key, law_ids, timeout=settings.LAW_SEARCH_CACHE_TTL)
+
+
+def cached_count(user_id, queryset) -> int:
+    """
+    Count a queryset of one user's laws, reusing the result until their laws
+    change. Good enough for the approximate totals shown next to cursor pages.
+    """
+    key = COUNT_KEY.format(
+        user_id=user_id,
+        generation=get_generation(user_id),
+        digest=hashlib.sha256(str(queryset.query).encode('utf-8')).hexdigest()
+    )
+    count = _cache().get(key)
+    if count is None:
+        count = queryset.count()
+        _cache().set(key, count, timeout=settings.LAW_SEARCH_CACHE_TTL)
+    return count
+
+
+def invalidate_law_searches(sender, instance, raw=False, **kwargs):
+    """post_save / post_delete receiver for GeneratedLaw"""
+    if not raw:
+        bump_generation(instance.user_id)
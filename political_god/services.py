@@ -1,50 +1,290 @@
-import openai
 import time
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
 from .models import (
-    UserValues, GeneratedLaw, LawGenerationRequest, LawSearch, 
-    LawCategory, StateConstitution
+    GeneratedLaw, LawGenerationRequest, LawSearch, 
+    LawCategory, StateConstitution, GenerationJob, SystemPromptSnapshot, Tag, LawTag
+)
+from billing.models import CreditReservation
+from billing.usage_buffer import record_usage
+from billing.ledger import (
+    InsufficientCredits, charge_credits, commit_reservation, refund_credits, refund_reservation, reserve_credits
+)
+from .providers import get_provider
+from .budget import TokenBudget, count_tokens, plan_completion
+from .prompts import get_prompt_snapshot
+from .metrics import generation_metrics
+from .structured import LAW_SCHEMA, LawStreamParser
+from .search import search_queryset, filter_in_order
+from .search_cache import normalize_search, result_key, get_cached_ids, cache_ids
+from .embeddings import semantic_queryset
+from .rollups import total_searches
+
+
+class LLMResponseCache:
+    """
+    Size-bounded LRU cache of chat completions with a TTL.
+    
+    Entries are keyed by a hash of the model, sampling parameters and the full
+    message list, so identical requests are answered without another API call.
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(model: str, messages: list, **params) -> str:
+        """Hash the complete request so any change in prompt or parameters misses"""
+        payload = json.dumps(
+            {'model': model, 'messages': messages, 'params': params},
+            sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hit_rate': (self.hits / lookups) * 100 if lookups else 0,
+            }
+
+
+# Process-wide cache shared by all PoliticalGodAI instances
+response_cache = LLMResponseCache(
+    max_entries=getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 512),
+    ttl_seconds=getattr(settings, 'LLM_CACHE_TTL_SECONDS', 3600),
 )
-from billing.models import UserSubscription
+
+
+# Constitution sections generated separately: (StateConstitution field, title, scope)
+CONSTITUTION_SECTIONS = [
+    ('preamble', 'Preamble', 'the founding principles and purpose of the state'),
+    ('fundamental_rights', 'Bill of Rights', 'the individual freedoms and protections guaranteed to citizens'),
+    ('governmental_structure', 'Governmental Structure',
+     'how the government is organized, its institutions and the enforcement mechanisms of the constitution'),
+    ('amendment_process', 'Amendment Process', 'how the constitution and laws can be changed'),
+]
 
 
 class PoliticalGodAI:
     """AI service for generating laws and constitutional content"""
     
-    def __init__(self):
-        openai.api_key = settings.OPENAI_API_KEY
-        self.model = "gpt-4o"  # Using the latest GPT-4 model
+    def __init__(self, provider=None):
+        # Provider and model come from the LLM_PROVIDER / LLM_MODEL settings
+        self.provider = provider or get_provider()
+        self.model = self.provider.model
         
-    def generate_law(self, user: User, prompt: str, category: LawCategory = None) -> dict:
+    def generate_law(self, user: User, prompt: str, category: LawCategory = None,
+                     use_cache: bool = True) -> dict:
         """Generate a law based on user prompt and values"""
         start_time = time.time()
         
+        # Hold the credits for the length of the model call
+        reservation = self._reserve_credits(user, 10, "Law generation")
+        if reservation is None:
+            return {
+                'success': False,
+                'error': 'Insufficient credits. Please upgrade your subscription.',
+                'credits_required': 10
+            }
+        
         try:
-            # Check if user has credits
-            if not self._check_credits(user, 10):
-                return {
-                    'success': False,
-                    'error': 'Insufficient credits. Please upgrade your subscription.',
-                    'credits_required': 10
-                }
+            snapshot = self._get_prompt_snapshot(user)
+            messages = self._build_law_messages(prompt, snapshot.content)
+            budget = plan_completion(messages, 'law', self.model)
+            
+            # Call the LLM provider
+            ai_response, token_count = self._chat_completion(
+                messages, temperature=0.7, max_tokens=budget.max_tokens, use_cache=use_cache,
+                json_schema=LAW_SCHEMA
+            )
+            
+            response_time = time.time() - start_time
+            
+            generated_law, request_record = self._save_generated_law(
+                user, prompt, category, snapshot, ai_response, response_time, token_count,
+                reservation=reservation, budget=budget
+            )
             
-            # Get user values for system prompt
-            user_values, created = UserValues.objects.get_or_create(user=user)
-            system_prompt = user_values.system_prompt
+            return {
+                'success': True,
+                'law': generated_law,
+                'request_id': request_record.id,
+                'response_time': response_time,
+                'tokens_used': token_count
+            }
+            
+        except Exception as e:
+            # Log the error and create failed request record
+            response_time = time.time() - start_time
+            request_record = self._record_failed_request(user, prompt, category, e, response_time)
+            
+            return {
+                'success': False,
+                'error': str(e),
+                'request_id': request_record.id
+            }
+        
+        finally:
+            # Nothing is charged unless the law was saved
+            refund_reservation(reservation)
+    
+    async def stream_law(self, user: User, prompt: str, category: LawCategory = None,
+                         use_cache: bool = True):
+        """
+        Stream a law generation as it is produced by the model.
+        
+        Yields ``(event, data)`` tuples: ``field`` events carry the title, summary,
+        tags and category as soon as each is complete, ``token`` events carry the
+        law text as it arrives, followed by a single ``done`` or ``error`` event.
+        The law and its request record are only written once the stream has finished.
+        """
+        start_time = time.time()
+        
+        reservation = await sync_to_async(self._reserve_credits)(user, 10, "Law generation")
+        if reservation is None:
+            yield 'error', {
+                'error': 'Insufficient credits. Please upgrade your subscription.',
+                'credits_required': 10
+            }
+            return
+        
+        try:
+            snapshot = await sync_to_async(self._get_prompt_snapshot)(user)
+            messages = self._build_law_messages(prompt, snapshot.content)
+            budget = plan_completion(messages, 'law', self.model)
+            
+            cache_key = self._cache_key(messages, temperature=0.7, max_tokens=budget.max_tokens,
+                                        json_schema=LAW_SCHEMA['name'])
+            cached = response_cache.get(cache_key) if use_cache else None
+            parser = LawStreamParser()
+            
+            if cached:
+                ai_response, token_count = cached['content'], cached['total_tokens']
+                for event in self._stream_events(parser, ai_response):
+                    yield event
+            else:
+                chunks = []
+                async for delta in self.provider.astream(messages, temperature=0.7, max_tokens=budget.max_tokens,
+                                                         json_schema=LAW_SCHEMA):
+                    chunks.append(delta)
+                    for event in self._stream_events(parser, delta):
+                        yield event
+                
+                ai_response, token_count = ''.join(chunks), None
+                response_cache.set(cache_key, {'content': ai_response, 'total_tokens': token_count})
             
-            # Enhance the prompt with specific instructions
-            enhanced_prompt = f"""
+            response_time = time.time() - start_time
+            generated_law, request_record = await sync_to_async(self._save_generated_law)(
+                user, prompt, category, snapshot, ai_response, response_time, token_count,
+                reservation=reservation, budget=budget, parser=parser
+            )
+            
+            yield 'done', {
+                'law_id': str(generated_law.id),
+                'title': generated_law.title,
+                'summary': generated_law.summary,
+                'request_id': str(request_record.id),
+                'response_time': response_time
+            }
+            
+        except Exception as e:
+            response_time = time.time() - start_time
+            request_record = await sync_to_async(self._record_failed_request)(
+                user, prompt, category, e, response_time
+            )
+            
+            yield 'error', {
+                'error': str(e),
+                'request_id': str(request_record.id)
+            }
+        
+        finally:
+            # Also runs when the client disconnects mid-stream
+            await sync_to_async(refund_reservation)(reservation)
+    
+    def _stream_events(self, parser: LawStreamParser, text: str):
+        """Turn a chunk of the reply into ``field`` / ``token`` stream events"""
+        if parser.failed:
+            # Not a JSON reply: pass the raw text through
+            yield 'token', {'text': text}
+            return
+        
+        try:
+            events = parser.feed(text)
+        except ValueError:
+            yield 'token', {'text': text}
+            return
+        
+        for kind, name, value in events:
+            if kind == 'delta':
+                yield 'token', {'text': value}
+            elif name != 'content':
+                yield 'field', {'name': name, 'value': value}
+    
+    def _build_law_messages(self, prompt: str, system_prompt: str) -> list:
+        """Build the chat messages for a law generation"""
+        # Enhance the prompt with specific instructions
+        enhanced_prompt = f"""
             {prompt}
 
             Please provide your response in the following JSON format:
             {{
                 "title": "Short, descriptive title for the law",
                 "summary": "Brief 2-3 sentence summary of the law's purpose and scope",
-                "content": "Full detailed law text with specific articles, sections, and enforcement mechanisms",
                 "tags": ["tag1", "tag2", "tag3"],
-                "category_suggestion": "suggested category name"
+                "category_suggestion": "suggested category name",
+                "content": "Full detailed law text with specific articles, sections, and enforcement mechanisms"
             }}
             
             Make sure the law is:
@@ -54,36 +294,73 @@ class PoliticalGodAI:
             4. Forward-thinking and innovative
             5. Balanced between individual rights and collective good
             """
-            
-            # Call OpenAI API
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": enhanced_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            response_time = time.time() - start_time
-            
-            # Parse the response
-            ai_response = response.choices[0].message.content
-            
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": enhanced_prompt}
+        ]
+        return messages
+    
+    def _get_prompt_snapshot(self, user: User) -> SystemPromptSnapshot:
+        """Get the snapshot of the user's values as a system prompt, trimmed to the token ceiling"""
+        return get_prompt_snapshot(user, self.model)
+    
+    def _chat_completion(self, messages: list, temperature: float, max_tokens: int,
+                         use_cache: bool = True, json_schema: dict = None) -> tuple:
+        """Run a chat completion, answering repeated requests from the response cache"""
+        cache_key = self._cache_key(messages, temperature=temperature, max_tokens=max_tokens,
+                                    json_schema=json_schema['name'] if json_schema else None)
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached:
+                return cached['content'], cached['total_tokens']
+        
+        completion = self.provider.complete(messages, temperature=temperature, max_tokens=max_tokens,
+                                            json_schema=json_schema)
+        response_cache.set(cache_key, {'content': completion.content, 'total_tokens': completion.total_tokens})
+        return completion.content, completion.total_tokens
+    
+    def _cache_key(self, messages: list, **params) -> str:
+        return LLMResponseCache.make_key(self.model, messages, provider=self.provider.name, **params)
+    
+    def _parse_law_response(self, ai_response: str, parser: LawStreamParser = None) -> dict:
+        """
+        Parse the model's JSON reply, falling back to the raw text.
+        
+        A parser that already consumed the reply while it was streamed can be
+        passed in. Fields that were complete before parsing failed are kept.
+        """
+        if parser is None:
+            parser = LawStreamParser(stream_fields=())
             try:
-                # Try to parse as JSON
-                law_data = json.loads(ai_response)
-            except json.JSONDecodeError:
-                # Fallback: extract content manually
-                law_data = {
-                    "title": "Generated Law",
-                    "summary": "AI-generated law based on user prompt",
-                    "content": ai_response,
-                    "tags": [],
-                    "category_suggestion": ""
-                }
-            
+                parser.feed(ai_response)
+            except ValueError:
+                pass
+        
+        law_data = dict(parser.result)
+        fallback = parser.failed or not parser.done or not law_data.get('content')
+        generation_metrics.record_parse(parser.parse_seconds, count_tokens(ai_response, self.model), fallback)
+        
+        if fallback:
+            law_data.setdefault('title', 'Generated Law')
+            law_data.setdefault('summary', 'AI-generated law based on user prompt')
+            law_data.setdefault('tags', [])
+            law_data.setdefault('category_suggestion', '')
+            law_data['content'] = ai_response
+        return law_data
+    
+    def _save_generated_law(self, user: User, prompt: str, category: LawCategory,
+                            prompt_snapshot: SystemPromptSnapshot, ai_response: str,
+                            response_time: float, token_count: int = None,
+                            reservation: CreditReservation = None, budget: TokenBudget = None,
+                            parser: LawStreamParser = None) -> tuple:
+        """
+        Persist a completed generation and charge the user for it by committing
+        ``reservation`` (batch generations settle theirs for the whole batch)
+        """
+        law_data = self._parse_law_response(ai_response, parser)
+        
+        with transaction.atomic():
             # Create the law record
             generated_law = GeneratedLaw.objects.create(
                 user=user,
@@ -93,7 +370,7 @@ class PoliticalGodAI:
                 category=category,
                 prompt_used=prompt,
                 ai_model=self.model,
-                system_prompt=system_prompt,
+                prompt_snapshot=prompt_snapshot,
                 tags=', '.join(law_data.get('tags', []))
             )
             
@@ -106,93 +383,83 @@ class PoliticalGodAI:
                 success=True,
                 credits_used=10,
                 response_time_seconds=response_time,
-                token_count=response.usage.total_tokens if hasattr(response, 'usage') else None
+                token_count=token_count,
+                estimated_prompt_tokens=budget.prompt_tokens if budget else None,
+                max_tokens=budget.max_tokens if budget else None
             )
             
-            # Deduct credits
-            self._use_credits(user, 10, f"Law generation: {generated_law.title}")
-            
-            return {
-                'success': True,
-                'law': generated_law,
-                'request_id': request_record.id,
-                'response_time': response_time,
-                'tokens_used': response.usage.total_tokens if hasattr(response, 'usage') else None
-            }
-            
-        except Exception as e:
-            # Log the error and create failed request record
-            response_time = time.time() - start_time
-            
-            request_record = LawGenerationRequest.objects.create(
-                user=user,
-                prompt=prompt,
-                category=category,
-                success=False,
-                error_message=str(e),
-                response_time_seconds=response_time
-            )
-            
-            return {
-                'success': False,
-                'error': str(e),
-                'request_id': request_record.id
-            }
+            # Charged in the same transaction, so a law is never saved unpaid
+            if reservation is not None:
+                commit_reservation(reservation, description=f"Law generation: {generated_law.title}")
+        
+        return generated_law, request_record
     
-    def search_laws(self, user: User, query: str, filters: dict = None) -> dict:
-        """Search through user's generated laws"""
+    def _record_failed_request(self, user: User, prompt: str, category: LawCategory,
+                               error: Exception, response_time: float) -> LawGenerationRequest:
+        """Create the tracking record for a failed generation"""
+        return LawGenerationRequest.objects.create(
+            user=user,
+            prompt=prompt,
+            category=category,
+            success=False,
+            error_message=str(error),
+            response_time_seconds=response_time
+        )
+    
+    def search_laws(self, user: User, query: str, filters: dict = None, mode: str = 'keyword') -> dict:
+        """
+        Search through user's generated laws. ``mode='semantic'`` ranks laws by
+        embedding similarity instead of matching keywords.
+        
+        Results are cached per user as ordered ids until one of the user's laws
+        changes; repeating a search (e.g. paging) only charges a credit when
+        SEARCH_CACHED_RESULTS_CHARGE_CREDIT is set.
+        """
         
         try:
-            # Check if user has credits
-            if not self._check_credits(user, 1):
+            cache_key = result_key(user.pk, normalize_search(query, filters, mode))
+            law_ids = get_cached_ids(cache_key)
+            cached = law_ids is not None
+            charge = not cached or settings.SEARCH_CACHED_RESULTS_CHARGE_CREDIT
+            
+            # Charge up front; the conditional update fails if the user is out of credits
+            if charge and not self._use_credits(user, 1, f"Law search: '{query}'"):
                 return {
                     'success': False,
                     'error': 'Insufficient credits. Please upgrade your subscription.',
                     'credits_required': 1
                 }
             
-            # Build the search query
-            laws = GeneratedLaw.objects.filter(user=user)
-            
-            # Apply text search
-            if query:
-                laws = laws.filter(
-                    models.Q(title__icontains=query) |
-                    models.Q(content__icontains=query) |
-                    models.Q(summary__icontains=query) |
-                    models.Q(tags__icontains=query)
+            search_id = None
+            if not cached:
+                start_time = time.time()
+                try:
+                    law_ids = self._run_search(user, query, filters, mode)
+                except Exception:
+                    if charge:
+                        self._refund_credits(user, 1, f"Refund: failed law search '{query}'")
+                    raise
+                latency_ms = int((time.time() - start_time) * 1000)
+                cache_ids(cache_key, law_ids)
+                
+                # Create search tracking record (written behind the request)
+                search_record = LawSearch(
+                    user=user,
+                    query=query,
+                    filters={**(filters or {}), 'mode': mode},
+                    results_count=len(law_ids),
+                    latency_ms=latency_ms
                 )
-            
-            # Apply filters
-            if filters:
-                if filters.get('category'):
-                    laws = laws.filter(category__name=filters['category'])
-                if filters.get('is_favorite'):
-                    laws = laws.filter(is_favorite=True)
-                if filters.get('is_implemented'):
-                    laws = laws.filter(is_implemented=True)
-                if filters.get('tags'):
-                    for tag in filters['tags']:
-                        laws = laws.filter(tags__icontains=tag)
-            
-            results = laws.order_by('-created_at')
-            
-            # Create search tracking record
-            search_record = LawSearch.objects.create(
-                user=user,
-                query=query,
-                filters=filters or {},
-                results_count=results.count()
-            )
-            
-            # Deduct credits
-            self._use_credits(user, 1, f"Law search: '{query}'")
+                record_usage(search_record)
+                search_id = search_record.id
             
             return {
                 'success': True,
-                'results': results,
-                'count': results.count(),
-                'search_id': search_record.id
+                'results': filter_in_order(GeneratedLaw.objects.filter(user=user), law_ids),
+                'law_ids': law_ids,
+                'count': len(law_ids),
+                'search_id': search_id,
+                'cached': cached
             }
             
         except Exception as e:
@@ -201,31 +468,235 @@ class PoliticalGodAI:
                 'error': str(e)
             }
     
-    def generate_constitution(self, user: User, requirements: dict) -> dict:
-        """Generate a constitutional framework for the user's network state"""
+    def _run_search(self, user: User, query: str, filters: dict = None, mode: str = 'keyword') -> list:
+        """Ids (hex strings) of the user's laws matching a search, in result order"""
+        laws = GeneratedLaw.objects.filter(user=user)
+        
+        # Apply filters first, so the result cap of the text search counts
+        # only laws that pass them
+        if filters:
+            if filters.get('category'):
+                laws = laws.filter(category__name=filters['category'])
+            if filters.get('is_favorite'):
+                laws = laws.filter(is_favorite=True)
+            if filters.get('is_implemented'):
+                laws = laws.filter(is_implemented=True)
+            if filters.get('tags'):
+                # One join through the (law, tag) index per tag; exact
+                # names, so "tax" no longer matches "taxonomy"
+                for tag in filters['tags']:
+                    laws = laws.filter(law_tags__tag__name=Tag.normalize(tag))
+        
+        # Apply text search (ranked by relevance when a full-text index is available)
+        if query and mode == 'semantic':
+            laws = semantic_queryset(laws, user, query)
+        elif query:
+            laws = search_queryset(laws, user, query)
+        else:
+            laws = laws.order_by('-created_at')
+        
+        return [law_id.hex for law_id in laws.values_list('pk', flat=True)]
+    
+    def generate_laws_batch(self, user: User, items: list, max_concurrency: int = None,
+                            use_cache: bool = True) -> dict:
+        """
+        Generate several laws in one request.
+        
+        ``items`` is a list of ``{'prompt': str, 'category': LawCategory|None}``.
+        Credits for every law are reserved before any model call is made; the
+        completions then run concurrently (bounded by ``max_concurrency``) and
+        the credits of prompts that fail are refunded.
+        """
+        start_time = time.time()
+        credits_required = 10 * len(items)
+        
+        if not items:
+            return {'success': False, 'error': 'No prompts provided.'}
+        
+        max_batch_size = getattr(settings, 'LAW_BATCH_MAX_SIZE', 25)
+        if len(items) > max_batch_size:
+            return {
+                'success': False,
+                'error': f'A batch can contain at most {max_batch_size} laws.'
+            }
+        
+        reservation = self._reserve_credits(user, credits_required, f"Batch law generation: {len(items)} laws")
+        if reservation is None:
+            return {
+                'success': False,
+                'error': f'Insufficient credits. This batch requires {credits_required} credits.',
+                'credits_required': credits_required
+            }
+        
+        concurrency_limit = getattr(settings, 'LAW_BATCH_MAX_CONCURRENCY', 5)
+        max_concurrency = min(max_concurrency or concurrency_limit, concurrency_limit)
+        
+        # Model calls run in worker threads; everything touching the database
+        # stays on this thread
+        snapshot = self._get_prompt_snapshot(user)
+        
+        def complete(item):
+            item_start = time.time()
+            budget = None
+            try:
+                messages = self._build_law_messages(item['prompt'], snapshot.content)
+                budget = plan_completion(messages, 'law', self.model)
+                ai_response, token_count = self._chat_completion(
+                    messages, temperature=0.7, max_tokens=budget.max_tokens, use_cache=use_cache,
+                    json_schema=LAW_SCHEMA
+                )
+                return ai_response, token_count, budget, None, time.time() - item_start
+            except Exception as e:
+                return None, None, budget, e, time.time() - item_start
         
         try:
-            # Check if user has credits (constitution generation costs 50 credits)
-            if not self._check_credits(user, 50):
-                return {
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                completions = list(executor.map(complete, items))
+        except BaseException:
+            refund_reservation(reservation)
+            raise
+        
+        results = []
+        saved = 0
+        try:
+            for item, (ai_response, token_count, budget, error, response_time) in zip(items, completions):
+                if error is None:
+                    try:
+                        generated_law, request_record = self._save_generated_law(
+                            user, item['prompt'], item.get('category'), snapshot,
+                            ai_response, response_time, token_count, budget=budget
+                        )
+                        results.append({
+                            'success': True,
+                            'prompt': item['prompt'],
+                            'law': generated_law,
+                            'request_id': request_record.id
+                        })
+                        saved += 1
+                        continue
+                    except Exception as e:
+                        error = e
+                
+                request_record = self._record_failed_request(
+                    user, item['prompt'], item.get('category'), error, response_time
+                )
+                results.append({
                     'success': False,
-                    'error': 'Insufficient credits. Constitution generation requires 50 credits.',
-                    'credits_required': 50
+                    'prompt': item['prompt'],
+                    'error': str(error),
+                    'request_id': request_record.id
+                })
+        finally:
+            # Only the laws that were saved are charged; the rest of the hold is
+            # released, also when saving or recording a result raised
+            commit_reservation(reservation, amount=10 * saved)
+        
+        failed = len(items) - saved
+        credits_refunded = 10 * failed
+        
+        return {
+            'success': failed < len(items),
+            'results': results,
+            'credits_used': credits_required - credits_refunded,
+            'credits_refunded': credits_refunded,
+            'response_time': time.time() - start_time
+        }
+    
+    def generate_constitution(self, user: User, requirements: dict, use_cache: bool = True,
+                              parallel_sections: bool = None) -> dict:
+        """
+        Generate a constitutional framework for the user's network state.
+        
+        With ``parallel_sections`` each part of the constitution is written by its
+        own completion, all running at once against a shared outline, and stored
+        straight into its field. Otherwise the whole document is generated in one
+        completion and split into sections afterwards.
+        """
+        if parallel_sections is None:
+            parallel_sections = settings.CONSTITUTION_PARALLEL_SECTIONS
+        
+        # Constitution generation costs 50 credits, held while the sections are written
+        reservation = self._reserve_credits(user, 50, "Constitution generation")
+        if reservation is None:
+            return {
+                'success': False,
+                'error': 'Insufficient credits. Constitution generation requires 50 credits.',
+                'credits_required': 50
+            }
+        
+        try:
+            # Get user values
+            system_prompt = self._get_prompt_snapshot(user).content
+            
+            if parallel_sections:
+                sections = self._generate_constitution_sections(system_prompt, requirements, use_cache)
+                constitution_text = '\n\n'.join(sections[field] for field, title, scope in CONSTITUTION_SECTIONS)
+            else:
+                constitution_text = self._generate_constitution_document(system_prompt, requirements, use_cache)
+                
+                # Parse the constitution into sections
+                constitution_data = self._parse_constitution(constitution_text)
+                sections = {
+                    field: constitution_data[key]
+                    for key, field in [('preamble', 'preamble'), ('rights', 'fundamental_rights'),
+                                       ('structure', 'governmental_structure'), ('amendments', 'amendment_process')]
+                    if key in constitution_data
                 }
             
-            # Get user values
-            user_values, created = UserValues.objects.get_or_create(user=user)
-            system_prompt = user_values.system_prompt
+            with transaction.atomic():
+                # Create or update constitution record
+                constitution, created = StateConstitution.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'name': requirements.get('name', 'The Network State'),
+                        'preamble': sections.get('preamble', ''),
+                        'fundamental_rights': sections.get('fundamental_rights', ''),
+                        'governmental_structure': sections.get('governmental_structure', ''),
+                        'amendment_process': sections.get('amendment_process', ''),
+                        'is_ai_assisted': True,
+                        'ai_generation_notes': f"Generated with {self.model} based on user values and requirements"
+                    }
+                )
             
-            # Create constitution generation prompt
-            prompt = f"""
-            Create a comprehensive constitutional framework for a network state based on the following requirements:
+                if not created:
+                    # Update existing constitution
+                    constitution.name = requirements.get('name', constitution.name)
+                    for field, value in sections.items():
+                        setattr(constitution, field, value)
+                    constitution.is_ai_assisted = True
+                    constitution.ai_generation_notes = f"Updated with {self.model} on {time.strftime('%Y-%m-%d')}"
+                    constitution.save()
+                
+                commit_reservation(reservation, description=f"Constitution generation: {constitution.name}")
             
+            return {
+                'success': True,
+                'constitution': constitution,
+                'raw_text': constitution_text
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
+        finally:
+            refund_reservation(reservation)
+    
+    def _constitution_requirements(self, requirements: dict) -> str:
+        return f"""
             State Name: {requirements.get('name', 'The Network State')}
             Population Size: {requirements.get('population', 'Not specified')}
             Geographic Scope: {requirements.get('geography', 'Digital-first with physical nodes')}
             Special Focus Areas: {requirements.get('focus_areas', 'Not specified')}
-            
+            """
+    
+    def _generate_constitution_document(self, system_prompt: str, requirements: dict, use_cache: bool) -> str:
+        """Generate the whole constitution in a single completion"""
+        prompt = f"""
+            Create a comprehensive constitutional framework for a network state based on the following requirements:
+            {self._constitution_requirements(requirements)}
             Please provide a complete constitutional document with:
             1. Preamble stating the founding principles
             2. Bill of Rights protecting individual freedoms
@@ -235,77 +706,78 @@ class PoliticalGodAI:
             
             Format as a proper constitutional document with articles and sections.
             """
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        budget = plan_completion(messages, 'constitution', self.model)
+        
+        constitution_text, token_count = self._chat_completion(
+            messages,
+            temperature=0.6,
+            max_tokens=budget.max_tokens,
+            use_cache=use_cache
+        )
+        return constitution_text
+    
+    def _generate_constitution_sections(self, system_prompt: str, requirements: dict, use_cache: bool) -> dict:
+        """
+        Generate every constitution section concurrently.
+        
+        All sections share one outline (the requirements plus the scope of each
+        section) so they stay consistent and do not overlap. Returns the text of
+        each section keyed by its StateConstitution field; any failed section
+        fails the whole generation.
+        """
+        parts = '\n'.join(
+            f"{index}. {title}: {scope}"
+            for index, (field, title, scope) in enumerate(CONSTITUTION_SECTIONS, start=1)
+        )
+        outline = f"""
+            Constitutional framework for a network state with the following requirements:
+            {self._constitution_requirements(requirements)}
+            The constitution is made up of these parts, each written separately:
+{parts}
+            """
+        
+        def write_section(section):
+            field, title, scope = section
+            prompt = f"""
+            {outline}
             
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.6,
-                max_tokens=3000
-            )
-            
-            constitution_text = response.choices[0].message.content
-            
-            # Parse the constitution into sections
-            constitution_data = self._parse_constitution(constitution_text)
-            
-            # Create or update constitution record
-            constitution, created = StateConstitution.objects.get_or_create(
-                user=user,
-                defaults={
-                    'name': requirements.get('name', 'The Network State'),
-                    'preamble': constitution_data.get('preamble', ''),
-                    'fundamental_rights': constitution_data.get('rights', ''),
-                    'governmental_structure': constitution_data.get('structure', ''),
-                    'amendment_process': constitution_data.get('amendments', ''),
-                    'is_ai_assisted': True,
-                    'ai_generation_notes': f"Generated with {self.model} based on user values and requirements"
-                }
+            Write only the {title} part, covering {scope}. Leave the other parts
+            out. Start with the heading "{title}" and format it as constitutional
+            text with articles and sections.
+            """
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+            budget = plan_completion(messages, 'constitution_section', self.model)
+            text, token_count = self._chat_completion(
+                messages, temperature=0.6, max_tokens=budget.max_tokens, use_cache=use_cache
             )
-            
-            if not created:
-                # Update existing constitution
-                constitution.name = requirements.get('name', constitution.name)
-                constitution.preamble = constitution_data.get('preamble', constitution.preamble)
-                constitution.fundamental_rights = constitution_data.get('rights', constitution.fundamental_rights)
-                constitution.governmental_structure = constitution_data.get('structure', constitution.governmental_structure)
-                constitution.amendment_process = constitution_data.get('amendments', constitution.amendment_process)
-                constitution.is_ai_assisted = True
-                constitution.ai_generation_notes = f"Updated with {self.model} on {time.strftime('%Y-%m-%d')}"
-                constitution.save()
-            
-            # Deduct credits
-            self._use_credits(user, 50, f"Constitution generation: {constitution.name}")
-            
-            return {
-                'success': True,
-                'constitution': constitution,
-                'raw_text': constitution_text
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return field, text.strip()
+        
+        # One thread per section, so the latency is that of the slowest section
+        with ThreadPoolExecutor(max_workers=len(CONSTITUTION_SECTIONS)) as executor:
+            return dict(executor.map(write_section, CONSTITUTION_SECTIONS))
     
-    def _check_credits(self, user: User, required_credits: int) -> bool:
-        """Check if user has sufficient credits"""
+    def _reserve_credits(self, user: User, credits: int, description: str):
+        """Hold credits for work that is about to start; None if the user does not have them"""
         try:
-            subscription = UserSubscription.objects.get(user=user)
-            return subscription.credits_remaining >= required_credits
-        except UserSubscription.DoesNotExist:
-            return False
+            return reserve_credits(user, credits, description)
+        except InsufficientCredits:
+            return None
     
     def _use_credits(self, user: User, credits: int, description: str) -> bool:
         """Deduct credits from user's account"""
-        try:
-            subscription = UserSubscription.objects.get(user=user)
-            return subscription.use_credits(credits, description)
-        except UserSubscription.DoesNotExist:
-            return False
+        return charge_credits(user, credits, description)
+    
+    def _refund_credits(self, user: User, credits: int, description: str) -> bool:
+        """Return credits to user's account"""
+        return refund_credits(user, credits, description)
     
     def _parse_constitution(self, text: str) -> dict:
         """Parse constitution text into structured sections"""
@@ -361,7 +833,7 @@ def get_user_law_stats(user: User) -> dict:
         'implemented_laws': GeneratedLaw.objects.filter(user=user, is_implemented=True).count(),
         'total_requests': LawGenerationRequest.objects.filter(user=user).count(),
         'successful_requests': LawGenerationRequest.objects.filter(user=user, success=True).count(),
-        'total_searches': LawSearch.objects.filter(user=user).count(),
+        'total_searches': total_searches(user),
     }
     
     # Calculate success rate
@@ -370,4 +842,133 @@ def get_user_law_stats(user: User) -> dict:
     else:
         stats['success_rate'] = 0
     
-    return stats 
\ No newline at end of file
+    return stats 
+
+
+def get_laws_by_ids(user: User, law_ids: list) -> list:
+    """Fetch a page of laws for listing by primary key, in the order of ``law_ids``"""
+    laws = (
+        GeneratedLaw.objects.filter(user=user)
+        .select_related('category')
+        .defer(*GeneratedLaw.LIST_DEFERRED_FIELDS)
+        .in_bulk(law_ids)
+    )
+    by_hex = {law_id.hex: law for law_id, law in laws.items()}
+    return [by_hex[law_id] for law_id in law_ids if law_id in by_hex]
+
+
+def get_tag_facets(user: User, filters: dict = None, limit: int = None) -> list:
+    """
+    Per-tag law counts for a user, most used first, in one grouped query over
+    the (user, tag) index. Filters narrow the counts like the library filters.
+    """
+    usage = LawTag.objects.filter(user=user)
+    if filters:
+        if filters.get('category'):
+            usage = usage.filter(law__category__name=filters['category'])
+        if filters.get('is_favorite'):
+            usage = usage.filter(law__is_favorite=True)
+        if filters.get('is_implemented'):
+            usage = usage.filter(law__is_implemented=True)
+
+    facets = (
+        usage.values('tag_id')
+        .annotate(name=models.F('tag__name'), count=models.Count('id'))
+        .values('name', 'count')
+        .order_by('-count', 'name')
+    )
+    if limit:
+        facets = facets[:limit]
+    return list(facets)
+
+
+# Background generation jobs
+def enqueue_generation_job(user: User, job_type: str, params: dict,
+                           category: LawCategory = None) -> GenerationJob:
+    """Record a generation job and hand it to the worker pool"""
+    from .tasks import run_generation_job
+    
+    job = GenerationJob.objects.create(
+        user=user,
+        job_type=job_type,
+        params=params,
+        category=category
+    )
+    # Only publish once the job row is visible to the worker
+    transaction.on_commit(lambda: run_generation_job.delay(str(job.id)))
+    return job
+
+
+def execute_generation_job(job_id) -> GenerationJob:
+    """Run a queued generation job and store its outcome"""
+    # Claim the job atomically so a redelivered message cannot run it twice
+    claimed = GenerationJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    
+    job = GenerationJob.objects.select_related('user', 'category').get(id=job_id)
+    ai_service = PoliticalGodAI()
+    params = job.params
+    
+    try:
+        if job.job_type == 'law':
+            result = ai_service.generate_law(
+                user=job.user,
+                prompt=params['prompt'],
+                category=job.category,
+                use_cache=params.get('use_cache', True)
+            )
+            if result['success']:
+                job.generated_law = result['law']
+                job.result = {
+                    'law_id': str(result['law'].id),
+                    'title': result['law'].title,
+                    'summary': result['law'].summary,
+                    'request_id': str(result['request_id']),
+                    'response_time': result['response_time'],
+                    'tokens_used': result['tokens_used']
+                }
+        elif job.job_type == 'law_batch':
+            categories = LawCategory.objects.in_bulk(
+                [item['category_id'] for item in params['items'] if item.get('category_id')]
+            )
+            items = [
+                {'prompt': item['prompt'], 'category': categories.get(item.get('category_id'))}
+                for item in params['items']
+            ]
+            result = ai_service.generate_laws_batch(
+                job.user, items,
+                max_concurrency=params.get('max_concurrency'),
+                use_cache=params.get('use_cache', True)
+            )
+            if result.get('results'):
+                job.result = {
+                    'laws': [
+                        {'law_id': str(r['law'].id), 'title': r['law'].title}
+                        if r['success'] else {'prompt': r['prompt'], 'error': r['error']}
+                        for r in result['results']
+                    ],
+                    'credits_used': result['credits_used'],
+                    'credits_refunded': result['credits_refunded'],
+                    'response_time': result['response_time']
+                }
+        elif job.job_type == 'constitution':
+            result = ai_service.generate_constitution(
+                job.user, params.get('requirements', {}),
+                use_cache=params.get('use_cache', True),
+                parallel_sections=params.get('parallel_sections')
+            )
+            if result['success']:
+                job.result = {'name': result['constitution'].name}
+        else:
+            result = {'success': False, 'error': f"Unknown job type: {job.job_type}"}
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    
+    job.status = 'succeeded' if result['success'] else 'failed'
+    job.error_message = '' if result['success'] else result.get('error', '')
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'generated_law', 'result', 'error_message', 'finished_at'])
+    return job
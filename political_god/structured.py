@@ -0,0 +1,248 @@
+"""
+Structured law replies.
+
+``LAW_SCHEMA`` is sent to the provider so replies come back as a single JSON
+object. ``LawStreamParser`` reads that object incrementally: each top-level
+field is available as soon as its value closes, and string fields can be
+streamed out as decoded text while they are still being written.
+"""
+import json
+import re
+import time
+
+
+LAW_SCHEMA = {
+    'name': 'generated_law',
+    'schema': {
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string', 'description': "Short, descriptive title for the law"},
+            'summary': {'type': 'string', 'description': "Brief 2-3 sentence summary of the law's purpose and scope"},
+            'tags': {'type': 'array', 'items': {'type': 'string'}},
+            'category_suggestion': {'type': 'string'},
+            'content': {
+                'type': 'string',
+                'description': "Full detailed law text with specific articles, sections, and enforcement mechanisms"
+            },
+        },
+        # Title and summary first so they can be shown before the body is finished
+        'required': ['title', 'summary', 'tags', 'category_suggestion', 'content'],
+        'additionalProperties': False,
+    },
+}
+
+# Characters that end a fast scan through string contents
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = ' \t\r\n'
+_HIGH_SURROGATES = ('d8', 'd9', 'da', 'db')
+
+
+class LawStreamParser:
+    """
+    Incremental parser for the top-level JSON object of a law reply.
+
+    ``feed`` returns a list of events:
+
+    * ``('field', name, value)`` once a top-level value is complete
+    * ``('delta', name, text)`` with decoded text of a string field listed in
+      ``stream_fields`` while it is still being written
+
+    Text before the opening brace (e.g. a Markdown code fence) is skipped.
+    """
+
+    def __init__(self, stream_fields=('content',)):
+        self.stream_fields = set(stream_fields)
+        self.result = {}
+        self._buf = ''
+        self._pos = 0
+        self._state = 'start'
+        self._key = None
+        self._value_start = None
+        self._depth = 0
+        self._in_string = False
+        self._emitted = None
+        self.failed = False
+        self.parse_seconds = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, text: str) -> list:
+        """
+        Add the next chunk of the reply and return the events it completes.
+        Raises ValueError (and sets ``failed``) when the reply is not valid JSON.
+        """
+        started = time.perf_counter()
+        self._buf += text
+        events = []
+        try:
+            while self._state != 'done' and self._pos < len(self._buf):
+                if not self._step(events):
+                    break
+        except ValueError:
+            self.failed = True
+            raise
+        finally:
+            self.parse_seconds += time.perf_counter() - started
+        return events
+
+    def close(self) -> dict:
+        """Return the parsed object, raising ValueError if the reply was incomplete"""
+        if self._state != 'done':
+            raise ValueError(f"Incomplete JSON object (stopped in state '{self._state}')")
+        return self.result
+
+    def _step(self, events) -> bool:
+        """Advance through the buffer; return False when more input is needed"""
+        buf = self._buf
+        state = self._state
+
+        if state == 'start':
+            brace = buf.find('{', self._pos)
+            if brace == -1:
+                self._pos = len(buf)
+                return False
+            self._pos = brace + 1
+            self._state = 'key'
+            return True
+
+        if state in ('key', 'colon', 'value', 'after_value'):
+            self._skip_whitespace()
+            if self._pos >= len(buf):
+                return False
+            char = buf[self._pos]
+
+            if state == 'key':
+                if char == '}':
+                    self._pos += 1
+                    self._state = 'done'
+                    return True
+                if char == ',':
+                    self._pos += 1
+                    return True
+                if char != '"':
+                    raise ValueError(f"Expected a key at offset {self._pos}")
+                end = self._find_string_end(self._pos + 1)
+                if end is None:
+                    return False
+                self._key = json.loads(buf[self._pos:end])
+                self._pos = end
+                self._state = 'colon'
+                return True
+
+            if state == 'colon':
+                if char != ':':
+                    raise ValueError(f"Expected ':' at offset {self._pos}")
+                self._pos += 1
+                self._state = 'value'
+                return True
+
+            if state == 'value':
+                self._value_start = self._pos
+                self._depth = 0
+                self._in_string = False
+                if char == '"':
+                    self._pos += 1
+                    self._in_string = True
+                    if self._key in self.stream_fields:
+                        self._emitted = self._pos
+                self._state = 'in_value'
+                return True
+
+            # after_value
+            if char == ',':
+                self._pos += 1
+                self._state = 'key'
+            elif char == '}':
+                self._pos += 1
+                self._state = 'done'
+            else:
+                raise ValueError(f"Expected ',' or '}}' at offset {self._pos}")
+            return True
+
+        # in_value
+        if self._in_string:
+            return self._scan_string(events)
+
+        char = buf[self._pos]
+        if char == '"':
+            self._in_string = True
+            self._pos += 1
+        elif char in '{[':
+            self._depth += 1
+            self._pos += 1
+        elif char in '}]' and self._depth > 0:
+            self._depth -= 1
+            self._pos += 1
+            if self._depth == 0:
+                self._finish_value(events)
+        elif self._depth == 0 and (char in ',}' or char in _WHITESPACE):
+            # End of a bare scalar (number, true, false, null)
+            self._finish_value(events)
+        else:
+            self._pos += 1
+        return True
+
+    def _scan_string(self, events) -> bool:
+        """Move through string contents, stopping at a safe boundary for escapes"""
+        buf = self._buf
+        match = _STRING_SPECIAL.search(buf, self._pos)
+
+        if match is None:
+            self._pos = len(buf)
+            self._emit_delta(events)
+            return False
+
+        if match.group() == '\\':
+            escape_length = 6 if buf[match.end():match.end() + 1] == 'u' else 2
+            if escape_length == 6 and buf[match.start() + 2:match.start() + 4].lower() in _HIGH_SURROGATES:
+                # Keep both halves of a surrogate pair in the same delta
+                escape_length = 12
+            if match.start() + escape_length > len(buf):
+                # Wait for the rest of the escape sequence
+                self._pos = match.start()
+                self._emit_delta(events)
+                return False
+            self._pos = match.start() + escape_length
+            return True
+
+        # Closing quote
+        self._pos = match.start()
+        self._emit_delta(events)
+        self._pos = match.end()
+        self._in_string = False
+        if self._depth == 0:
+            self._finish_value(events)
+        return True
+
+    def _emit_delta(self, events):
+        if self._emitted is None or self._depth != 0 or self._pos <= self._emitted:
+            return
+        raw = self._buf[self._emitted:self._pos]
+        self._emitted = self._pos
+        events.append(('delta', self._key, json.loads(f'"{raw}"')))
+
+    def _finish_value(self, events):
+        value = json.loads(self._buf[self._value_start:self._pos])
+        self.result[self._key] = value
+        events.append(('field', self._key, value))
+        self._emitted = None
+        self._state = 'after_value'
+
+    def _find_string_end(self, start: int):
+        """Index just past the closing quote of a string, or None if it has not arrived"""
+        pos = start
+        while True:
+            match = _STRING_SPECIAL.search(self._buf, pos)
+            if match is None:
+                return None
+            if match.group() == '"':
+                return match.end()
+            pos = match.end() + 1
+
+    def _skip_whitespace(self):
+        buf = self._buf
+        while self._pos < len(buf) and buf[self._pos] in _WHITESPACE:
+            self._pos += 1
+
@@ -0,0 +1,190 @@
+"""
+Typeahead suggestions for the law library.
+
+Each user's law titles and tags are held in a sorted list searched with
+bisect. Titles are entered once per word, so "tax" completes "Land Value Tax
+Act". The index is built on first use from titles and tags only (law bodies
+are never read), patched in place when the process saves or deletes one of
+the user's laws, and rebuilt when the user's search generation shows that
+another process (a Celery worker, say) wrote to their laws. The generation
+is read from the database, so those writes are seen whatever the cache
+backend. The least recently used indexes are evicted once
+LAW_SUGGEST_MAX_USERS are held.
+"""
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import GeneratedLaw, Tag
+from .search_cache import get_generation
+
+
+_WORDS = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    return ' '.join(_WORDS.findall(text.lower()))
+
+
+def title_keys(title: str) -> list:
+    """The title from each of its words onwards"""
+    words = normalize(title).split()
+    return [' '.join(words[start:]) for start in range(len(words))]
+
+
+class PrefixIndex:
+    """One user's titles and tags as sorted ``(key, value)`` lists"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.lock = threading.Lock()
+        self._title_entries = []
+        self._tag_entries = []
+        self._titles = {}
+        self._law_tags = {}
+        self._tag_counts = {}
+
+    def add_law(self, law_id, title: str, tags: str, _insert=insort):
+        self._titles[law_id] = title
+        for key in title_keys(title):
+            _insert(self._title_entries, (key, law_id))
+
+        names = Tag.parse(tags)
+        self._law_tags[law_id] = names
+        for name in names:
+            count = self._tag_counts.get(name, 0)
+            if count == 0:
+                _insert(self._tag_entries, (name,))
+            self._tag_counts[name] = count + 1
+
+    def build(self, rows):
+        """Add ``(law_id, title, tags)`` rows in bulk, sorting once at the end"""
+        for law_id, title, tags in rows:
+            self.add_law(law_id, title, tags, _insert=list.append)
+        self._title_entries.sort()
+        self._tag_entries.sort()
+
+    def remove_law(self, law_id):
+        title = self._titles.pop(law_id, None)
+        if title is None:
+            return
+        for key in title_keys(title):
+            _discard(self._title_entries, (key, law_id))
+
+        for name in self._law_tags.pop(law_id, []):
+            self._tag_counts[name] -= 1
+            if self._tag_counts[name] == 0:
+                del self._tag_counts[name]
+                _discard(self._tag_entries, (name,))
+
+    def complete(self, prefix: str, limit: int = 8) -> dict:
+        """Titles and tags with a word starting with ``prefix``"""
+        titles, seen = [], set()
+        for key, law_id in _scan(self._title_entries, prefix):
+            if law_id not in seen:
+                seen.add(law_id)
+                titles.append({'id': str(law_id), 'title': self._titles[law_id]})
+                if len(titles) == limit:
+                    break
+
+        tags = []
+        for (name,) in _scan(self._tag_entries, prefix):
+            tags.append({'name': name, 'count': self._tag_counts[name]})
+            if len(tags) == limit:
+                break
+        tags.sort(key=lambda tag: -tag['count'])
+        return {'titles': titles, 'tags': tags}
+
+
+def _scan(entries: list, prefix: str):
+    """Entries whose key starts with ``prefix``, in order"""
+    for position in range(bisect_left(entries, (prefix,)), len(entries)):
+        entry = entries[position]
+        if not entry[0].startswith(prefix):
+            return
+        yield entry
+
+
+def _discard(entries: list, entry):
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+class SuggestIndexCache:
+    """Thread-safe LRU of per-user prefix indexes"""
+
+    def __init__(self, max_users: int = 256):
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> PrefixIndex:
+        generation = get_generation(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.generation == generation:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        index = PrefixIndex(generation)
+        # Titles and tags only; the law body is never loaded
+        index.build(GeneratedLaw.objects.filter(user_id=user_id).values_list('id', 'title', 'tags'))
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def peek(self, user_id):
+        """The user's index if this process holds one, without building it"""
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+suggest_cache = SuggestIndexCache(settings.LAW_SUGGEST_MAX_USERS)
+
+
+def suggest(user_id, query: str, limit: int = 8) -> dict:
+    prefix = normalize(query)
+    if not prefix:
+        return {'titles': [], 'tags': []}
+    index = suggest_cache.get(user_id)
+    with index.lock:
+        return index.complete(prefix, limit)
+
+
+def _patch(instance, deleted: bool):
+    index = suggest_cache.peek(instance.user_id)
+    if index is None:
+        return
+    with index.lock:
+        index.remove_law(instance.pk)
+        if not deleted:
+            index.add_law(instance.pk, instance.title, instance.tags)
+        # Connected after the search cache receiver, which has just bumped the
+        # generation by one in this transaction; any other jump means a write
+        # by another process that this index missed
+        generation = get_generation(instance.user_id)
+        if generation == index.generation + 1:
+            index.generation = generation
+
+
+def update_suggestions_on_save(sender, instance, raw=False, **kwargs):
+    """post_save receiver: patch the user's index in place if this process holds one"""
+    if not raw:
+        _patch(instance, deleted=False)
+
+
+def update_suggestions_on_delete(sender, instance, **kwargs):
+    """post_delete receiver: drop the law from the user's index"""
+    _patch(instance, deleted=True)
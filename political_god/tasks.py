@@ -0,0 +1,17 @@
+from celery import shared_task
+
+from .rollups import prune_hourly_rollups, rollup_searches
+from .services import execute_generation_job
+
+
+@shared_task(ignore_result=True)
+def run_generation_job(job_id):
+    """Worker entry point for queued law and constitution generations"""
+    execute_generation_job(job_id)
+
+
+@shared_task(ignore_result=True)
+def rollup_search_analytics():
+    """Periodic (beat) entry point that folds new searches into the analytics rollups"""
+    rollup_searches()
+    prune_hourly_rollups()
@@ -1,3 +1,238 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import GeneratedLaw
+from .pagination import encode_cursor, paginate_ids, paginate_laws
+from .structured import LawStreamParser
+
+
+LAW_REPLY = {
+    'title': 'Digital Residency Act',
+    'summary': 'Residents may "log in" from anywhere.',
+    'tags': ['residency', 'digital rights'],
+    'category_suggestion': 'Civil Rights',
+    'content': 'Article 1. Café \\ "quoted" — 😀\nArticle 2. Done.',
+}
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events
+
+
+def streamed_text(events, name='content'):
+    return ''.join(event[2] for event in events if event[0] == 'delta' and event[1] == name)
+
+
+class LawStreamParserTests(SimpleTestCase):
+    reply = json.dumps(LAW_REPLY)
+
+    def test_whole_reply(self):
+        parser = LawStreamParser()
+        events = parser.feed(self.reply)
+
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.close(), LAW_REPLY)
+        self.assertEqual([event[1] for event in events if event[0] == 'field'], list(LAW_REPLY))
+        self.assertEqual(streamed_text(events), LAW_REPLY['content'])
+
+    def test_values_split_across_chunks(self):
+        for size in (1, 2, 3, 5, 7, 64):
+            with self.subTest(chunk_size=size):
+                parser = LawStreamParser()
+                events = feed_in_chunks(parser, self.reply, size)
+
+                self.assertEqual(parser.close(), LAW_REPLY)
+                self.assertEqual(streamed_text(events), LAW_REPLY['content'])
+
+    def test_every_split_point(self):
+        for split in range(1, len(self.reply)):
+            parser = LawStreamParser()
+            events = parser.feed(self.reply[:split]) + parser.feed(self.reply[split:])
+
+            self.assertEqual(parser.close(), LAW_REPLY, f'split at {split}')
+            self.assertEqual(streamed_text(events), LAW_REPLY['content'], f'split at {split}')
+
+    def test_escaped_quotes_and_backslashes(self):
+        parser = LawStreamParser()
+        events = feed_in_chunks(parser, r'{"title": "A \"quoted\" \\ title", "content": "say \"hi\"\\"}', 1)
+
+        self.assertEqual(parser.result['title'], 'A "quoted" \\ title')
+        self.assertEqual(streamed_text(events), 'say "hi"\\')
+
+    def test_unicode_escapes_are_never_split(self):
+        # ensure_ascii writes é as é and the emoji as a surrogate pair
+        reply = json.dumps({'content': 'é😀!'}, ensure_ascii=True)
+        self.assertIn('\\ud83d\\ude00', reply)
+
+        parser = LawStreamParser()
+        events = feed_in_chunks(parser, reply, 1)
+        deltas = [event[2] for event in events if event[0] == 'delta']
+
+        self.assertEqual(''.join(deltas), 'é😀!')
+        for delta in deltas:
+            delta.encode('utf-8')  # a lone surrogate would not encode
+
+    def test_text_before_the_object_is_skipped(self):
+        parser = LawStreamParser()
+        parser.feed('```json\n')
+        parser.feed(self.reply)
+
+        self.assertEqual(parser.close(), LAW_REPLY)
+
+    def test_non_string_values(self):
+        parser = LawStreamParser()
+        events = parser.feed('{"count": 12 , "flag": true, "nested": {"a": [1, "]"]}, "none": null}')
+
+        self.assertEqual(parser.close(), {'count': 12, 'flag': True, 'nested': {'a': [1, ']']}, 'none': None})
+        self.assertEqual([event[1] for event in events], ['count', 'flag', 'nested', 'none'])
+
+    def test_truncated_reply(self):
+        for cut in (0, 1, self.reply.index('content'), len(self.reply) - 2, len(self.reply) - 1):
+            with self.subTest(cut=cut):
+                parser = LawStreamParser()
+                parser.feed(self.reply[:cut])
+
+                self.assertFalse(parser.done)
+                self.assertFalse(parser.failed)
+                with self.assertRaises(ValueError):
+                    parser.close()
+
+    def test_truncated_inside_an_escape(self):
+        parser = LawStreamParser()
+        events = parser.feed('{"content": "abc\\u00')
+
+        self.assertEqual(streamed_text(events), 'abc')
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_invalid_reply(self):
+        parser = LawStreamParser()
+
+        with self.assertRaises(ValueError):
+            parser.feed('{"title" "missing colon"}')
+        self.assertTrue(parser.failed)
+
+
+class LawCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', password='password')
+        # bulk_create skips the embedding and fingerprint receivers
+        GeneratedLaw.objects.bulk_create([
+            GeneratedLaw(user=cls.user, title=f'Law {index}', content='Text', summary='Summary', prompt_used='Prompt')
+            for index in range(9)
+        ])
+        # Seven laws share one created_at, so only the id orders them
+        now = timezone.now()
+        laws = list(GeneratedLaw.objects.order_by('id'))
+        GeneratedLaw.objects.filter(pk__in=[law.pk for law in laws[:7]]).update(created_at=now)
+        GeneratedLaw.objects.filter(pk=laws[7].pk).update(created_at=now + timedelta(minutes=1))
+        GeneratedLaw.objects.filter(pk=laws[8].pk).update(created_at=now - timedelta(minutes=1))
+
+    def setUp(self):
+        self.laws = GeneratedLaw.objects.filter(user=self.user)
+        self.expected = list(self.laws.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def walk_forward(self, per_page):
+        pages, cursor = [], None
+        while True:
+            page = paginate_laws(self.laws, cursor, per_page=per_page)
+            pages.append([law.pk for law in page])
+            if not page.has_next:
+                return pages, page
+            cursor = page.next_cursor
+
+    def test_ties_on_created_at_are_neither_skipped_nor_repeated(self):
+        for per_page in (1, 2, 4, 5):
+            with self.subTest(per_page=per_page):
+                pages, last_page = self.walk_forward(per_page)
+
+                self.assertEqual([pk for page in pages for pk in page], self.expected)
+                self.assertTrue(all(len(page) == per_page for page in pages[:-1]))
+
+    def test_previous_cursors_walk_back_the_same_pages(self):
+        pages, page = self.walk_forward(2)
+
+        seen = [[law.pk for law in page]]
+        while page.has_previous:
+            page = paginate_laws(self.laws, page.previous_cursor, per_page=2)
+            seen.append([law.pk for law in page])
+
+        self.assertEqual(seen[::-1], pages)
+
+    def test_last_page(self):
+        # Nine laws in pages of three: the last page is full and has no next cursor
+        pages, last_page = self.walk_forward(3)
+
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(len(last_page), 3)
+        self.assertIsNone(last_page.next_cursor)
+        self.assertTrue(last_page.has_previous)
+
+    def test_first_page_has_no_previous_cursor(self):
+        page = paginate_laws(self.laws, per_page=12)
+
+        self.assertEqual([law.pk for law in page], self.expected)
+        self.assertFalse(page.has_other_pages)
+
+    def test_empty_list(self):
+        page = paginate_laws(self.laws.none(), per_page=3)
+
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_other_pages)
+
+    def test_invalid_cursors_start_from_the_first_page(self):
+        first_page = [law.pk for law in paginate_laws(self.laws, per_page=3)]
+        cursors = [
+            'garbage!',
+            'x',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            encode_cursor(['next']),
+            encode_cursor({'d': 'next'}),
+            encode_cursor({'d': 'next', 't': 'yesterday', 'id': 'abc'}),
+            encode_cursor({'d': 'next', 't': None, 'id': self.expected[0].hex}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                page = paginate_laws(self.laws, cursor, per_page=3)
+                self.assertEqual([law.pk for law in page], first_page)
+
+    def test_tampered_cursor_only_moves_within_the_queryset(self):
+        other = User.objects.create_user(username='bob', password='password')
+        GeneratedLaw.objects.bulk_create([GeneratedLaw(user=other, title='Other', content='Text', summary='Summary',
+                                                        prompt_used='Prompt')])
+        cursor = encode_cursor({'d': 'next', 't': (timezone.now() + timedelta(days=1)).isoformat(), 'id': 'f' * 32})
+
+        page = paginate_laws(self.laws, cursor, per_page=20)
+
+        self.assertEqual([law.pk for law in page], self.expected)
+
+    def test_id_offsets(self):
+        ids = [f'{index:032x}' for index in range(5)]
+
+        page = paginate_ids(ids, per_page=2)
+        self.assertEqual((page.object_list, page.has_previous), (ids[:2], False))
+        page = paginate_ids(ids, page.next_cursor, per_page=2)
+        page = paginate_ids(ids, page.next_cursor, per_page=2)
+        self.assertEqual((page.object_list, page.next_cursor), (ids[4:], None))
+
+        self.assertEqual(paginate_ids(ids, encode_cursor({'o': -4}), per_page=2).object_list, ids[:2])
+        self.assertEqual(paginate_ids(ids, encode_cursor({'o': 50}), per_page=2).object_list, [])
+        self.assertEqual(paginate_ids(ids, 'garbage!', per_page=2).object_list, ids[:2])
+
+    def test_library_view_ignores_a_garbage_cursor(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('political_god:law_library'), {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([law.pk for law in response.context['page_obj']], self.expected)
@@ -12,7 +12,10 @@ urlpatterns = [
     
     # Law generation
     path('generate/', views.generate_law, name='generate_law'),
+    path('generate/stream/', views.generate_law_stream, name='generate_law_stream'),
+    path('generate/batch/', views.batch_generate, name='batch_generate'),
     path('quick-generate/', views.quick_generate, name='quick_generate'),
+    path('job/<uuid:job_id>/', views.job_status, name='job_status'),
     
     # Law library and management
     path('library/', views.law_library, name='law_library'),
@@ -20,6 +23,11 @@ urlpatterns = [
     path('law/<uuid:law_id>/edit/', views.law_edit, name='law_edit'),
     path('law/<uuid:law_id>/delete/', views.law_delete, name='law_delete'),
     path('law/<uuid:law_id>/toggle-favorite/', views.toggle_favorite, name='toggle_favorite'),
+    path('law/<uuid:law_id>/toggle-publish/', views.toggle_publish, name='toggle_publish'),
+    
+    # Public law corpus
+    path('public/', views.public_laws, name='public_laws'),
+    path('public/<uuid:published_id>/fork/', views.fork_public_law, name='fork_public_law'),
     
     # Constitution
     path('constitution/', views.constitution, name='constitution'),
@@ -32,4 +40,10 @@ urlpatterns = [
     # API endpoints
     path('api/stats/', views.api_stats, name='api_stats'),
     path('api/recent-laws/', views.api_recent_laws, name='api_recent_laws'),
+    path('api/tags/facets/', views.api_tag_facets, name='api_tag_facets'),
+    path('api/suggest/', views.api_suggest, name='api_suggest'),
+    path('api/public/search/', views.api_public_search, name='api_public_search'),
+    path('api/jobs/<uuid:job_id>/', views.api_job_status, name='api_job_status'),
+    path('api/batch-generate/', views.api_batch_generate, name='api_batch_generate'),
+    path('api/metrics/', views.api_metrics, name='api_metrics'),
 ] 
\ No newline at end of file
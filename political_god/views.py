@@ -1,23 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db.models import Q
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, require_POST
+from asgiref.sync import sync_to_async
 import json
 from django.utils import timezone
+from django.conf import settings
 
 from .models import (
     UserValues, GeneratedLaw, LawCategory, LawGenerationRequest,
-    LawSearch, StateConstitution
+    LawSearch, StateConstitution, GenerationJob, Tag, PublishedLaw
 )
 from .forms import (
-    UserValuesForm, LawGenerationForm, LawSearchForm, LawEditForm,
-    ConstitutionForm, AIConstitutionForm
+    UserValuesForm, LawGenerationForm, BatchLawGenerationForm, LawSearchForm,
+    PublicLawSearchForm, LawEditForm, ConstitutionForm, AIConstitutionForm
 )
-from .services import PoliticalGodAI, get_user_law_stats
+from .services import (
+    PoliticalGodAI, get_user_law_stats, get_laws_by_ids, get_tag_facets, enqueue_generation_job,
+    response_cache
+)
+from .metrics import generation_metrics
+from .pagination import paginate_ids, paginate_laws
+from .dedup import duplicate_laws
+from .corpus import fork_law, publish_law, search_corpus, unpublish_law
+from .suggest import suggest
+from .search import attach_snippets
+from .search_cache import cached_count
+from .rollups import search_activity, search_summary, top_queries
 from billing.models import UserSubscription
+from billing.balance import get_balance
 
 
 def dashboard(request):
@@ -29,14 +44,10 @@ def dashboard(request):
     # For authenticated users, show dashboard
     context = {}
     
-    # Get user subscription info
-    try:
-        subscription = UserSubscription.objects.get(user=request.user)
-        context['subscription'] = subscription
-        context['credits_remaining'] = subscription.credits_remaining
-    except UserSubscription.DoesNotExist:
-        context['subscription'] = None
-        context['credits_remaining'] = 0
+    # Get user subscription info (cached; no queries)
+    balance = get_balance(request.user)
+    context['subscription'] = balance if balance.subscribed else None
+    context['credits_remaining'] = balance.credits_remaining
     
     # Get user values
     try:
@@ -91,42 +102,137 @@ def setup_values(request):
 @login_required
 def generate_law(request):
     """Generate a new law using AI"""
+    duplicates = []
     if request.method == 'POST':
         form = LawGenerationForm(request.POST)
-        if form.is_valid():
-            ai_service = PoliticalGodAI()
-            result = ai_service.generate_law(
+        if form.is_valid() and not form.cleaned_data.get('allow_duplicate'):
+            # Offer the laws the user already has before spending credits on another
+            duplicates = duplicate_laws(request.user, form.cleaned_data['prompt'])
+            if duplicates:
+                data = request.POST.copy()
+                data['allow_duplicate'] = 'on'
+                form = LawGenerationForm(data)
+        if form.is_valid() and not duplicates:
+            job = enqueue_generation_job(
                 user=request.user,
-                prompt=form.cleaned_data['prompt'],
+                job_type='law',
+                params={
+                    'prompt': form.cleaned_data['prompt'],
+                    'use_cache': not form.cleaned_data.get('bypass_cache')
+                },
                 category=form.cleaned_data.get('category')
             )
-            
-            if result['success']:
-                messages.success(request, f'🏛️ Law "{result["law"].title}" has been generated successfully!')
-                return redirect('political_god:law_detail', law_id=result['law'].id)
-            else:
-                messages.error(request, f'❌ Error generating law: {result["error"]}')
+            messages.info(request, '⏳ Your law is being generated. This page will update when it is ready.')
+            return redirect('political_god:job_status', job_id=job.id)
     else:
         form = LawGenerationForm()
     
     # Get user's credit balance
-    try:
-        subscription = UserSubscription.objects.get(user=request.user)
-        credits_remaining = subscription.credits_remaining
-    except UserSubscription.DoesNotExist:
-        credits_remaining = 0
+    credits_remaining = get_balance(request.user).credits_remaining
     
     return render(request, 'political_god/generate_law.html', {
+        'form': form,
+        'credits_remaining': credits_remaining,
+        'duplicates': duplicates
+    })
+
+
+@login_required
+def batch_generate(request):
+    """Generate several laws at once from a list of prompts"""
+    if request.method == 'POST':
+        form = BatchLawGenerationForm(request.POST)
+        if form.is_valid():
+            default_category = form.cleaned_data.get('category')
+            items = []
+            for item in form.cleaned_data['prompts']:
+                category = item['category'] or default_category
+                items.append({'prompt': item['prompt'], 'category_id': category.id if category else None})
+            
+            job = enqueue_generation_job(
+                user=request.user,
+                job_type='law_batch',
+                params={
+                    'items': items,
+                    'use_cache': not form.cleaned_data.get('bypass_cache')
+                }
+            )
+            messages.info(request, f'⏳ Generating {len(items)} laws. This page will update when they are ready.')
+            return redirect('political_god:job_status', job_id=job.id)
+    else:
+        form = BatchLawGenerationForm()
+    
+    # Get user's credit balance
+    credits_remaining = get_balance(request.user).credits_remaining
+    
+    return render(request, 'political_god/batch_generate.html', {
         'form': form,
         'credits_remaining': credits_remaining
     })
 
 
+@login_required
+@require_POST
+async def generate_law_stream(request):
+    """Stream a law generation to the browser as server-sent events"""
+    form = LawGenerationForm(request.POST)
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+    
+    user = await request.auser()
+    if not form.cleaned_data.get('allow_duplicate'):
+        duplicates = await sync_to_async(duplicate_laws)(user, form.cleaned_data['prompt'])
+        if duplicates:
+            return JsonResponse({
+                'success': False,
+                'duplicates': [{
+                    'id': str(law.id),
+                    'title': law.title,
+                    'similarity': round(law.similarity, 2),
+                    'url': reverse('political_god:law_detail', args=[law.id])
+                } for law in duplicates]
+            }, status=409)
+    
+    ai_service = PoliticalGodAI()
+    events = ai_service.stream_law(
+        user=user,
+        prompt=form.cleaned_data['prompt'],
+        category=form.cleaned_data.get('category'),
+        use_cache=not form.cleaned_data.get('bypass_cache')
+    )
+    
+    response = StreamingHttpResponse(_sse_stream(events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering for this response
+    return response
+
+
+async def _sse_stream(events):
+    """Encode ``(event, data)`` tuples as server-sent events"""
+    # Send an initial event straight away so the client sees the first byte
+    # before the model has produced any tokens
+    yield _sse_event('start', {})
+    async for event, data in events:
+        yield _sse_event(event, data)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @login_required
 def law_library(request):
     """Browse and search user's generated laws"""
     laws = GeneratedLaw.objects.filter(user=request.user)
     search_form = LawSearchForm(request.GET)
+    active_tag = Tag.normalize(request.GET.get('tag', ''))
+    
+    # Tag filtering is an index join and free, unlike a search
+    if active_tag:
+        laws = laws.filter(law_tags__tag__name=active_tag)
+    
+    law_ids = None
+    query = mode = None
     
     # Handle search
     if request.GET.get('search') and search_form.is_valid():
@@ -134,6 +240,7 @@ def law_library(request):
         category = search_form.cleaned_data.get('category')
         is_favorite = search_form.cleaned_data.get('is_favorite')
         is_implemented = search_form.cleaned_data.get('is_implemented')
+        mode = search_form.cleaned_data.get('mode') or 'keyword'
         
         # Use AI service for search (costs credits)
         ai_service = PoliticalGodAI()
@@ -144,27 +251,44 @@ def law_library(request):
             filters['is_favorite'] = True
         if is_implemented:
             filters['is_implemented'] = True
+        if active_tag:
+            filters['tags'] = [active_tag]
             
-        result = ai_service.search_laws(request.user, query or '', filters)
+        result = ai_service.search_laws(request.user, query or '', filters, mode=mode)
         
         if result['success']:
-            laws = result['results']
-            messages.info(request, f'🔍 Found {result["count"]} law(s) matching your search.')
+            law_ids = result['law_ids']
+            if not result['cached']:
+                messages.info(request, f'🔍 Found {result["count"]} law(s) matching your search.')
         else:
             messages.error(request, f'❌ Search error: {result["error"]}')
     
-    # Pagination
-    paginator = Paginator(laws, 12)  # 12 laws per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Cursor pagination: search results page through their cached ids, the
+    # library by keyset, so deep pages cost the same as the first
+    cursor = request.GET.get('cursor')
+    if law_ids is not None:
+        page_obj = paginate_ids(law_ids, cursor, per_page=12)
+        page_obj.object_list = get_laws_by_ids(request.user, page_obj.object_list)
+        # Keyword hits show where they matched instead of the summary
+        if query and mode == 'keyword':
+            attach_snippets(page_obj.object_list, query)
+    else:
+        laws = laws.select_related('category').defer(*GeneratedLaw.LIST_DEFERRED_FIELDS)
+        page_obj = paginate_laws(laws, cursor, per_page=12, total=cached_count(request.user.pk, laws))
     
     # Get categories for filter
     categories = LawCategory.objects.all()
     
+    # Page links keep the search and filters
+    page_query = request.GET.copy()
+    page_query.pop('cursor', None)
+    
     return render(request, 'political_god/law_library.html', {
         'page_obj': page_obj,
+        'page_query': page_query.urlencode(),
         'search_form': search_form,
-        'categories': categories
+        'categories': categories,
+        'active_tag': active_tag
     })
 
 
@@ -215,7 +339,7 @@ def toggle_favorite(request, law_id):
     if request.method == 'POST':
         law = get_object_or_404(GeneratedLaw, id=law_id, user=request.user)
         law.is_favorite = not law.is_favorite
-        law.save()
+        law.save(update_fields=['is_favorite', 'updated_at'])
         
         return JsonResponse({
             'success': True,
@@ -226,6 +350,52 @@ def toggle_favorite(request, law_id):
     return JsonResponse({'success': False})
 
 
+@login_required
+@require_POST
+def toggle_publish(request, law_id):
+    """Publish a law to the public corpus, or withdraw it (AJAX)"""
+    law = get_object_or_404(GeneratedLaw, id=law_id, user=request.user)
+    if law.is_published and request.POST.get('refresh') != '1':
+        unpublish_law(law)
+        message = '🔒 Law withdrawn from the public library.'
+    else:
+        publish_law(law)
+        message = '🌍 Law published! Everyone can now find and fork it.'
+    
+    return JsonResponse({
+        'success': True,
+        'is_published': law.is_published,
+        'message': message
+    })
+
+
+@login_required
+def public_laws(request):
+    """Search laws published by all users"""
+    form = PublicLawSearchForm(request.GET)
+    query = form.cleaned_data.get('q') if form.is_valid() else ''
+    if query:
+        laws = search_corpus(query, category=form.cleaned_data.get('category'))
+    else:
+        laws = PublishedLaw.objects.filter(is_active=True).select_related('author', 'category').defer('content')[:12]
+    
+    return render(request, 'political_god/public_laws.html', {
+        'form': form,
+        'query': query,
+        'laws': laws
+    })
+
+
+@login_required
+@require_POST
+def fork_public_law(request, published_id):
+    """Copy a published law into the user's library"""
+    published = get_object_or_404(PublishedLaw, id=published_id, is_active=True)
+    law = fork_law(request.user, published)
+    messages.success(request, f'🍴 Forked "{published.title}" into your library.')
+    return redirect('political_god:law_detail', law_id=law.id)
+
+
 @login_required
 def constitution(request):
     """View or create state constitution"""
@@ -262,7 +432,6 @@ def constitution_ai(request):
     if request.method == 'POST':
         form = AIConstitutionForm(request.POST)
         if form.is_valid():
-            ai_service = PoliticalGodAI()
             requirements = {
                 'name': form.cleaned_data['name'],
                 'population': form.cleaned_data.get('population', ''),
@@ -270,22 +439,22 @@ def constitution_ai(request):
                 'focus_areas': form.cleaned_data.get('focus_areas', '')
             }
             
-            result = ai_service.generate_constitution(request.user, requirements)
-            
-            if result['success']:
-                messages.success(request, f'🏛️ Constitution for "{result["constitution"].name}" has been generated!')
-                return redirect('political_god:constitution')
-            else:
-                messages.error(request, f'❌ Error generating constitution: {result["error"]}')
+            job = enqueue_generation_job(
+                user=request.user,
+                job_type='constitution',
+                params={
+                    'requirements': requirements,
+                    'use_cache': not form.cleaned_data.get('bypass_cache'),
+                    'parallel_sections': form.cleaned_data.get('parallel_sections')
+                }
+            )
+            messages.info(request, '⏳ Your constitution is being generated. This page will update when it is ready.')
+            return redirect('political_god:job_status', job_id=job.id)
     else:
         form = AIConstitutionForm()
     
     # Get user's credit balance
-    try:
-        subscription = UserSubscription.objects.get(user=request.user)
-        credits_remaining = subscription.credits_remaining
-    except UserSubscription.DoesNotExist:
-        credits_remaining = 0
+    credits_remaining = get_balance(request.user).credits_remaining
     
     return render(request, 'political_god/constitution_ai.html', {
         'form': form,
@@ -293,6 +462,13 @@ def constitution_ai(request):
     })
 
 
+@login_required
+def job_status(request, job_id):
+    """Waiting page for a queued generation job"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return render(request, 'political_god/job_status.html', {'job': job})
+
+
 @login_required
 def analytics(request):
     """User analytics and usage statistics"""
@@ -315,12 +491,17 @@ def analytics(request):
             category_name = law.category.name
             category_stats[category_name] = category_stats.get(category_name, 0) + 1
     
+    # Search trends come from the rollups, never from scanning the search log
     return render(request, 'political_god/analytics.html', {
         'stats': stats,
         'subscription': subscription,
         'recent_requests': recent_requests,
         'recent_searches': recent_searches,
-        'category_stats': category_stats
+        'category_stats': category_stats,
+        'search_summary': search_summary(request.user),
+        'search_activity': search_activity(request.user),
+        'top_queries': top_queries(request.user),
+        'zero_result_queries': top_queries(request.user, zero_results=True)
     })
 
 
@@ -330,22 +511,18 @@ def quick_generate(request):
     if request.method == 'POST':
         prompt = request.POST.get('prompt', '').strip()
         if prompt:
-            ai_service = PoliticalGodAI()
-            result = ai_service.generate_law(user=request.user, prompt=prompt)
-            
-            if result['success']:
-                return JsonResponse({
-                    'success': True,
-                    'law_id': str(result['law'].id),
-                    'title': result['law'].title,
-                    'summary': result['law'].summary,
-                    'redirect_url': f'/political-god/law/{result["law"].id}/'
-                })
-            else:
-                return JsonResponse({
-                    'success': False,
-                    'error': result['error']
-                })
+            job = enqueue_generation_job(
+                user=request.user,
+                job_type='law',
+                params={'prompt': prompt, 'use_cache': True}
+            )
+            # The waiting page follows the job and moves on to the law when it is ready
+            return JsonResponse({
+                'success': True,
+                'job_id': str(job.id),
+                'status_url': reverse('political_god:api_job_status', args=[job.id]),
+                'redirect_url': reverse('political_god:job_status', args=[job.id])
+            }, status=202)
     
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
@@ -388,11 +565,7 @@ def api_stats(request):
     """API endpoint for user statistics"""
     stats = get_user_law_stats(request.user)
     
-    try:
-        subscription = UserSubscription.objects.get(user=request.user)
-        credits_remaining = subscription.credits_remaining
-    except UserSubscription.DoesNotExist:
-        credits_remaining = 0
+    credits_remaining = get_balance(request.user).credits_remaining
     
     return JsonResponse({
         'stats': stats,
@@ -403,11 +576,17 @@ def api_stats(request):
 @login_required
 @require_http_methods(["GET"])
 def api_recent_laws(request):
-    """API endpoint for recent laws"""
-    laws = GeneratedLaw.objects.filter(user=request.user).order_by('-created_at')[:10]
+    """API endpoint for recent laws, paged with ``?cursor=`` from ``next_cursor``"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    laws = GeneratedLaw.objects.filter(user=request.user).select_related('category')
+    laws = laws.defer(*GeneratedLaw.LIST_DEFERRED_FIELDS)
+    page = paginate_laws(laws, request.GET.get('cursor'), per_page=limit)
     
     laws_data = []
-    for law in laws:
+    for law in page:
         laws_data.append({
             'id': str(law.id),
             'title': law.title,
@@ -418,4 +597,154 @@ def api_recent_laws(request):
             'created_at': law.created_at.isoformat()
         })
     
-    return JsonResponse({'laws': laws_data})
+    return JsonResponse({
+        'laws': laws_data,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_suggest(request):
+    """API endpoint for free title and tag completions as the user types"""
+    suggestions = suggest(request.user.pk, request.GET.get('q', '')[:100])
+    for item in suggestions['titles']:
+        item['url'] = reverse('political_god:law_detail', args=[item['id']])
+    return JsonResponse(suggestions)
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_public_search(request):
+    """API endpoint for searching the public law corpus"""
+    form = PublicLawSearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        limit = 20
+    
+    results = search_corpus(form.cleaned_data.get('q') or '', category=form.cleaned_data.get('category'),
+                            limit=limit)
+    return JsonResponse({
+        'results': [{
+            'id': str(law.id),
+            'title': law.title,
+            'summary': law.summary,
+            'snippet': law.snippet,
+            'author': law.author.username,
+            'category': law.category.name if law.category else None,
+            'fork_count': law.fork_count,
+            'score': round(law.score, 3),
+            'published_at': law.published_at.isoformat()
+        } for law in results]
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_tag_facets(request):
+    """API endpoint for per-tag law counts, narrowed by the library filters"""
+    filters = {}
+    search_form = LawSearchForm(request.GET)
+    if search_form.is_valid():
+        category = search_form.cleaned_data.get('category')
+        filters = {
+            'category': category.name if category else None,
+            'is_favorite': search_form.cleaned_data.get('is_favorite'),
+            'is_implemented': search_form.cleaned_data.get('is_implemented'),
+        }
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+    except ValueError:
+        limit = 50
+    
+    return JsonResponse({'tags': get_tag_facets(request.user, filters, limit=limit)})
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_job_status(request, job_id):
+    """API endpoint for polling a generation job"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    
+    redirect_url = None
+    if job.status == 'succeeded':
+        if job.job_type == 'law' and job.result.get('law_id'):
+            redirect_url = reverse('political_god:law_detail', args=[job.result['law_id']])
+        elif job.job_type == 'law_batch':
+            redirect_url = reverse('political_god:law_library')
+        elif job.job_type == 'constitution':
+            redirect_url = reverse('political_god:constitution')
+    
+    return JsonResponse({
+        'id': str(job.id),
+        'type': job.job_type,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error_message,
+        'redirect_url': redirect_url,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    })
+
+
+@login_required
+@require_POST
+def api_batch_generate(request):
+    """
+    API endpoint for batch law generation.
+    
+    Expects ``{"items": [{"prompt": "...", "category": "Economic"}, ...],
+    "max_concurrency": 4}`` and returns the id of the queued job.
+    """
+    try:
+        data = json.loads(request.body)
+        raw_items = data['items']
+        categories = {category.name.lower(): category for category in LawCategory.objects.all()}
+        
+        items = []
+        for raw_item in raw_items:
+            prompt = str(raw_item.get('prompt', '')).strip()
+            if not prompt:
+                continue
+            category = categories.get(str(raw_item.get('category') or '').lower())
+            items.append({'prompt': prompt, 'category_id': category.id if category else None})
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+    
+    max_batch_size = getattr(settings, 'LAW_BATCH_MAX_SIZE', 25)
+    if not items or len(items) > max_batch_size:
+        return JsonResponse({
+            'success': False,
+            'error': f'Provide between 1 and {max_batch_size} prompts.'
+        }, status=400)
+    
+    job = enqueue_generation_job(
+        user=request.user,
+        job_type='law_batch',
+        params={
+            'items': items,
+            'max_concurrency': data.get('max_concurrency'),
+            'use_cache': data.get('use_cache', True)
+        }
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'job_id': str(job.id),
+        'status_url': reverse('political_god:api_job_status', args=[job.id])
+    }, status=202)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def api_metrics(request):
+    """API endpoint for this process's generation and cache metrics (staff only)"""
+    return JsonResponse({
+        'generation': generation_metrics.snapshot(),
+        'response_cache': response_cache.stats()
+    })